@@ -29,75 +29,875 @@
 '''Python racktables API. 
 
 This started as a fork of Robert Vojcik's API but has evolved into a complete rewrite. 
-
-For proper function, some methods need ipaddr module (https://pypi.python.org/pypi/ipaddr)
 '''
 __author__ = "Stefan Midjich (swehack@gmail.com)"
 __version__ = "0.20.8"
 __copyright__ = "OpenSource"
 __license__ = "GPLv2"
 
-__all__ = ["Racktables"]
+__all__ = [
+    "Racktables", "IdentityMap", "ConnectionPool", "LogBuffer", 
+    "MetadataCache", "LazyLoader", "IPIndex", "CablingGraph", 
+    "LocationTree", "RackSpaceIndex", "TagIndex", "ContainerGraph", 
+    "ChangeTracker", "QueryStats", "ObjectRecord", "TagRecord", 
+    "InterfaceRecord", "IPv4AllocationRecord", "IPv4NetworkRecord", 
+    "LocationRecord", "RackRecord"
+]
 
 import re
-import ipaddr
+import sys
+import time
+import weakref
+import datetime
+import threading
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+from .ipindex import IPIndex, ipv4_to_int, int_to_ipv4, ipv6_to_int, \
+    binary_to_int, format_address
+from .cabling import CablingGraph
+from .hierarchy import LocationTree
+from .rackspace import RackSpaceIndex
+from .tags import TagIndex
+from .containers import ContainerGraph
+from .changes import ChangeTracker
+from .instrument import QueryStats
+
+try:
+    string_types = (str, unicode)
+except NameError:
+    string_types = (str,)
+
+try:
+    from queue import Queue, Empty
+except ImportError:
+    from Queue import Queue, Empty
+
+class ConnectionPool(object):
+    '''Thread safe pool of DB-API connections. 
+
+    connect is a callable returning a new connection, for example 
+    functools.partial(MySQLdb.connect, host=..., db='racktables'). At most 
+    size connections are opened, and they are opened on first use. Pass the 
+    pool to Racktables instead of a connection to share one API instance 
+    between threads.'''
+
+    def __init__(self, connect, size=5, timeout=None):
+        self.connect = connect
+        self.size = size
+        self.timeout = timeout
+        self._idle = Queue()
+        self._opened = 0
+        self._lock = threading.Lock()
+
+    def get(self):
+        '''Check out a connection, blocking until one is free'''
+        try:
+            return self._idle.get_nowait()
+        except Empty:
+            pass
+        with self._lock:
+            if self._opened < self.size:
+                self._opened += 1
+                open_new = True
+            else:
+                open_new = False
+        if open_new:
+            try:
+                return self.connect()
+            except:
+                with self._lock:
+                    self._opened -= 1
+                raise
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except Empty:
+            raise RuntimeError('Timed out waiting for a database connection')
+
+    def put(self, conn):
+        '''Return a connection to the pool'''
+        self._idle.put(conn)
+
+    def close(self):
+        '''Close all idle connections'''
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except Empty:
+                break
+            with self._lock:
+                self._opened -= 1
+            conn.close()
+
+class IdentityMap(object):
+    '''Bounded LRU map of loaded entities keyed by (entity type, id). 
+
+    Pass an instance to Racktables to have the same entity instance returned 
+    every time an id is looked up again, instead of querying the database. 
+    Entries are evicted least recently used first once size is reached.'''
+
+    def __init__(self, size=10000):
+        self.size = size
+        self._entities = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entities)
+
+    def __contains__(self, key):
+        return key in self._entities
+
+    def get(self, entity_class, entity_id):
+        '''Return cached entity or None'''
+        key = (entity_class.__name__, entity_id)
+        with self._lock:
+            entity = self._entities.pop(key, None)
+            if entity is not None:
+                self._entities[key] = entity
+            return entity
+
+    def add(self, entity):
+        '''Add or replace entity in map'''
+        key = (entity.__class__.__name__, entity._id)
+        with self._lock:
+            self._entities.pop(key, None)
+            self._entities[key] = entity
+            while len(self._entities) > self.size:
+                self._entities.popitem(last=False)
+
+    def invalidate(self, entity_class, entity_id=None):
+        '''Evict one entity, or all entities of entity_class if entity_id 
+        is None'''
+        name = entity_class.__name__
+        with self._lock:
+            if entity_id is not None:
+                self._entities.pop((name, entity_id), None)
+                return
+            for key in list(self._entities):
+                if key[0] == name:
+                    del self._entities[key]
+
+    def clear(self):
+        with self._lock:
+            self._entities.clear()
+
+class LogBuffer(object):
+    '''Collects ObjectLog entries in memory and writes them with one 
+    executemany when size entries are buffered, or on flush() and close(). 
+
+    Each entry keeps the time it was added, not the time it was written.'''
+
+    sql = '''INSERT INTO ObjectLog (object_id,user,date,content) 
+    VALUES (%s,%s,%s,%s)'''
+
+    def __init__(self, rt, size=1000, user='script'):
+        self.rt = rt
+        self.size = size
+        self.user = user
+        self._entries = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _now(self):
+        # ObjectLog.date is a datetime column without fractions
+        return datetime.datetime.now().replace(microsecond=0)
+
+    def add(self, object_id, message):
+        '''Buffer a log message for object_id'''
+        with self._lock:
+            self._entries.append(
+                (object_id, self.user, self._now(), message)
+            )
+            full = len(self._entries) >= self.size
+        if full:
+            self.flush()
+
+    def flush(self):
+        '''Write all buffered entries'''
+        with self._lock:
+            entries, self._entries = self._entries, []
+        if entries:
+            self.rt.db_insert_many(self.sql, entries)
+
+    def close(self):
+        self.flush()
+
+class _MetadataTables(object):
+    '''Loaded contents of a MetadataCache, shared by every cache on the 
+    same connection or pool'''
+
+    def __init__(self):
+        self.loaded_at = None
+        self.lock = threading.Lock()
+
+class MetadataCache(object):
+    '''In memory copy of the small, static schema tables Attribute, 
+    Chapter, Dictionary and PortOuterInterface. 
+
+    Tables are loaded on first use and again when they are older than ttl 
+    seconds, or on refresh(). Loads run through rt, so inside 
+    rt.transaction() they use the connection of the transaction. Caches 
+    given the same tables share what either one loads.'''
+
+    def __init__(self, rt, ttl=3600, tables=None):
+        self.rt = rt
+        self.ttl = ttl
+        if tables is None:
+            tables = _MetadataTables()
+        self._tables = tables
+
+    def refresh(self):
+        '''Reload all tables'''
+        attributes = {}
+        attribute_ids = {}
+        for attr_id, attr_type, name in self.rt.db_query_all(
+            'select id, type, name from Attribute'
+        ):
+            attributes[attr_id] = (attr_type, name)
+            attribute_ids[name] = attr_id
+
+        chapters = {}
+        chapter_ids = {}
+        for chapter_id, name in self.rt.db_query_all(
+            'select id, name from Chapter'
+        ):
+            chapter_ids[name] = chapter_id
+            chapters[chapter_id] = {}
+
+        dictionary = {}
+        for dict_key, chapter_id, dict_value in self.rt.db_query_all(
+            'select dict_key, chapter_id, dict_value from Dictionary'
+        ):
+            dictionary[dict_key] = dict_value
+            chapters.setdefault(chapter_id, {})[dict_key] = dict_value
+
+        port_outer_interfaces = dict(self.rt.db_query_all(
+            'select id, oif_name from PortOuterInterface'
+        ))
+
+        tables = self._tables
+        with tables.lock:
+            tables.attributes = attributes
+            tables.attribute_ids = attribute_ids
+            tables.chapters = chapters
+            tables.chapter_ids = chapter_ids
+            tables.dictionary = dictionary
+            tables.port_outer_interfaces = port_outer_interfaces
+            tables.loaded_at = time.time()
+
+    def _check(self):
+        '''Return the loaded tables, loading them first when needed'''
+        tables = self._tables
+        loaded_at = tables.loaded_at
+        if loaded_at is None or (
+            self.ttl is not None and time.time() - loaded_at > self.ttl
+        ):
+            self.refresh()
+        return tables
+
+    def attributes(self):
+        '''Return dict of attribute id: (type, name)'''
+        return self._check().attributes
+
+    def attribute(self, attr_id):
+        '''Return (type, name) of attribute or None'''
+        return self._check().attributes.get(attr_id)
+
+    def attribute_id(self, name):
+        '''Return id of attribute by exact name or None'''
+        return self._check().attribute_ids.get(name)
+
+    def chapter_id(self, name):
+        return self._check().chapter_ids.get(name)
+
+    def chapter(self, name):
+        '''Return dict of dict_key: dict_value for a chapter name, None if 
+        there is no such chapter'''
+        tables = self._check()
+        chapter_id = tables.chapter_ids.get(name)
+        if chapter_id is None:
+            return None
+        return tables.chapters.get(chapter_id, {})
+
+    def dictionary_value(self, dict_key):
+        return self._check().dictionary.get(dict_key)
+
+    def port_outer_interface(self, oif_id):
+        '''Return name of outer interface type or None'''
+        return self._check().port_outer_interfaces.get(oif_id)
+
+    def search(self, table, searchstring):
+        '''Return the lowest id in table (attribute or dictionary) whose 
+        name contains searchstring, case insensitive like MySQL LIKE'''
+        tables = self._check()
+        if table == 'attribute':
+            items = [
+                (attr_id, name) for attr_id, (attr_type, name) in 
+                tables.attributes.items()
+            ]
+        else:
+            items = tables.dictionary.items()
+        searchstring = searchstring.lower()
+        for item_id, name in sorted(items):
+            if name is not None and searchstring in name.lower():
+                return item_id
+        return None
+
+class LazyLoader(object):
+    '''Loads lazy entities in batches. 
+
+    A lazy entity only holds its id until one of its fields is read. Then 
+    every pending entity of the same class is loaded with one IN (...) 
+    query, so following LinkedObjects() or IPv4Allocation.Object() for 
+    many entities costs one query instead of one per entity. 
+
+    Pending entities are held by weak reference, those dropped before 
+    anything loads are forgotten instead of loaded.'''
+
+    def __init__(self, rt):
+        self.rt = rt
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def add(self, entity_class, entity_id):
+        '''Return a new unloaded entity_class instance for entity_id'''
+        entity = entity_class.__new__(entity_class)
+        entity.__dict__.update(_id=entity_id, rt=self.rt, _loader=self)
+        with self._lock:
+            pending = self._pending.get(entity_class)
+            if pending is None:
+                pending = self._pending[entity_class] = weakref.WeakSet()
+            pending.add(entity)
+        return entity
+
+    def load(self, entity):
+        '''Load entity and all other pending entities of its class'''
+        entity_class = entity.__class__
+        with self._lock:
+            pending = list(self._pending.pop(entity_class, ()))
+        if entity not in pending:
+            pending.append(entity)
+        sql = 'select %s from %s where id in (%%s)' % (
+            entity_class._columns, 
+            entity_class._table
+        )
+        rows = dict(
+            (row[0], row) for row in self.rt.db_query_chunked(
+                sql, 
+                set(pending_entity._id for pending_entity in pending)
+            )
+        )
+        for pending_entity in pending:
+            if '_loader' not in pending_entity.__dict__:
+                continue
+            row = rows.get(pending_entity._id)
+            if row is None:
+                pending_entity.__dict__['_loader'] = None
+                continue
+            del pending_entity.__dict__['_loader']
+            pending_entity.__init__(self.rt, pending_entity._id, row)
+        if '_loader' in entity.__dict__:
+            raise ValueError('%s %s not found' % (
+                entity_class.__name__, 
+                entity._id
+            ))
+
+# How IPv4 and IPv6 allocations are stored: table, address to int, stored 
+# value to int, SQL placeholder, int to stored value and name in logs
+_AllocationFormat = namedtuple(
+    '_AllocationFormat', 
+    'table to_int from_db placeholder to_db log_name'
+)
+_allocation_formats = {
+    4: _AllocationFormat(
+        'IPv4Allocation', 
+        ipv4_to_int, 
+        int, 
+        '%s', 
+        lambda ip: ip, 
+        'IP'
+    ),
+    6: _AllocationFormat(
+        'IPv6Allocation', 
+        ipv6_to_int, 
+        binary_to_int, 
+        'UNHEX(%s)', 
+        lambda ip: '%032x' % ip, 
+        'IPv6 IP'
+    ),
+}
+
+def _attribute_value(value):
+    '''Clean up an attribute value the way it is shown in racktables'''
+    if isinstance(value, string_types):
+        value = value.replace('%GPASS%', ' ')
+        value = value.replace('%GSKIP%', ' ')
+    if value is None:
+        value = ''
+    return value
+
+def _racktables(dbobject):
+    '''Return the Racktables instance behind dbobject, which can be a 
+    database connection, a Racktables instance or an entity.'''
+    if isinstance(dbobject, Racktables):
+        # Not getattr, a miss would go through Racktables.__getattr__
+        return dbobject.__dict__.get('rt', dbobject)
+    return Racktables(dbobject)
+
+def _connection_metadata(rt):
+    '''Return a MetadataCache for rt sharing its tables with every API on 
+    the same connection or pool, so entities built from a raw connection do 
+    not each load their own. A connection which does not take attributes 
+    gets tables of its own.'''
+    tables = getattr(rt.db, '_rtapi_metadata', None)
+    if tables is None:
+        tables = _MetadataTables()
+        try:
+            rt.db._rtapi_metadata = tables
+        except (AttributeError, TypeError):
+            pass
+    return MetadataCache(rt, rt.metadata_ttl, tables)
+
+def _cached_index(attribute, index_class, doc):
+    '''Property returning the index_class instance kept in attribute, 
+    built on first use'''
+    def get(self):
+        rt = _racktables(self)
+        index = getattr(rt, attribute)
+        if index is None:
+            index = index_class(rt)
+            setattr(rt, attribute, index)
+        return index
+    get.__doc__ = '%s, loaded on first use. Call refresh() on it to pick up changes.' % doc
+    return property(get)
 
 class Racktables(object):
     '''Racktables object. Require database object as argument. '''
 
+    # Max number of ids in one IN (...) list for batched lookups
+    chunk_size = 1000
+
+    # Default number of statements between commits inside transaction(), 
+    # None commits only when the block exits
+    commit_every = None
+
+    # Seconds before the MetadataCache reloads schema tables
+    metadata_ttl = 3600
+
+    # Rows per page when listing tables with keyset pagination, None loads 
+    # each table with one query
+    page_size = None
+
+    # Return entities looked up by id as lazy entities, see LazyLoader
+    lazy = False
+
+    # State of the API which entities, which do not run Racktables.__init__, 
+    # read from the Racktables they were built from
+    _shared_state = frozenset([
+        '_local', 'identity_map', 'instrumentation', 
+        '_metadata', '_lazy_loader', '_ip_index', '_cabling', 
+        '_location_tree', '_rack_space', '_tag_index', '_containers', 
+    ])
+
     # Init method
-    def __init__(self, dbobject):
-        '''Initialize Object'''
+    def __init__(self, dbobject, identity_map=None):
+        '''Initialize Object. dbobject is a DB-API connection or a 
+        ConnectionPool. identity_map is an optional IdentityMap used to share 
+        loaded entities between lookups.'''
         self.db = dbobject
-        self.dbcursor = self.db.cursor()
+        self.identity_map = identity_map
+        # QueryStats recording every statement, None turns instrumentation 
+        # off
+        self.instrumentation = None
+        self._metadata = None
+        self._lazy_loader = None
+        self._ip_index = None
+        self._cabling = None
+        self._location_tree = None
+        self._rack_space = None
+        self._tag_index = None
+        self._containers = None
+        self._local = threading.local()
+
+    def __getattr__(self, name):
+        # Only reached for attributes which are not set. For an entity that 
+        # is state of its Racktables, or fields of a lazy entity which have 
+        # not been loaded yet.
+        if name in Racktables._shared_state:
+            rt = self.__dict__.get('rt')
+            if rt is None:
+                raise AttributeError(name)
+            return getattr(rt, name)
+        loader = self.__dict__.get('_loader')
+        if loader is None or name.startswith('__'):
+            raise AttributeError(name)
+        loader.load(self)
+        return getattr(self, name)
+
+    ip_index = _cached_index(
+        '_ip_index', 
+        IPIndex, 
+        'IPIndex over all networks and allocations'
+    )
+    cabling = _cached_index(
+        '_cabling', 
+        CablingGraph, 
+        'CablingGraph over all ports and links'
+    )
+    location_tree = _cached_index(
+        '_location_tree', 
+        LocationTree, 
+        'LocationTree of all locations, rows and racks'
+    )
+    rack_space = _cached_index(
+        '_rack_space', 
+        RackSpaceIndex, 
+        'RackSpaceIndex of the occupancy of all racks'
+    )
+    tag_index = _cached_index(
+        '_tag_index', 
+        TagIndex, 
+        'TagIndex of the tag tree and tagged entities'
+    )
+    containers = _cached_index(
+        '_containers', 
+        ContainerGraph, 
+        'ContainerGraph of the objects linked in EntityLink'
+    )
+
+    @property
+    def metadata(self):
+        '''MetadataCache of this API, its tables are shared by every API 
+        and entity built on the same connection or pool'''
+        rt = _racktables(self)
+        if rt._metadata is None:
+            rt._metadata = _connection_metadata(rt)
+        return rt._metadata
 
     # DATABASE methods
+    @contextmanager
+    def db_connection(self):
+        '''Check out a connection for the current operation. With a plain 
+        connection that connection is used, with a ConnectionPool one is 
+        taken from the pool and rolled back and returned afterwards, so 
+        reads never keep an old snapshot. Inside transaction() the 
+        connection of the transaction is used.'''
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            yield conn
+            return
+        if not isinstance(self.db, ConnectionPool):
+            yield self.db
+            return
+        conn = self.db.get()
+        try:
+            yield conn
+        finally:
+            # End the read so the next user of the connection sees commits
+            # made on other connections of the pool
+            try:
+                conn.rollback()
+            finally:
+                self.db.put(conn)
+
+    def _db_new_cursor(self, conn):
+        cursor = conn.cursor()
+        if self.instrumentation is None:
+            return cursor
+        return self.instrumentation.cursor(cursor)
+
+    @contextmanager
+    def db_cursor(self):
+        '''Yield a new cursor which is closed after use'''
+        with self.db_connection() as conn:
+            cursor = self._db_new_cursor(conn)
+            try:
+                yield cursor
+            finally:
+                cursor.close()
+
     def db_query_one(self, sql, values=()):
         '''SQL query function, return one row. Require sql query as parameter'''
-        self.dbcursor.execute(sql, values)
-        return self.dbcursor.fetchone()
+        with self.db_cursor() as cursor:
+            cursor.execute(sql, values)
+            return cursor.fetchone()
 
     def db_query_all(self, sql, values=()):
         '''SQL query function, return all rows. Require sql query as 
         parameter'''
-        self.dbcursor.execute(sql, values)
-        return self.dbcursor.fetchall()
+        with self.db_cursor() as cursor:
+            cursor.execute(sql, values)
+            return cursor.fetchall()
     
+    @contextmanager
+    def transaction(self, commit_every=None):
+        '''Run all writes in the block on one connection and commit when 
+        the block exits, or roll back if it raises. 
+
+        commit_every commits after that many statements so a large sync 
+        runs as a few large transactions, defaults to self.commit_every. 
+        Statements committed that way are not rolled back. Nested blocks 
+        join the outer transaction.'''
+        local = self._local
+        if getattr(local, 'conn', None) is not None:
+            yield
+            return
+
+        if isinstance(self.db, ConnectionPool):
+            conn = self.db.get()
+        else:
+            conn = self.db
+        local.conn = conn
+        local.pending = 0
+        if commit_every is None:
+            commit_every = self.commit_every
+        local.commit_every = commit_every
+        try:
+            yield
+        except:
+            conn.rollback()
+            raise
+        else:
+            conn.commit()
+        finally:
+            local.conn = None
+            if isinstance(self.db, ConnectionPool):
+                self.db.put(conn)
+
     def db_insert(self, sql, values=()):
-        '''SQL insert/update function. Require sql query as parameter'''
-        self.dbcursor.execute(sql, values)
-        self.db.commit()
+        '''SQL insert/update function. Require sql query as parameter. 
+        Commits right away unless called inside transaction().'''
+        with self.db_connection() as conn:
+            cursor = self._db_new_cursor(conn)
+            try:
+                cursor.execute(sql, values)
+                self._local.lastrowid = cursor.lastrowid
+            finally:
+                cursor.close()
+            self._db_commit(conn)
+
+    def db_insert_many(self, sql, rows):
+        '''Run one insert/update statement for every row in rows using 
+        executemany'''
+        rows = list(rows)
+        if not rows:
+            return
+        with self.db_connection() as conn:
+            cursor = self._db_new_cursor(conn)
+            try:
+                cursor.executemany(sql, rows)
+            finally:
+                cursor.close()
+            self._db_commit(conn, len(rows))
+
+    def _db_commit(self, conn, statements=1):
+        '''Commit after a write, or count it if a transaction is open'''
+        local = self._local
+        if getattr(local, 'conn', None) is None:
+            conn.commit()
+            return
+        local.pending += statements
+        if local.commit_every and local.pending >= local.commit_every:
+            conn.commit()
+            local.pending = 0
 
     def db_fetch_lastid(self):
-        '''SQL function which return ID of last inserted row.'''
-        return self.dbcursor.lastrowid
-    
-    def Objects(self):
-        sql = 'select id from Object'
-        self.dbcursor.execute(sql)
-        for object_id in self.dbcursor:
-            yield RTObject(self.db, object_id)
+        '''SQL function which return ID of last inserted row in this 
+        thread.'''
+        return getattr(self._local, 'lastrowid', None)
+
+    def db_query_chunked(self, sql, ids, values=()):
+        '''Run sql once per chunk of ids and yield every row. The sql must 
+        contain a single %s where the IN list goes, for example 
+        'select ... from Object where id in (%s)'. values are appended 
+        after the ids.'''
+        ids = list(ids)
+        for start in range(0, len(ids), self.chunk_size):
+            chunk = ids[start:start+self.chunk_size]
+            chunk_sql = sql % ', '.join(['%s'] * len(chunk))
+            for row in self.db_query_all(chunk_sql, tuple(chunk) + tuple(values)):
+                yield row
+
+    def LazyEntity(self, entity_class, entity_id):
+        '''Return an entity_class instance which holds only entity_id and 
+        loads its fields on first access, batched with all other pending 
+        lazy entities of the same class.'''
+        if self.identity_map is not None:
+            entity = self.identity_map.get(entity_class, entity_id)
+            if entity is not None:
+                return entity
+        rt = _racktables(self)
+        if rt._lazy_loader is None:
+            rt._lazy_loader = LazyLoader(rt)
+        entity = rt._lazy_loader.add(entity_class, entity_id)
+        if self.identity_map is not None:
+            self.identity_map.add(entity)
+        return entity
+
+    def _Entity(self, entity_class, entity_id, row=None):
+        '''Return entity_class instance for entity_id, from the identity 
+        map if one is in use. Without a row and with lazy set a lazy 
+        entity is returned.'''
+        if row is None and self.lazy and getattr(entity_class, '_table', None):
+            return self.LazyEntity(entity_class, entity_id)
+        if self.identity_map is None:
+            return entity_class(self, entity_id, row)
+        entity = self.identity_map.get(entity_class, entity_id)
+        if entity is None:
+            entity = entity_class(self, entity_id, row)
+            self.identity_map.add(entity)
+        return entity
+
+    def _Evict(self, entity_class, entity_id):
+        '''Drop entity from the identity map after it was written to'''
+        if self.identity_map is not None:
+            self.identity_map.invalidate(entity_class, entity_id)
+
+    def _Listing(self, entities):
+        '''Return the entities generator. With instrumentation on it is 
+        wrapped so its queries, which only run once it is iterated, are 
+        credited to the API method which created it.'''
+        if self.instrumentation is None:
+            return entities
+        return self.instrumentation.listing(
+            entities, 
+            self.instrumentation.caller(sys._getframe(1))
+        )
+
+    def _Entities(self, entity_class, sql, values=(), records=False):
+        '''Run sql which selects entity_class._columns and yield one 
+        entity per row, built without further queries. With records the 
+        rows are returned as entity_class._record instead.'''
+        return self._Listing(
+            self._IterEntities(entity_class, sql, values, records)
+        )
+
+    def _IterEntities(self, entity_class, sql, values, records):
+        rows = self.db_query_all(sql, values)
+        if records:
+            record_class = entity_class._record
+            for row in rows:
+                yield record_class._make(row)
+            return
+        for row in rows:
+            yield self._Entity(entity_class, row[0], row)
+
+    def _EntityScan(self, entity_class, table, page_size=None, after_id=None, 
+                    records=False):
+        '''Yield every entity in table. With a page_size, or when resuming 
+        after_id, rows are read in pages of id > last id seen so memory use 
+        stays flat and the first entity arrives after the first page.'''
+        page_size = page_size or self.page_size
+        if page_size is None and after_id is None:
+            sql = 'select %s from %s' % (entity_class._columns, table)
+            return self._Entities(entity_class, sql, records=records)
+        return self._Listing(self._EntityPages(
+            entity_class, 
+            table, 
+            page_size or self.chunk_size, 
+            after_id,
+            records
+        ))
+
+    def _EntityPages(self, entity_class, table, page_size, after_id=None, 
+                     records=False):
+        sql = 'select %s from %s where id > %%s order by id limit %%s' % (
+            entity_class._columns, 
+            table
+        )
+        last_id = after_id
+        if last_id is None:
+            last_id = -1
+        while True:
+            rows = self.db_query_all(sql, (last_id, page_size))
+            for row in rows:
+                if records:
+                    yield entity_class._record._make(row)
+                else:
+                    yield self._Entity(entity_class, row[0], row)
+            if len(rows) < page_size:
+                break
+            last_id = rows[-1][0]
+
+    def _EntitiesById(self, entity_class, table, ids):
+        '''Yield entities for a list of ids using chunked IN queries. 
+        Order of ids is preserved and missing ids are skipped. Ids already 
+        in the identity map are not queried. With lazy set, lazy entities 
+        are returned without any query.'''
+        return self._Listing(self._IterEntitiesById(entity_class, table, ids))
+
+    def _IterEntitiesById(self, entity_class, table, ids):
+        ids = list(ids)
+        if self.lazy and getattr(entity_class, '_table', None):
+            for entity_id in ids:
+                yield self.LazyEntity(entity_class, entity_id)
+            return
+        entities = {}
+        if self.identity_map is not None:
+            for entity_id in set(ids):
+                entity = self.identity_map.get(entity_class, entity_id)
+                if entity is not None:
+                    entities[entity_id] = entity
+        missing = set(ids) - set(entities)
+        if missing:
+            sql = 'select %s from %s where id in (%%s)' % (
+                entity_class._columns, 
+                table
+            )
+            for row in self.db_query_chunked(sql, missing):
+                entities[row[0]] = self._Entity(entity_class, row[0], row)
+        for entity_id in ids:
+            if entity_id in entities:
+                yield entities[entity_id]
+
+    def Objects(self, page_size=None, after_id=None, records=False):
+        '''List all objects. Pass page_size to stream the table in pages 
+        and after_id to resume after the last object id seen. With records 
+        ObjectRecord tuples are returned instead of RTObject.'''
+        return self._EntityScan(
+            RTObject, 
+            'Object', 
+            page_size, 
+            after_id, 
+            records
+        )
 
     def ObjectTypes(self):
         '''List all object types'''
-        # First find the ObjectType chapter ID
-        sql = 'select id from Chapter where name=\'ObjectType\''
-        chapter_id = self.db_query_one(sql)
-        if not chapter_id:
+        object_types = self.metadata.chapter('ObjectType')
+        if object_types is None:
             raise ValueError('Found not ObjectType Chapter ID')
 
-        sql = '''select dict_key, dict_value 
-        from Dictionary where chapter_id=%s'''
-        self.dbcursor.execute(sql, (chapter_id,))
-        for (object_id, object_name) in self.dbcursor:
+        for (object_id, object_name) in sorted(object_types.items()):
             yield (object_id, object_name)
 
-    def IPv4Networks(self):
-        sql = 'select id from IPv4Network'
-        networks = self.dbcursor.execute(sql)
-        for row in self.dbcursor:
-            _ip_network = IPv4Network(self.db, row[0])
-            yield _ip_network
+    def IPv4Networks(self, page_size=None, after_id=None, records=False):
+        return self._EntityScan(
+            IPv4Network, 
+            'IPv4Network', 
+            page_size, 
+            after_id, 
+            records
+        )
+
+    def IPv4Utilization(self, include_reserved=True):
+        '''Return used and free address counts of every IPv4Network as a 
+        rtapi.report.UtilizationReport, needs numpy'''
+        from .report import ipv4_utilization
+        return ipv4_utilization(self, include_reserved)
+
+    def Snapshot(self, path, tables=None):
+        '''Export the tables read by the API to a read only SQLite file 
+        at path, see rtapi.snapshot. Returns dict of table: row count.'''
+        from .snapshot import export_snapshot, SNAPSHOT_TABLES
+        return export_snapshot(self, path, tables or SNAPSHOT_TABLES)
 
     def ObjectExistST(self, service_tag):
         '''Check if object exist in database based on asset_no'''
@@ -110,9 +910,8 @@ class Racktables(object):
     def ObjectExistName(self, name):
         '''Check if object exist in database based on name'''
         sql = 'select id from Object where name = %s'
-        self.dbcursor.execute(sql, (name,))
-        object_id = self.dbcursor.fetchone()
-        return RTObject(self.db, object_id)
+        object_id = self.db_query_one(sql, (name,))
+        return self._Entity(RTObject, object_id)
 
     def ObjectExistSTName(self, name, asset_no):
         '''Check if object exist in database based on name'''
@@ -131,24 +930,41 @@ class Racktables(object):
                       ''',
                       (name, server_type_id, asset_no, label,)
                      )
-        object_id = self.db.lastrowid
-        return RTObject(self.db, object_id)
+        object_id = self.db_fetch_lastid()
+        return self._Entity(RTObject, object_id)
+
+    def AddObjects(self, objects):
+        '''Add many objects with one executemany. objects is a list of
+        (name, server_type_id, asset_no, label). Returns dict of name: id
+        of the added objects.'''
+        objects = list(objects)
+        self.db_insert_many('''
+                            insert into Object
+                            (name, objtype_id, asset_no, label)
+                            values (%s, %s, %s, %s)
+                            ''',
+                            objects
+                           )
+        return self.GetObjectIds(row[0] for row in objects)
 
     def UpdateObjectLabel(self,object_id,label):
         '''Update label on object'''
         sql = "UPDATE Object SET label = %s where id = %s"
         self.db_insert(sql, (label, object_id,))
+        self._Evict(RTObject, object_id)
     
     def UpdateObjectComment(self,object_id,comment):
         '''Update comment on object'''
         sql = "UPDATE Object SET comment = %s where id = %s"
         self.db_insert(sql, (comment, object_id,))
+        self._Evict(RTObject, object_id)
 
     def UpdateObjectName(self,object_id,name):
         '''Update name on object'''
         old_name = self.GetObjectName(object_id)
-        sql = "UPDATE Object SET name = '%s' where id = %s"
+        sql = "UPDATE Object SET name = %s where id = %s"
         self.db_insert(sql, (name, object_id,))
+        self._Evict(RTObject, object_id)
         self.InsertLog(object_id, 'Name changed from %s to %s' % (
             old_name, name
         ))
@@ -201,12 +1017,45 @@ class Racktables(object):
 
         return object_id
 
+    def GetObjectIds(self, names):
+        '''Translate many Object names to ids in chunked queries. Returns
+        dict of name: id, names which do not exist are left out.'''
+        sql = 'SELECT name, id FROM Object WHERE name in (%s)'
+        return dict(self.db_query_chunked(sql, set(names)))
+
     # Logging
+    @property
+    def log_buffer(self):
+        '''LogBuffer of the BufferedLog block open in this thread, or None'''
+        return getattr(self._local, 'log_buffer', None)
+
     def InsertLog(self,object_id,message):
-        '''Attach log message to specific object'''
+        '''Attach log message to specific object. Goes to the log_buffer of 
+        this thread if one is open.'''
+        log_buffer = self.log_buffer
+        if log_buffer is not None:
+            log_buffer.add(object_id, message)
+            return
         sql = "INSERT INTO ObjectLog (object_id,user,date,content) VALUES (%s,'script',now(),%s)"
         self.db_insert(sql, (object_id, message,))
 
+    @contextmanager
+    def BufferedLog(self, size=1000):
+        '''Buffer all InsertLog calls made in the block in a LogBuffer and 
+        write them in bulk, the rest is written when the block exits. The 
+        buffer only collects entries of the current thread.'''
+        local = self._local
+        log_buffer = getattr(local, 'log_buffer', None)
+        if log_buffer is not None:
+            yield log_buffer
+            return
+        log_buffer = local.log_buffer = LogBuffer(self, size)
+        try:
+            yield log_buffer
+        finally:
+            local.log_buffer = None
+            log_buffer.close()
+
     # Attrubute methods
     def InsertAttribute(self,object_id,object_tid,attr_id,string_value,uint_value,name):
         '''Add or Update object attribute. 
@@ -255,18 +1104,67 @@ class Racktables(object):
                 sql = "INSERT INTO AttributeValue (object_id,object_tid,attr_id,string_value) VALUES (%s,%s,%s,%s)"
                 self.db_insert(sql, (object_id, object_tid, attr_id, string_value,))
 
-    def GetAttributeId(self,searchstring):
-        '''Search racktables database and get attribud id based on search string as argument'''
-        sql = "SELECT id FROM Attribute WHERE name LIKE '%%%s%%'"
-  
-        result = self.db_query_one(sql, (searchstring,))
+    _attributes_sql = '''
+    select AttributeValue.object_id, Attribute.type, Attribute.name, 
+    AttributeValue.string_value, AttributeValue.uint_value, 
+    AttributeValue.float_value, Dictionary.dict_value 
+    from AttributeValue 
+    inner join Attribute on Attribute.id = AttributeValue.attr_id 
+    left join Dictionary on Attribute.type = 'dict' and 
+    Dictionary.dict_key = AttributeValue.uint_value 
+    '''
+
+    def _AttributeRows(self, rows, ret):
+        '''Fold rows of _attributes_sql into ret as 
+        {object_id: {name: value}}'''
+        for object_id, attr_type, name, string_value, uint_value, float_value, dict_value in rows:
+            if string_value is not None:
+                value = string_value
+            elif uint_value is not None:
+                if attr_type == 'dict':
+                    value = dict_value
+                else:
+                    value = uint_value
+            else:
+                value = float_value
+            ret.setdefault(object_id, {})[name] = _attribute_value(value)
+        return ret
 
-        if result != None:
-            getted_id = result[0]
-        else:
-            getted_id = None
+    def GetAttributesBulk(self, object_ids=None):
+        '''Return attributes of many objects as {object_id: {name: value}}, 
+        with the same values as RTObject.GetAttributes(). Attribute names 
+        and dictionary values are joined in SQL and objects are fetched in 
+        chunks. Without object_ids all objects are returned.'''
+        if object_ids is None:
+            return dict(self.IterAttributes())
+        sql = self._attributes_sql + 'where AttributeValue.object_id in (%s)'
+        ret = {}
+        self._AttributeRows(self.db_query_chunked(sql, set(object_ids)), ret)
+        return ret
 
-        return getted_id
+    def IterAttributes(self, chunk_size=None):
+        '''Yield (object_id, {name: value}) for every object with 
+        attributes, ordered by object id and loaded one id range at a 
+        time.'''
+        chunk_size = chunk_size or self.chunk_size
+        first_id, last_id = self.db_query_one(
+            'select min(object_id), max(object_id) from AttributeValue'
+        )
+        if first_id is None:
+            return
+        sql = self._attributes_sql + '''where AttributeValue.object_id >= %s 
+        and AttributeValue.object_id < %s'''
+        for start in range(first_id, last_id + 1, chunk_size):
+            ret = self._AttributeRows(
+                self.db_query_all(sql, (start, start + chunk_size)), 
+                {}
+            )
+            for object_id in sorted(ret):
+                yield object_id, ret[object_id]
+
+    def GetAttributeId(self,searchstring):
+        '''Search racktables database and get attribud id based on search string as argument'''
+        return self.metadata.search('attribute', searchstring)
 
     # Interfaces methods
     def GetInterfaceName(self,object_id,interface_id):
@@ -295,20 +1193,38 @@ class Racktables(object):
 
     def UpdateNetworkInterface(self,object_id,interface):
         '''Add network interfece to object if not exist'''
-
-        sql = "SELECT id,name FROM Port WHERE object_id = %s AND name = %s"
-
-        result = self.db_query_one(sql, (object_id, interface,))
-        if result == None:
-        
+        ports = self.UpdateNetworkInterfaces([(object_id, interface)])
+        return ports[object_id][interface]
+
+    def UpdateNetworkInterfaces(self, interfaces):
+        '''Add many network interfaces to objects if they do not exist. 
+        interfaces is a list of (object_id, interface name). Existing ports 
+        are read in one chunked query and only missing ones are inserted. 
+        Returns {object_id: {interface name: port_id}}.'''
+        interfaces = set(interfaces)
+        object_ids = set(object_id for object_id, interface in interfaces)
+        sql = "SELECT object_id, name, id FROM Port WHERE object_id in (%s)"
+        existing = {}
+        for object_id, name, port_id in self.db_query_chunked(sql, object_ids):
+            existing[(object_id, name)] = port_id
+
+        missing = sorted(interfaces - set(existing))
+        if missing:
             sql = "INSERT INTO Port (object_id,name,iif_id,type) VALUES (%s,%s,1,24)"
-            self.db_insert(sql, (object_id, interface,))
-            port_id = self.db_fetch_lastid()
+            self.db_insert_many(sql, missing)
+            sql = "SELECT object_id, name, id FROM Port WHERE object_id in (%s)"
+            for object_id, name, port_id in self.db_query_chunked(
+                sql, 
+                set(object_id for object_id, interface in missing)
+            ):
+                existing[(object_id, name)] = port_id
 
-        else:
-            port_id = result[0]
-
-        return port_id
+        ret = {}
+        for object_id, interface in interfaces:
+            ret.setdefault(object_id, {})[interface] = existing.get(
+                (object_id, interface)
+            )
+        return ret
 
     def LinkNetworkInterface(self,object_id,interface,switch_name,interface_switch):
         '''Link two devices togetger'''
@@ -359,165 +1275,231 @@ class Racktables(object):
 
     def InterfaceAddIpv4IP(self,object_id,device,ip):
         '''Add/Update IPv4 IP on interface'''
-
-        sql = "SELECT INET_NTOA(ip) from IPv4Allocation WHERE object_id = %s AND name = %s"
-        result = self.db_query_all(sql, (object_id,device,))
-
-        if result != None:
-            old_ips = result
-        
-        is_there = "no"
-            
-        for old_ip in old_ips:
-            if old_ip[0] == ip:
-                is_there = "yes"
-
-        if is_there == "no":
-            sql = "INSERT INTO IPv4Allocation (object_id,ip,name) VALUES (%s,INET_ATON(%s),%s)"
-            self.db_insert(sql, (object_id, ip, device,))
-            text = "Added IP %s on %s" % (ip,device)
-            self.InsertLog(object_id,text)
-            return True
-        return False
+        return bool(self.InterfaceAddIpv4IPs([(object_id, device, ip)]))
 
     def InterfaceAddIpv6IP(self,object_id,device,ip):
         '''Add/Update IPv6 IP on interface'''
-        #Create address object using ipaddr 
-        addr6 = ipaddr.IPAddress(ip)
-        #Create IPv6 format for Mysql
-        ip6 = "".join(str(x) for x in addr6.exploded.split(':'))
-
-        sql = "SELECT HEX(ip) FROM IPv6Allocation WHERE object_id = %s AND name = %s"
-        result = self.db_query_all(sql, (object_id, device,))
-        
-        if result != None:
-            old_ips = result
-
-        is_there = "no"
+        return bool(self.InterfaceAddIpv6IPs([(object_id, device, ip)]))
+
+    def InterfaceAddIpv4IPs(self, allocations):
+        '''Add many IPv4 addresses to interfaces. allocations is a list of 
+        (object_id, device, ip). Existing allocations of the objects are 
+        read in one chunked query and only missing ones are inserted. 
+        Returns list of the allocations which were added.'''
+        return self._InterfaceAddIPs(4, allocations)
+
+    def InterfaceAddIpv6IPs(self, allocations):
+        '''Same as InterfaceAddIpv4IPs for IPv6 addresses'''
+        return self._InterfaceAddIPs(6, allocations)
+
+    def _InterfaceAddIPs(self, version, allocations):
+        table, to_int, from_db, placeholder, to_db, log_name = (
+            _allocation_formats[version]
+        )
+
+        wanted = OrderedDict()
+        for object_id, device, ip in allocations:
+            wanted.setdefault((object_id, to_int(ip)), (object_id, device, ip))
+
+        # An address can only be allocated once per object
+        sql = "SELECT object_id, ip FROM " + table + " WHERE object_id in (%s)"
+        existing = set(
+            (object_id, from_db(ip)) for object_id, ip in self.db_query_chunked(
+                sql, 
+                set(object_id for object_id, ip in wanted)
+            )
+        )
+
+        added = [
+            allocation for key, allocation in wanted.items() 
+            if key not in existing
+        ]
+        if added:
+            sql = "INSERT INTO %s (object_id,ip,name) VALUES (%%s,%s,%%s)" % (
+                table, 
+                placeholder
+            )
+            self.db_insert_many(sql, [
+                (object_id, to_db(to_int(ip)), device) 
+                for object_id, device, ip in added
+            ])
+            for object_id, device, ip in added:
+                self.InsertLog(object_id, "Added %s %s on %s" % (
+                    log_name, 
+                    ip, 
+                    device
+                ))
+        return added
 
-        for old_ip in old_ips:
-            if old_ip[0] != ip6:
-                is_there = "yes"
-
-        if is_there == "no":
-            sql = "INSERT INTO IPv6Allocation (object_id,ip,name) VALUES (%d,UNHEX(%s),%s)"
-            self.db_insert(sql, (object_id, ip6, device,))
-            text = "Added IPv6 IP %s on %s" % (ip,device)
-            self.InsertLog(object_id,text)
-
-
-    
     def GetDictionaryId(self,searchstring):
         '''Search racktables dictionary using searchstring and return id of dictionary element'''
-        sql = "SELECT dict_key FROM Dictionary WHERE dict_value LIKE '%%%s%%'"
-
-        result = self.db_query_one(sql, (searchstring,))
-        if result != None:
-            getted_id = result[0]
-        else:
-            getted_id = None
-
-        return getted_id
+        return self.metadata.search('dictionary', searchstring)
 
     def GetDictionaryValue(self, dict_key):
-        sql = "SELECT dict_value FROM Dictionary WHERE dict_key=%s"
-        result = self.db_query_one(sql, (dict_key,))
-        if result != None:
-            getted_id = result[0]
-        else:
-            getted_id = None
-        return getted_id
+        return self.metadata.dictionary_value(dict_key)
 
     def CleanVirtuals(self,object_id,virtual_servers):
         '''Clean dead virtuals from hypervisor. virtual_servers is list of active virtual servers on hypervisor (object_id)'''
-
-        sql = "SELECT child_entity_id FROM EntityLink WHERE parent_entity_id = %s"
-
-        result = self.db_query_all(sql, (object_id,))
-
-        if result != None:
-            old_virtuals_ids = result
-            delete_virtual_id = []
-            new_virtuals_ids = []
-            # Translate names into ids
-            for new_virt in virtual_servers:
-                new_id = self.GetObjectId(new_virt)
-                if new_id != None:
-                    new_virtuals_ids.append(new_id)
-
-            for old_id in old_virtuals_ids:
-                try:
-                    test = new_virtuals_ids.index(old_id[0])
-                except ValueError:
-                    delete_virtual_id.append(old_id[0]) 
-        if len(delete_virtual_id) != 0:
-            for virt_id in delete_virtual_id:
-
-                sql = "DELETE FROM EntityLink WHERE parent_entity_id = %s AND child_entity_id = %s"
-                self.db_insert(sql, (object_id, virt_id,))
-                virt_name = self.GetObjectName(virt_id)
-                logstring = "Removed virtual %s" % virt_name
-                self.InsertLog(object_id,logstring)
+        summary = self.Reconcile(object_id, virtuals=virtual_servers, add=False)
+        return summary['virtuals']['removed']
 
     def CleanIPAddresses(self,object_id,ip_addresses,device):
         '''Clean unused ip from object. ip addresses is list of IP addresses configured on device (device) on host (object_id)'''
-
-        sql = "SELECT INET_NTOA(ip) FROM IPv4Allocation WHERE object_id = %s AND name = %s"
-        
-        result = self.db_query_all(sql, (object_id, device, ))
-
-        if result != None:
-            old_ips = result
-            delete_ips = []
-
-            for old_ip in old_ips:
-                try:
-                    test = ip_addresses.index(old_ip[0])
-                except ValueError:
-                    delete_ips.append(old_ip[0]) 
-        if len(delete_ips) != 0:
-            for ip in delete_ips:
-                sql = "DELETE FROM IPv4Allocation WHERE ip = INET_ATON(%s) AND object_id = %s AND name = %s"
-                self.db_insert(sql, (ip, object_id, device,))
-                logstring = "Removed IP %s from %s" % (ip,device)
-                self.InsertLog(object_id,logstring)
+        summary = self.Reconcile(
+            object_id, 
+            device=device, 
+            ipv4=ip_addresses, 
+            add=False
+        )
+        return summary['ipv4']['removed']
 
     def CleanIPv6Addresses(self,object_id,ip_addresses,device):
         '''Clean unused ipv6 from object. ip_addresses mus be list of active IP addresses on device (device) on host (object_id)'''
-
-        sql = "SELECT HEX(ip) FROM IPv6Allocation WHERE object_id = %s AND name = %s"
-        result = self.db_query_all(sql, (object_id, device, ))
-
-        if result != None:
-            old_ips = result
-            delete_ips = []
-            new_ip6_ips = []
-
-            #We must prepare ipv6 addresses into same format for compare
-            for new_ip in ip_addresses:
-                converted = ipaddr.IPAddress(new_ip).exploded.lower()
-                new_ip6_ips.append(converted)
-
-
-            for old_ip_hex in old_ips:
-                try:
-                    #First we must construct IP from HEX
-                    tmp = re.sub("(.{4})","\\1:", old_ip_hex[0], re.DOTALL)
-                    #Remove last : and lower string
-                    old_ip = tmp[:len(tmp)-1].lower()
-
-                    test = new_ip6_ips.index(old_ip)
-
-                except ValueError:
-                    delete_ips.append(old_ip)
-
-        if len(delete_ips) != 0:
-            for ip in delete_ips:
-                db_ip6_format = "".join(str(x) for x in ip.split(':')) 
-                sql = "DELETE FROM IPv6Allocation WHERE ip = UNHEX(%s) AND object_id = %s AND name = %s"
-                self.db_insert(sql, (db_ip6_format, object_id, device,))
-                logstring = "Removed IP %s from %s" % (ip,device)
-                self.InsertLog(object_id,logstring)
+        summary = self.Reconcile(
+            object_id, 
+            device=device, 
+            ipv6=ip_addresses, 
+            add=False
+        )
+        return summary['ipv6']['removed']
+
+    def Reconcile(self, object_id, device=None, virtuals=None, ipv4=None, 
+                  ipv6=None, add=True):
+        '''Make the virtuals linked to object_id and the IPv4/IPv6 
+        addresses on its device match the given lists. Lists left as None 
+        are not touched. 
+
+        Current and desired state are compared as sets of ids and integer 
+        addresses, names are resolved in one query, stale rows are deleted 
+        with one IN (...) statement per table and log entries are written 
+        in bulk, all in one transaction. With add False missing entries are 
+        only reported, not added. 
+
+        Returns dict like {'ipv4': {'added': [], 'removed': [], 
+        'missing': []}} with one key per list given. Raises ValueError if 
+        addresses are given without device.'''
+        if device is None and (ipv4 is not None or ipv6 is not None):
+            raise ValueError('Reconcile of IP addresses requires a device')
+        summary = {}
+        with self.transaction():
+            with self.BufferedLog():
+                if virtuals is not None:
+                    summary['virtuals'] = self._ReconcileVirtuals(
+                        object_id, 
+                        virtuals, 
+                        add
+                    )
+                if ipv4 is not None:
+                    summary['ipv4'] = self._ReconcileIPs(
+                        4, 
+                        object_id, 
+                        device, 
+                        ipv4, 
+                        add
+                    )
+                if ipv6 is not None:
+                    summary['ipv6'] = self._ReconcileIPs(
+                        6, 
+                        object_id, 
+                        device, 
+                        ipv6, 
+                        add
+                    )
+        return summary
+
+    def db_insert_in(self, sql, ids, values=(), placeholder='%s'):
+        '''Run a write statement with an IN list over ids, chunked like 
+        db_query_chunked. sql has a single %s where the IN list goes and 
+        %%s for each of values, which go before the ids. Each id is 
+        expanded with placeholder.'''
+        ids = list(ids)
+        for start in range(0, len(ids), self.chunk_size):
+            chunk = ids[start:start+self.chunk_size]
+            chunk_sql = sql % ', '.join([placeholder] * len(chunk))
+            self.db_insert(chunk_sql, tuple(values) + tuple(chunk))
+
+    def _ObjectNames(self, object_ids):
+        '''Return dict of id: name for object_ids in chunked queries'''
+        sql = 'SELECT id, name FROM Object WHERE id in (%s)'
+        return dict(self.db_query_chunked(sql, set(object_ids)))
+
+    def _ReconcileVirtuals(self, object_id, virtual_servers, add):
+        sql = "SELECT child_entity_id FROM EntityLink WHERE parent_entity_id = %s"
+        current = set(row[0] for row in self.db_query_all(sql, (object_id,)))
+        desired_ids = self.GetObjectIds(virtual_servers)
+        desired = set(desired_ids.values())
+
+        removed = current - desired
+        added = desired - current
+        names = self._ObjectNames(removed | added)
+        if removed:
+            sql = "DELETE FROM EntityLink WHERE parent_entity_id = %%s AND child_entity_id in (%s)"
+            self.db_insert_in(sql, sorted(removed), (object_id,))
+            for virt_id in sorted(removed):
+                self.InsertLog(object_id, "Removed virtual %s" % names.get(virt_id))
+        if added and add:
+            sql = "INSERT INTO EntityLink (parent_entity_type, parent_entity_id, child_entity_type, child_entity_id) VALUES ('object',%s,'object',%s)"
+            self.db_insert_many(sql, [(object_id, virt_id) for virt_id in sorted(added)])
+            for virt_id in sorted(added):
+                self.InsertLog(object_id, "Linked virtual %s with hypervisor" % names.get(virt_id))
+        return self._ReconcileSummary(
+            [names.get(virt_id) for virt_id in sorted(added)], 
+            [names.get(virt_id) for virt_id in sorted(removed)], 
+            add
+        )
+
+    def _ReconcileIPs(self, version, object_id, device, ip_addresses, add):
+        table, to_int, from_db, placeholder, to_db, log_name = (
+            _allocation_formats[version]
+        )
+
+        sql = "SELECT ip FROM %s WHERE object_id = %%s AND name = %%s" % table
+        current = set(
+            from_db(row[0]) for row in self.db_query_all(sql, (object_id, device,))
+        )
+        desired = set(to_int(ip) for ip in ip_addresses)
+
+        removed = sorted(current - desired)
+        added = sorted(desired - current)
+        if removed:
+            sql = "DELETE FROM " + table + " WHERE object_id = %%s AND name = %%s AND ip in (%s)"
+            self.db_insert_in(
+                sql, 
+                [to_db(ip) for ip in removed], 
+                (object_id, device,), 
+                placeholder
+            )
+            for ip in removed:
+                self.InsertLog(object_id, "Removed IP %s from %s" % (
+                    format_address(version, ip), 
+                    device
+                ))
+        if added and add:
+            sql = "INSERT INTO %s (object_id,ip,name) VALUES (%%s,%s,%%s)" % (
+                table, 
+                placeholder
+            )
+            self.db_insert_many(
+                sql, 
+                [(object_id, to_db(ip), device) for ip in added]
+            )
+            for ip in added:
+                self.InsertLog(object_id, "Added %s %s on %s" % (
+                    log_name, 
+                    format_address(version, ip), 
+                    device
+                ))
+        return self._ReconcileSummary(
+            [format_address(version, ip) for ip in added], 
+            [format_address(version, ip) for ip in removed], 
+            add
+        )
+
+    def _ReconcileSummary(self, added, removed, add):
+        # Entries which were not added because add is False are missing
+        if add:
+            return {'added': added, 'removed': removed, 'missing': []}
+        return {'added': [], 'removed': removed, 'missing': added}
 
     def LinkVirtualHypervisor(self,object_id,virtual_id):
         '''Assign virtual server to correct hypervisor'''
@@ -577,46 +1559,78 @@ class Racktables(object):
         sql = "SELECT object_id FROM AttributeValue WHERE attr_id = 2 AND uint_value = 994"
         return self.db_query_all(sql)
 
-    def GetRootLocations(self):
-        sql = "SELECT id FROM location where parent_id is NULL"
-        self.dbcursor.execute(sql)
-        for id, in self.dbcursor:
-            location = Location(self.db, id)
-            yield location
+    def GetRootLocations(self, records=False):
+        sql = "SELECT %s FROM location where parent_id is NULL" % (
+            Location._columns
+        )
+        return self._Entities(Location, sql, records=records)
     
-    def GetAllLocations(self):
-        sql = "SELECT id FROM location"
-        self.dbcursor.execute(sql)
-        for id, in self.dbcursor:
-            location = Location(self.db, id)
-            yield location
-
-    def Racks(self):
-        sql = 'select id from rack'
-        self.dbcursor.execute(sql)
-        for row in self.dbcursor:
-            rack = Rack(self.db, row[0])
-            yield rack
-
-    def RackObjects(self):
-        sql = 'select id from rackobject'
-        self.dbcursor.execute(sql)
-        for id in self.dbcursor:
-            obj = RTObject(self.db, id)
-            yield obj
+    def GetAllLocations(self, page_size=None, after_id=None, records=False):
+        return self._EntityScan(
+            Location, 
+            'location', 
+            page_size, 
+            after_id, 
+            records
+        )
+
+    def Racks(self, page_size=None, after_id=None, records=False):
+        return self._EntityScan(Rack, 'rack', page_size, after_id, records)
+
+    def RackObjects(self, page_size=None, after_id=None, records=False):
+        return self._EntityScan(
+            RTObject, 
+            'rackobject', 
+            page_size, 
+            after_id, 
+            records
+        )
+
+# Records are compact read only rows returned by the listing methods when 
+# called with records=True. They hold no database handle, pass one to its 
+# entity class, like RTObject(rt, record.id, record), to get the full 
+# entity without another query.
+class ObjectRecord(namedtuple('ObjectRecord', 
+    'id name label objtype_id asset_no has_problems comment')):
+    __slots__ = ()
+
+class TagRecord(namedtuple('TagRecord', 'id parent_id tag')):
+    __slots__ = ()
+
+class InterfaceRecord(namedtuple('InterfaceRecord', 
+    'id object_id name iif_id type l2address reservation_comment label')):
+    __slots__ = ()
+
+class IPv4AllocationRecord(namedtuple('IPv4AllocationRecord', 
+    'id object_id ip name type')):
+    __slots__ = ()
+
+class IPv4NetworkRecord(namedtuple('IPv4NetworkRecord', 'id ip mask name')):
+    __slots__ = ()
+
+class LocationRecord(namedtuple('LocationRecord', 
+    'id name has_problems comment parent_id')):
+    __slots__ = ()
+
+class RackRecord(namedtuple('RackRecord', 
+    'id name asset_no has_problems comment height sort_order row_id row_name location_id location_name')):
+    __slots__ = ()
 
 class RTObject(Racktables):
-    '''This object represents an object in racktables db.'''
+    '''This object represents an object in racktables db. Pass row to build 
+    the object from an already fetched row of _columns.'''
 
-    def __init__(self, dbobject, object_id):
-        self.rt = Racktables(dbobject)
-        self.db = dbobject
-        self.dbcursor = self.db.cursor()
+    _table = 'Object'
+    _columns = 'id, name, label, objtype_id, asset_no, has_problems, comment'
+    _record = ObjectRecord
 
-        sql = '''
-        select id, name, label, objtype_id, asset_no, has_problems, comment
-        from Object where id = %s
-        '''
+    def __init__(self, dbobject, object_id, row=None):
+        self.rt = _racktables(dbobject)
+        self.db = self.rt.db
+
+        if row is None:
+            sql = 'select %s from Object where id = %%s' % self._columns
+            row = self.rt.db_query_one(sql, (object_id,))
 
         (
             self._id, 
@@ -626,16 +1640,14 @@ class RTObject(Racktables):
             self._asset_no,
             self._has_problems,
             self._comment
-        ) = self.rt.db_query_one(sql, (object_id,))
+        ) = row
 
     def __repr__(self):
         return self._name
 
     def InsertLog(self, message):
         '''Attach log message to specific object'''
-        sql = '''INSERT INTO ObjectLog (object_id,user,date,content) 
-        VALUES (%s,'script',now(),%s)'''
-        self.rt.db_insert(sql, (self._id, message,))
+        self.rt.InsertLog(self._id, message)
 
     @property
     def name(self):
@@ -644,50 +1656,53 @@ class RTObject(Racktables):
     @name.setter
     def name(self, new_name):
         old_name = self._name
-        sql = "UPDATE Object SET name = '%s' where id = %s"
-        self.rt.db_insert(sql, (new_name, object_id,))
-        self.InsertLog(self._id, 'Name changed from %s to %s' % (
-            old_name, name
+        sql = "UPDATE Object SET name = %s where id = %s"
+        self.rt.db_insert(sql, (new_name, self._id,))
+        self.InsertLog('Name changed from %s to %s' % (
+            old_name, new_name
         ))
-        self._name = name
+        self._name = new_name
+        if self.rt.identity_map is not None:
+            self.rt.identity_map.add(self)
 
     def Delete(self):
         sql = 'delete from Object where id=%s'
         self.rt.db_insert(sql, (self._id,))
-
-    def Tags(self):
-        sql = 'select tag_id from TagStorage where entity_id = %s'
-        tags = self.dbcursor.execute(sql, (self._id,))
-        for tag_id in self.dbcursor:
-            rt_tag = RTTag(self.db, tag_id)
-            yield rt_tag
-
-    def IPv4Allocations(self):
-        sql = 'select ip from IPv4Allocation where object_id = %s'
-        self.dbcursor.execute(sql, (self._id,))
-        for ip in self.dbcursor:
-            allocation = IPv4Allocation(self.db, ip)
-            yield allocation
-
-    def Interfaces(self):
-        sql = 'select id from Port where object_id = %s'
-        self.dbcursor.execute(sql, (self._id,))
-        for id in self.dbcursor:
-            interface = Interface(self.db, id)
-            yield interface
+        self.rt._Evict(self.__class__, self._id)
+
+    def Tags(self, records=False):
+        sql = '''select TagTree.id, TagTree.parent_id, TagTree.tag 
+        from TagStorage inner join TagTree on TagStorage.tag_id = TagTree.id 
+        where TagStorage.entity_id = %s'''
+        return self.rt._Entities(RTTag, sql, (self._id,), records)
+
+    def IPv4Allocations(self, records=False):
+        sql = 'select %s from IPv4Allocation where object_id = %%s' % (
+            IPv4Allocation._columns
+        )
+        return self.rt._Entities(IPv4Allocation, sql, (self._id,), records)
+
+    def Interfaces(self, records=False):
+        sql = 'select %s from Port where object_id = %%s' % (
+            Interface._columns
+        )
+        return self.rt._Entities(Interface, sql, (self._id,), records)
 
     def ObjectTypeName(self):
-        types = dict(self.ObjectTypes())
-        return types[self._objtype_id]
+        return self.rt.metadata.chapter('ObjectType')[self._objtype_id]
 
     def RackSpace(self):
         sql = 'select rack_id, unit_no, atom, state from RackSpace where object_id = %s'
-        self.dbcursor.execute(sql, (self._id,))
+        rows = self.rt.db_query_all(sql, (self._id,))
+        racks = dict(
+            (rack._id, rack) for rack in self.rt._EntitiesById(
+                Rack, 'rack', set(row[0] for row in rows)
+            )
+        )
         ret = {}
-        for rack_id, unit_no, atom, state in self.dbcursor:
+        for rack_id, unit_no, atom, state in rows:
             if rack_id not in ret:
-                rack = Rack(self.db, rack_id)
-                ret[rack_id] = {'rack': rack, 'units': {}}
+                ret[rack_id] = {'rack': racks.get(rack_id), 'units': {}}
             rack_data = ret.get(rack_id)
             if unit_no not in rack_data['units']:
                 rack_data['units'][unit_no] = {}
@@ -695,65 +1710,63 @@ class RTObject(Racktables):
         return ret
 
     def _GetAttributeIDNameDict(self):
-        sql = 'select id, type, name from Attribute'
-        self.dbcursor.execute(sql)
-        ret = {}
-        for id, type, name in self.dbcursor:
-            ret[id] = (type, name)
-        return ret
+        return self.rt.metadata.attributes()
 
     def GetAttributes(self):
         attr_id_name_dict = self._GetAttributeIDNameDict()
         sql = 'select object_tid, attr_id, string_value, uint_value, float_value from AttributeValue where object_id = %s'
-        self.dbcursor.execute(sql, (self._id,))
         ret = {}
-        for object_tid, attr_id, string_value, uint_value, float_value in self.dbcursor:
-            name = attr_id_name_dict[attr_id][1]
+        for object_tid, attr_id, string_value, uint_value, float_value in self.rt.db_query_all(sql, (self._id,)):
+            attr_type, name = attr_id_name_dict[attr_id]
             if string_value is not None:
                 ret[name] = string_value
             elif uint_value is not None:
+                if attr_type == 'dict':
+                    uint_value = self.rt.GetDictionaryValue(uint_value)
                 ret[name] = uint_value
+            elif float_value is not None:
+                ret[name] = float_value
         for key in ret:
-            if type(ret[key]) not in [str, unicode]:
-                ret[key] = self.GetDictionaryValue(ret[key])
-            if type(ret[key]) in [str, unicode]:
-                ret[key] = ret[key].replace('%GPASS%', ' ') 
-                ret[key] = ret[key].replace('%GSKIP%', ' ') 
-            if ret[key] is None:
-                ret[key] = ''
+            ret[key] = _attribute_value(ret[key])
         return ret
 
     def LinkedObjects(self):
         sql = 'select child_entity_type, child_entity_id from EntityLink where parent_entity_id = %s and child_entity_type="object"'
-        res = self.dbcursor.execute(sql, (self._id,))
-        for child_entity_type, child_entity_id in self.dbcursor:
-            obj = RTObject(self.db, child_entity_id)
-            yield obj
+        linked_ids = [
+            child_entity_id for child_entity_type, child_entity_id in 
+            self.rt.db_query_all(sql, (self._id,))
+        ]
         sql = 'select parent_entity_type, parent_entity_id from EntityLink where child_entity_id = %s and parent_entity_type="object"'
-        res = self.dbcursor.execute(sql, (self._id,))
-        for parent_entity_type, parent_entity_id in self.dbcursor:
-            obj = RTObject(self.db, parent_entity_id)
-            yield obj
+        linked_ids.extend([
+            parent_entity_id for parent_entity_type, parent_entity_id in 
+            self.rt.db_query_all(sql, (self._id,))
+        ])
+        return self.rt._EntitiesById(RTObject, 'Object', linked_ids)
 
 
 class RTTag(RTObject):
-    def __init__(self, dbobject, tag_id):
-        self.rt = Racktables(dbobject)
-        self.db = dbobject
-        self.dbcursor = self.db.cursor()
+    _table = 'TagTree'
+    _columns = 'id, parent_id, tag'
+    _record = TagRecord
+
+    def __init__(self, dbobject, tag_id, row=None):
+        self.rt = _racktables(dbobject)
+        self.db = self.rt.db
 
-        self._id = tag_id
-        sql = 'select parent_id, tag from TagTree where id = %s'
+        if row is None:
+            sql = 'select %s from TagTree where id = %%s' % self._columns
+            row = self.rt.db_query_one(sql, (tag_id,))
         (
+            self._id,
             self._parent_id,
             self._tag
-        ) = self.rt.db_query_one(sql, (tag_id,))
+        ) = row
 
     def __repr__(self):
         return self._tag
 
     def parent(self):
-        return RTTag(self.db, self._parent_id)
+        return self.rt._Entity(RTTag, self._parent_id)
 
     # Change name of tag
     @property
@@ -763,17 +1776,25 @@ class RTTag(RTObject):
     @Tag.setter
     def Tag(self, new_name):
         sql = 'update TagTree set tag = %s where id = %s'
-        self.dbcursor.execute(sql, (new_name, self._id,))
+        self.rt.db_insert(sql, (new_name, self._id,))
+        self._tag = new_name
+        if self.rt.identity_map is not None:
+            self.rt.identity_map.add(self)
 
 class Interface(RTObject):
-    def __init__(self, dbobject, id):
-        self.rt = Racktables(dbobject)
-        self.db = dbobject
-        self.dbcursor = self.db.cursor()
+    _table = 'Port'
+    _columns = 'id, object_id, name, iif_id, type, l2address, reservation_comment, label'
+    _record = InterfaceRecord
 
-        self._id = id
-        sql = 'select object_id, name, iif_id, type, l2address, reservation_comment, label from Port where id = %s'
+    def __init__(self, dbobject, id, row=None):
+        self.rt = _racktables(dbobject)
+        self.db = self.rt.db
+
+        if row is None:
+            sql = 'select %s from Port where id = %%s' % self._columns
+            row = self.rt.db_query_one(sql, (id,))
         (
+            self._id,
             self._object_id,
             self._name,
             self._iif_id,
@@ -781,86 +1802,198 @@ class Interface(RTObject):
             self._l2address,
             self._reservation_comment,
             self._label
-        ) = self.rt.db_query_one(sql, (id,))
+        ) = row
 
     def __repr__(self):
         return self._name
 
     def Object(self):
-        return RTObject(self.db, self._object_id)
+        return self.rt._Entity(RTObject, self._object_id)
 
     def TypeName(self):
         ret = None
         if self._type:
-            sql = 'select id, oif_name from PortOuterInterface where id = %s'
-            (
-                id,
-                ret,
-            ) = self.rt.db_query_one(sql, (self._type,))
+            ret = self.rt.metadata.port_outer_interface(self._type)
         return ret
 
     def LinkedInterfaces(self):
-        sql = 'select porta, portb from Link where porta = %s'
-        self.dbcursor.execute(sql, (self._id,))
-        for porta, portb in self.dbcursor:
-            interface = Interface(self.db, portb)
-            yield interface
-        sql = 'select porta, portb from Link where portb = %s'
-        self.dbcursor.execute(sql, (self._id,))
-        for porta, portb in self.dbcursor:
-            interface = Interface(self.db, porta)
-            yield interface
+        sql = 'select porta, portb from Link where porta = %s or portb = %s'
+        linked_ids = []
+        for porta, portb in self.rt.db_query_all(sql, (self._id, self._id,)):
+            if porta == self._id:
+                linked_ids.append(portb)
+            else:
+                linked_ids.append(porta)
+        return self.rt._EntitiesById(Interface, 'Port', linked_ids)
 
 class IPv4Allocation(RTObject):
-    def __init__(self, dbobject, ip):
-        self.rt = Racktables(dbobject)
-        self.db = dbobject
-        self.dbcursor = self.db.cursor()
-
-        self._id = ip
-        sql = 'select object_id, INET_NTOA(ip), name, type from IPv4Allocation where ip = %s'
+    # Keyed by ip rather than id, so it can not be loaded lazily
+    _table = None
+    _columns = 'ip, object_id, INET_NTOA(ip), name, type'
+    _record = IPv4AllocationRecord
+
+    def __init__(self, dbobject, ip, row=None):
+        self.rt = _racktables(dbobject)
+        self.db = self.rt.db
+
+        if row is None:
+            sql = 'select %s from IPv4Allocation where ip = %%s' % (
+                self._columns
+            )
+            row = self.rt.db_query_one(sql, (ip,))
         (
+            self._id,
             self._object_id,
             self._ip,
             self._name,
             self._type
-        ) = self.rt.db_query_one(sql, (ip,))
+        ) = row
 
     def __repr__(self):
         return self._ip
 
     def Object(self):
-        return RTObject(self.db, self._object_id)
+        return self.rt._Entity(RTObject, self._object_id)
 
 class IPv4Network(Racktables):
-    def __init__(self, dbobject, id):
-        self.rt = Racktables(dbobject)
-        self.db = dbobject
-        self.dbcursor = self.db.cursor()
+    _table = 'IPv4Network'
+    _columns = 'id, INET_NTOA(ip), mask, name'
+    _record = IPv4NetworkRecord
 
-        self._id = id
-        sql = 'select INET_NTOA(ip), mask, name from IPv4Network where id = %s'
+    def __init__(self, dbobject, id, row=None):
+        self.rt = _racktables(dbobject)
+        self.db = self.rt.db
+
+        if row is None:
+            sql = 'select %s from IPv4Network where id = %%s' % self._columns
+            row = self.rt.db_query_one(sql, (id,))
         (
+            self._id,
             self._ip,
             self._mask,
             self._name,
-        ) = self.rt.db_query_one(sql, (id,))
+        ) = row
 
     def __repr__(self):
         return '%s/%s' % (self._ip, self._mask)
 
+    _free_re = re.compile(b'[^\xff]')
+
+    def _Bounds(self):
+        '''Return first and last address of network as int'''
+        host_bits = 32 - self._mask
+        first = (ipv4_to_int(self._ip) >> host_bits) << host_bits
+        return first, first + (1 << host_bits) - 1
+
+    def _LoadUsed(self, lock=False):
+        '''Load a bitmap of used addresses with one range query. 
+        Allocated addresses, any address with an IPv4Address row and the 
+        network and broadcast address of networks larger than /31 count 
+        as used.'''
+        first, last = self._Bounds()
+        size = last - first + 1
+        used = bytearray((size + 7) // 8)
+        if size % 8:
+            used[-1] = (0xff << (size % 8)) & 0xff
+        if lock:
+            # Serialize reservations in this network until commit
+            sql = 'select id from IPv4Network where id = %s for update'
+            self.rt.db_query_one(sql, (self._id,))
+        sql = '''select ip from IPv4Allocation where ip between %s and %s 
+        union select ip from IPv4Address where ip between %s and %s'''
+        ips = [ip for ip, in self.rt.db_query_all(sql, (first, last, first, last))]
+        if self._mask < 31:
+            ips.extend([first, last])
+        for ip in ips:
+            offset = int(ip) - first
+            used[offset >> 3] |= 1 << (offset & 7)
+        self._used = used
+        return used
+
+    def _IterFree(self, used):
+        first = self._Bounds()[0]
+        match = self._free_re.search(used)
+        while match is not None:
+            index = match.start()
+            byte = used[index]
+            for bit in range(8):
+                if not byte & (1 << bit):
+                    yield first + index * 8 + bit
+            match = self._free_re.search(used, index + 1)
+
+    def FreeAddresses(self, count=1, contiguous=False, reserve=False, 
+                      name='', object_id=None, refresh=False):
+        '''Return list of up to count free addresses in network, lowest 
+        first. The used addresses are read in one query and kept as a 
+        bitmap on the network, pass refresh to reload it. 
+
+        With contiguous only a run of count consecutive addresses is 
+        returned. With reserve the addresses are picked and stored in one 
+        transaction, holding a lock on the network so concurrent callers 
+        get different addresses. They are allocated to object_id with 
+        name as interface name if object_id is given, otherwise reserved 
+        in IPv4Address with name.'''
+        if not reserve:
+            used = getattr(self, '_used', None)
+            if used is None or refresh:
+                used = self._LoadUsed()
+            return self._PickFree(used, count, contiguous)
+
+        with self.rt.transaction():
+            used = self._LoadUsed(lock=True)
+            ret = self._PickFree(used, count, contiguous)
+            if object_id is not None:
+                sql = "INSERT INTO IPv4Allocation (object_id,ip,name) VALUES (%s,INET_ATON(%s),%s)"
+                rows = [(object_id, ip, name) for ip in ret]
+            else:
+                sql = "INSERT INTO IPv4Address (ip,name,reserved) VALUES (INET_ATON(%s),%s,'yes')"
+                rows = [(ip, name) for ip in ret]
+            self.rt.db_insert_many(sql, rows)
+            if object_id is not None:
+                for ip in ret:
+                    self.rt.InsertLog(object_id, "Added IP %s on %s" % (ip, name))
+        first = self._Bounds()[0]
+        for ip in ret:
+            offset = ipv4_to_int(ip) - first
+            used[offset >> 3] |= 1 << (offset & 7)
+        return ret
+
+    def _PickFree(self, used, count, contiguous):
+        ret = []
+        for ip in self._IterFree(used):
+            if contiguous and ret and ip != ret[-1] + 1:
+                ret = []
+            ret.append(ip)
+            if len(ret) == count:
+                break
+        else:
+            if contiguous:
+                ret = []
+        return [int_to_ipv4(ip) for ip in ret]
+
+    def NextFree(self, reserve=False, name='', object_id=None):
+        '''Return the lowest free address in network or None'''
+        ret = self.FreeAddresses(
+            1, 
+            reserve=reserve, 
+            name=name, 
+            object_id=object_id, 
+            refresh=reserve
+        )
+        if ret:
+            return ret[0]
+        return None
+
     def VLAN(self):
         sql = 'select domain_id, vlan_id from VLANIPv4 where ipv4net_id = %s'
-        self.dbcursor.execute(sql, (self._id,))
-        for domain_id, vlan_id in self.dbcursor:
-            vlan = IPv4VLAN(self.db, vlan_id)
+        for domain_id, vlan_id in self.rt.db_query_all(sql, (self._id,)):
+            vlan = IPv4VLAN(self.rt, vlan_id)
             yield vlan
 
 class IPv4VLAN(Racktables):
     def __init__(self, dbobject, id):
-        self.rt = Racktables(dbobject)
-        self.db = dbobject
-        self.dbcursor = self.db.cursor()
+        self.rt = _racktables(dbobject)
+        self.db = self.rt.db
 
         self._id = id
         sql = 'select domain_id from VLANIPv4 where vlan_id = %s'
@@ -878,19 +2011,24 @@ class IPv4VLAN(Racktables):
 
 
 class Location(Racktables):
-    def __init__(self, dbobject, id):
-        self.rt = Racktables(dbobject)
-        self.db = dbobject
-        self.dbcursor = self.db.cursor()
+    _table = 'location'
+    _columns = 'id, name, has_problems, comment, parent_id'
+    _record = LocationRecord
 
-        self._id = id
-        sql = 'select name, has_problems, comment, parent_id from location where id = %s'
+    def __init__(self, dbobject, id, row=None):
+        self.rt = _racktables(dbobject)
+        self.db = self.rt.db
+
+        if row is None:
+            sql = 'select %s from location where id = %%s' % self._columns
+            row = self.rt.db_query_one(sql, (id,))
         (
+            self._id,
             self._name,
             self._has_problems,
             self._comment,
             self._parent_id,
-        ) = self.rt.db_query_one(sql, (id,))
+        ) = row
 
     def __repr__(self):
         return self._name
@@ -898,25 +2036,27 @@ class Location(Racktables):
     def Parent(self):
         parent = None
         if self._parent_id:
-            parent = Location(self.db, self._parent_id)
-        return ret
+            parent = self.rt._Entity(Location, self._parent_id)
+        return parent
 
-    def Children(self):
-        sql = "SELECT id FROM location where parent_id=%s"
-        self.dbcursor.execute(sql, (self._id,))
-        for id, in self.dbcursor:
-            location = Location(self.db, id)
-            yield location
+    def Children(self, records=False):
+        sql = "SELECT %s FROM location where parent_id=%%s" % self._columns
+        return self.rt._Entities(Location, sql, (self._id,), records)
 
 class Rack(Racktables):
-    def __init__(self, dbobject, id):
-        self.rt = Racktables(dbobject)
-        self.db = dbobject
-        self.dbcursor = self.db.cursor()
+    _table = 'rack'
+    _columns = 'id, name, asset_no, has_problems, comment, height, sort_order, row_id, row_name, location_id, location_name'
+    _record = RackRecord
 
-        self._id = id
-        sql = 'select name, asset_no, has_problems, comment, height, sort_order, row_id, row_name, location_id, location_name from rack where id = %s'
+    def __init__(self, dbobject, id, row=None):
+        self.rt = _racktables(dbobject)
+        self.db = self.rt.db
+
+        if row is None:
+            sql = 'select %s from rack where id = %%s' % self._columns
+            row = self.rt.db_query_one(sql, (id,))
         (
+            self._id,
             self._name,
             self._asset_no,
             self._has_problems,
@@ -927,11 +2067,11 @@ class Rack(Racktables):
             self._row_name,
             self._location_id,
             self._location_name,
-        ) = self.rt.db_query_one(sql, (id,))
+        ) = row
 
     def __repr__(self):
         return self._name
 
     def Location(self):
-        return Location(self.db, self._location_id)
+        return self.rt._Entity(Location, self._location_id)
 
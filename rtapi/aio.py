@@ -0,0 +1,306 @@
+#
+#   RTAPI
+#   asyncio version of the read API. Python 3.7+ only.
+#
+#   This utility is released under GPL v2
+#
+
+'''asyncio read API for Racktables.
+
+AsyncRacktables mirrors the read methods of Racktables as coroutines
+and async generators returning the same records as records=True.
+Queries go through an async pool: AsyncConnectionPool runs any DB-API
+driver in worker threads with one connection each, AiomysqlPool wraps
+an aiomysql pool. Independent lookups, like the attributes, ports and
+addresses of one object in ObjectDetails(), run concurrently.
+
+    import functools
+    from rtapi import aio, sqlitedb
+
+    pool = aio.AsyncConnectionPool(
+        functools.partial(sqlitedb.connect, '/tmp/racktables.db'),
+        size=8
+    )
+    rt = aio.AsyncRacktables(pool)
+    async for obj in rt.Objects(page_size=1000):
+        details = await rt.ObjectDetails(obj.id)
+'''
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from . import Racktables, ConnectionPool, RTObject, RTTag, Interface, \
+    IPv4Allocation, IPv4Network, Location, Rack, ObjectRecord
+
+class AsyncConnectionPool(object):
+    '''Runs queries of a blocking DB-API driver in a pool of size worker
+    threads, each query on a connection from a ConnectionPool built with
+    connect.'''
+
+    def __init__(self, connect, size=5):
+        self.size = size
+        self._pool = ConnectionPool(connect, size)
+        self._executor = ThreadPoolExecutor(max_workers=size)
+
+    def _run(self, sql, values, fetch_all):
+        conn = self._pool.get()
+        try:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(sql, values)
+                if fetch_all:
+                    ret = cursor.fetchall()
+                else:
+                    ret = cursor.fetchone()
+            finally:
+                cursor.close()
+            # End the read so the next query sees new commits
+            conn.rollback()
+            return ret
+        finally:
+            self._pool.put(conn)
+
+    async def query_all(self, sql, values=()):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor,
+            self._run,
+            sql,
+            values,
+            True
+        )
+
+    async def query_one(self, sql, values=()):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor,
+            self._run,
+            sql,
+            values,
+            False
+        )
+
+    async def close(self):
+        self._executor.shutdown(wait=True)
+        self._pool.close()
+
+class AiomysqlPool(object):
+    '''Adapter giving an aiomysql pool the interface of
+    AsyncConnectionPool'''
+
+    def __init__(self, pool):
+        self._pool = pool
+
+    async def _run(self, sql, values, fetch_all):
+        async with self._pool.acquire() as conn:
+            try:
+                async with conn.cursor() as cursor:
+                    await cursor.execute(sql, values)
+                    if fetch_all:
+                        return await cursor.fetchall()
+                    return await cursor.fetchone()
+            finally:
+                # End the read so the next query sees new commits
+                await conn.rollback()
+
+    async def query_all(self, sql, values=()):
+        return await self._run(sql, values, True)
+
+    async def query_one(self, sql, values=()):
+        return await self._run(sql, values, False)
+
+    async def close(self):
+        self._pool.close()
+        await self._pool.wait_closed()
+
+class AsyncRacktables(object):
+    '''Read only asyncio API over pool, an AsyncConnectionPool or
+    AiomysqlPool. Entities are returned as records.'''
+
+    # Max number of ids in one IN (...) list, chunks are queried
+    # concurrently
+    chunk_size = Racktables.chunk_size
+
+    # Rows per page when listing tables
+    page_size = 1000
+
+    _attributes_sql = Racktables._attributes_sql
+    _AttributeRows = Racktables._AttributeRows
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    async def db_query_one(self, sql, values=()):
+        return await self.pool.query_one(sql, values)
+
+    async def db_query_all(self, sql, values=()):
+        return await self.pool.query_all(sql, values)
+
+    async def db_query_chunked(self, sql, ids, values=()):
+        '''Return rows of sql for all ids, see Racktables.db_query_chunked.
+        Chunks run concurrently.'''
+        ids = list(ids)
+        chunks = []
+        for start in range(0, len(ids), self.chunk_size):
+            chunk = ids[start:start+self.chunk_size]
+            chunk_sql = sql % ', '.join(['%s'] * len(chunk))
+            chunks.append(self.db_query_all(chunk_sql, tuple(chunk) + tuple(values)))
+        ret = []
+        for rows in await asyncio.gather(*chunks):
+            ret.extend(rows)
+        return ret
+
+    async def close(self):
+        await self.pool.close()
+
+    async def _Scan(self, entity_class, table, page_size=None, after_id=None):
+        sql = 'select %s from %s where id > %%s order by id limit %%s' % (
+            entity_class._columns,
+            table
+        )
+        page_size = page_size or self.page_size
+        last_id = after_id
+        if last_id is None:
+            last_id = -1
+        while True:
+            rows = await self.db_query_all(sql, (last_id, page_size))
+            for row in rows:
+                yield entity_class._record._make(row)
+            if len(rows) < page_size:
+                break
+            last_id = rows[-1][0]
+
+    async def _Records(self, entity_class, sql, values=()):
+        return [
+            entity_class._record._make(row)
+            for row in await self.db_query_all(sql, values)
+        ]
+
+    def Objects(self, page_size=None, after_id=None):
+        '''Async generator of ObjectRecord for all objects, read in pages
+        of page_size'''
+        return self._Scan(RTObject, 'Object', page_size, after_id)
+
+    def IPv4Networks(self, page_size=None, after_id=None):
+        return self._Scan(IPv4Network, 'IPv4Network', page_size, after_id)
+
+    def GetAllLocations(self, page_size=None, after_id=None):
+        return self._Scan(Location, 'location', page_size, after_id)
+
+    def Racks(self, page_size=None, after_id=None):
+        return self._Scan(Rack, 'rack', page_size, after_id)
+
+    def RackObjects(self, page_size=None, after_id=None):
+        return self._Scan(RTObject, 'rackobject', page_size, after_id)
+
+    async def ObjectTypes(self):
+        '''List all object types as (id, name)'''
+        sql = '''select Dictionary.dict_key, Dictionary.dict_value
+        from Dictionary inner join Chapter on Chapter.id = Dictionary.chapter_id
+        where Chapter.name = 'ObjectType' order by Dictionary.dict_key'''
+        return [tuple(row) for row in await self.db_query_all(sql)]
+
+    async def GetObject(self, object_id):
+        '''Return ObjectRecord by id, or None'''
+        sql = 'select %s from Object where id = %%s' % RTObject._columns
+        row = await self.db_query_one(sql, (object_id,))
+        if row is None:
+            return None
+        return ObjectRecord._make(row)
+
+    async def GetObjectsById(self, object_ids):
+        '''Return list of ObjectRecord for object_ids in chunked queries,
+        missing ids are left out'''
+        sql = 'select %s from Object where id in (%%s)' % RTObject._columns
+        rows = dict(
+            (row[0], row)
+            for row in await self.db_query_chunked(sql, set(object_ids))
+        )
+        return [
+            ObjectRecord._make(rows[object_id])
+            for object_id in object_ids if object_id in rows
+        ]
+
+    async def GetObjectId(self, name):
+        '''Translate Object name to object id'''
+        row = await self.db_query_one(
+            'SELECT id FROM Object WHERE name = %s',
+            (name,)
+        )
+        if row is None:
+            return None
+        return row[0]
+
+    async def GetObjectIds(self, names):
+        '''Translate many Object names to ids, returns dict of name: id'''
+        sql = 'SELECT name, id FROM Object WHERE name in (%s)'
+        return dict(await self.db_query_chunked(sql, set(names)))
+
+    async def GetObjectName(self, object_id):
+        '''Translate Object ID to Object Name'''
+        row = await self.db_query_one(
+            'SELECT name FROM Object WHERE id = %s',
+            (object_id,)
+        )
+        if row is None:
+            return None
+        return row[0]
+
+    async def GetAttributes(self, object_id):
+        '''Return attributes of object_id as {name: value}'''
+        sql = self._attributes_sql + 'where AttributeValue.object_id = %s'
+        ret = self._AttributeRows(await self.db_query_all(sql, (object_id,)), {})
+        return ret.get(object_id, {})
+
+    async def GetAttributesBulk(self, object_ids):
+        '''Return attributes of many objects as {object_id: {name: value}}'''
+        sql = self._attributes_sql + 'where AttributeValue.object_id in (%s)'
+        return self._AttributeRows(
+            await self.db_query_chunked(sql, set(object_ids)),
+            {}
+        )
+
+    async def Interfaces(self, object_id):
+        '''Return list of InterfaceRecord of object_id'''
+        sql = 'select %s from Port where object_id = %%s' % Interface._columns
+        return await self._Records(Interface, sql, (object_id,))
+
+    async def IPv4Allocations(self, object_id):
+        '''Return list of IPv4AllocationRecord of object_id'''
+        sql = 'select %s from IPv4Allocation where object_id = %%s' % (
+            IPv4Allocation._columns
+        )
+        return await self._Records(IPv4Allocation, sql, (object_id,))
+
+    async def Tags(self, object_id):
+        '''Return list of TagRecord of object_id'''
+        sql = '''select TagTree.id, TagTree.parent_id, TagTree.tag
+        from TagStorage inner join TagTree on TagStorage.tag_id = TagTree.id
+        where TagStorage.entity_id = %s'''
+        return await self._Records(RTTag, sql, (object_id,))
+
+    async def LinkedInterfaces(self, port_id):
+        '''Return list of InterfaceRecord linked to port_id'''
+        sql = '''select %s from Port where id in (
+            select portb from Link where porta = %%s
+            union select porta from Link where portb = %%s)''' % (
+            Interface._columns
+        )
+        return await self._Records(Interface, sql, (port_id, port_id))
+
+    async def ObjectDetails(self, object_id):
+        '''Return dict with the object, attributes, interfaces, ipv4
+        allocations and tags of object_id, queried concurrently'''
+        obj, attributes, interfaces, ipv4, tags = await asyncio.gather(
+            self.GetObject(object_id),
+            self.GetAttributes(object_id),
+            self.Interfaces(object_id),
+            self.IPv4Allocations(object_id),
+            self.Tags(object_id),
+        )
+        return {
+            'object': obj,
+            'attributes': attributes,
+            'interfaces': interfaces,
+            'ipv4': ipv4,
+            'tags': tags,
+        }
@@ -0,0 +1,275 @@
+#
+#   RTAPI
+#   In memory graph of ports and cables.
+#
+#   This utility is released under GPL v2
+#
+
+'''In memory graph of Port, Link and Object.
+
+Loads the three tables in three queries into flat arrays indexed by port
+and answers peer lookups, end to end path tracing through patch panels
+and link audits without touching the database.
+
+    cabling = rt.cabling
+    for local, remote in cabling.object_links(switch_id):
+        print local.name, remote.object_name, remote.name
+'''
+
+from array import array
+from collections import namedtuple
+from .index import Index
+
+PortEntry = namedtuple(
+    'PortEntry',
+    'id object_id object_name name type'
+)
+LinkEntry = namedtuple('LinkEntry', 'porta portb cable')
+
+def same_name_passthrough(graph, port_id):
+    '''Default passthrough of trace(). A port passes through to the only
+    other port with the same name on the same object, like the front and
+    back port of a patch panel.'''
+    index = graph._index[port_id]
+    name = graph._names[index]
+    start, end = graph._object_range[graph._object_ids[index]]
+    ret = None
+    for other in range(start, end):
+        if other != index and graph._names[other] == name:
+            if ret is not None:
+                return None
+            ret = graph._ids[other]
+    return ret
+
+class CablingGraph(Index):
+    '''Port adjacency of a Racktables database. Ports are kept in arrays
+    ordered by object, each with the index of its linked port. Call
+    refresh() to reload it or update() to apply a ChangeSet.'''
+
+    def _load(self):
+        '''Load objects, ports and links from the database'''
+        return self._build(
+            dict(self.rt.db_query_all('select id, name from Object')),
+            self.rt.db_query_all(
+                'select id, object_id, name, type from Port order by object_id, id'
+            ),
+            self._read_links()
+        )
+
+    def _read_links(self):
+        return [
+            LinkEntry(porta, portb, cable)
+            for porta, portb, cable in self.rt.db_query_all(
+                'select porta, portb, cable from Link'
+            )
+        ]
+
+    def update(self, changes):
+        '''Apply a ChangeSet. Only the names and ports of the changed
+        objects are read again, and all links when Link changed.'''
+        tables = changes.tables
+        changed = changes.objects
+        objects = self._objects
+        if 'Object' in tables:
+            objects = dict(objects)
+            for object_id in changed:
+                objects.pop(object_id, None)
+            objects.update(self.rt.db_query_chunked(
+                'select id, name from Object where id in (%s)', changed
+            ))
+        ports = list(zip(self._ids, self._object_ids, self._names, self._types))
+        if 'Port' in tables:
+            ports = [port for port in ports if port[1] not in changed]
+            ports.extend(self.rt.db_query_chunked(
+                'select id, object_id, name, type from Port where object_id in (%s)',
+                changed
+            ))
+            ports.sort(key=lambda port: (port[1], port[0]))
+        links = self._link_rows
+        if 'Link' in tables:
+            links = self._read_links()
+        self.__dict__.update(self._build(objects, ports, links))
+
+    def _build(self, objects, ports, link_rows):
+        '''Return the attributes of the graph. objects is a dict of object
+        id: name, ports rows of id, object_id, name, type ordered by
+        object_id and id, and link_rows a list of LinkEntry.'''
+        ids = array('l')
+        object_ids = array('l')
+        types = array('l')
+        names = []
+        index = {}
+        object_range = {}
+        for port_id, object_id, name, port_type in ports:
+            position = len(ids)
+            index[port_id] = position
+            ids.append(port_id)
+            object_ids.append(object_id)
+            types.append(port_type or 0)
+            names.append(name)
+            start = object_range.get(object_id, (position,))[0]
+            object_range[object_id] = (start, position + 1)
+
+        peers = array('l', [-1]) * len(ids)
+        port_links = array('l', [-1]) * len(ids)
+        cables = {}
+        links = []
+        dangling = []
+        duplicates = {}
+        for link in link_rows:
+            porta, portb, cable = link
+            if porta not in index or portb not in index or porta == portb:
+                dangling.append(link)
+                continue
+            links.append(link)
+            for near, far in ((porta, portb), (portb, porta)):
+                position = index[near]
+                if peers[position] == -1:
+                    peers[position] = index[far]
+                    port_links[position] = len(links) - 1
+                else:
+                    duplicates.setdefault(
+                        near,
+                        [links[port_links[position]]]
+                    ).append(link)
+            if cable:
+                cables[index[porta]] = cables[index[portb]] = cable
+
+        # Ports of objects which do not exist make the links dangling too
+        for link in links:
+            if (
+                object_ids[index[link.porta]] not in objects or
+                object_ids[index[link.portb]] not in objects
+            ):
+                dangling.append(link)
+
+        return {
+            '_objects': objects,
+            '_ids': ids,
+            '_object_ids': object_ids,
+            '_types': types,
+            '_names': names,
+            '_index': index,
+            '_object_range': object_range,
+            '_peers': peers,
+            '_cables': cables,
+            '_links': links,
+            '_link_rows': link_rows,
+            '_dangling': dangling,
+            '_duplicates': duplicates,
+        }
+
+    def __len__(self):
+        return len(self._ids)
+
+    def _entry(self, position):
+        object_id = self._object_ids[position]
+        return PortEntry(
+            self._ids[position],
+            object_id,
+            self._objects.get(object_id),
+            self._names[position],
+            self._types[position] or None
+        )
+
+    def port(self, port_id):
+        '''Return PortEntry by port id, or None'''
+        position = self._index.get(port_id)
+        if position is None:
+            return None
+        return self._entry(position)
+
+    def find_port(self, object_id, name):
+        '''Return PortEntry of the first port of object_id named name, or
+        None'''
+        start, end = self._object_range.get(object_id, (0, 0))
+        for position in range(start, end):
+            if self._names[position] == name:
+                return self._entry(position)
+        return None
+
+    def object_ports(self, object_id):
+        '''Return list of PortEntry of object_id'''
+        start, end = self._object_range.get(object_id, (0, 0))
+        return [self._entry(position) for position in range(start, end)]
+
+    def peer(self, port_id):
+        '''Return PortEntry linked to port_id, or None'''
+        position = self._index.get(port_id)
+        if position is None or self._peers[position] == -1:
+            return None
+        return self._entry(self._peers[position])
+
+    def cable(self, port_id):
+        '''Return cable id of the link on port_id, or None'''
+        position = self._index.get(port_id)
+        return self._cables.get(position)
+
+    def trace(self, port_id, passthrough=same_name_passthrough):
+        '''Follow the cable from port_id to the far end and return every
+        port on the way as a list of PortEntry, starting with port_id.
+
+        At each port reached passthrough(graph, port_id) gives the port the
+        signal continues on within the same object, or None where the path
+        ends. Pass passthrough=None to only follow one link.'''
+        position = self._index.get(port_id)
+        if position is None:
+            return []
+        path = [position]
+        seen = set(path)
+        while True:
+            peer = self._peers[path[-1]]
+            if peer == -1 or peer in seen:
+                break
+            path.append(peer)
+            seen.add(peer)
+            if passthrough is None:
+                break
+            next_id = passthrough(self, self._ids[peer])
+            if next_id is None or self._index[next_id] in seen:
+                break
+            path.append(self._index[next_id])
+            seen.add(path[-1])
+        return [self._entry(position) for position in path]
+
+    def far_end(self, port_id, passthrough=same_name_passthrough):
+        '''Return PortEntry at the far end of the path from port_id, or
+        None if the port is not linked'''
+        path = self.trace(port_id, passthrough)
+        if len(path) < 2:
+            return None
+        return path[-1]
+
+    def object_links(self, object_id, passthrough=same_name_passthrough):
+        '''Return list of (local PortEntry, far end PortEntry) for every
+        linked port of object_id, like the servers behind each port of a
+        switch'''
+        ret = []
+        start, end = self._object_range.get(object_id, (0, 0))
+        for position in range(start, end):
+            if self._peers[position] == -1:
+                continue
+            path = self.trace(self._ids[position], passthrough)
+            ret.append((path[0], path[-1]))
+        return ret
+
+    def linked_objects(self, object_id, passthrough=same_name_passthrough):
+        '''Return dict of object_id: object name of everything at the far
+        end of the ports of object_id'''
+        return dict(
+            (remote.object_id, remote.object_name)
+            for local, remote in self.object_links(object_id, passthrough)
+        )
+
+    def dangling_links(self):
+        '''Return list of LinkEntry whose ports or objects do not exist,
+        or which link a port to itself'''
+        return list(self._dangling)
+
+    def duplicate_links(self):
+        '''Return dict of port_id: list of every LinkEntry of ports which
+        are in more than one link. Only the first link of such a port is
+        followed.'''
+        return dict(
+            (port_id, list(links)) for port_id, links in self._duplicates.items()
+        )
@@ -0,0 +1,287 @@
+#
+#   RTAPI
+#   Poll a Racktables database for changes.
+#
+#   This utility is released under GPL v2
+#
+
+'''Cheap change detection for long running consumers.
+
+Each poll reads the high water mark of ObjectLog and a small signature
+(row count, max id, column sums and for Object, Port and allocations the
+sum of a checksum of every row) of every watched table in one query. Only
+when something moved are the changed objects looked up, the cached
+entities of those objects reloaded and the in memory indexes over the
+changed tables updated. Callbacks are told what changed.
+
+    def changed(changes):
+        print changes.objects, changes.tables
+
+    tracker = rtapi.ChangeTracker(rt)
+    tracker.subscribe(changed)
+    tracker.start(interval=30)
+
+The tracker never ends a transaction it did not open, a poll through a
+plain connection sees what the open transaction of that connection sees.
+start() polls from another thread and needs rt on a ConnectionPool.
+'''
+
+import threading
+from collections import namedtuple
+
+ChangeSet = namedtuple('ChangeSet', 'objects tables')
+
+# Key column and checksum of one row of the tables whose edits matter.
+# Edits of rows, made through the API or the web interface, change the
+# sum of the checksums of their key. The tracker keeps that sum for every
+# key and reads them all again when the sum over the table moved, to find
+# which objects changed. Port and allocations are keyed by their object.
+ROW_CHECKSUMS = {
+    'Object': ('id', '''crc32(concat_ws('|', id, name, label, objtype_id,
+asset_no, has_problems, comment))'''),
+    'Port': ('object_id', '''crc32(concat_ws('|', id, name, iif_id, type,
+l2address, reservation_comment, label))'''),
+    'IPv4Allocation': ('object_id', "crc32(concat_ws('|', ip, name, type))"),
+    'IPv6Allocation': ('object_id', "crc32(concat_ws('|', hex(ip), name, type))"),
+}
+
+# Aggregates which make up the signature of each watched table. A change
+# which leaves all of them the same is not seen.
+SIGNATURES = {
+    'ObjectLog': ('max(id)',),
+    'Object': ('count(*)', 'max(id)', 'sum(%s)' % ROW_CHECKSUMS['Object'][1]),
+    'Port': ('count(*)', 'max(id)', 'sum(%s)' % ROW_CHECKSUMS['Port'][1]),
+    'Link': ('count(*)', 'sum(porta)', 'sum(portb)'),
+    'IPv4Network': ('count(*)', 'max(id)', 'sum(mask)'),
+    'IPv4Allocation': (
+        'count(*)',
+        'sum(object_id)',
+        'sum(%s)' % ROW_CHECKSUMS['IPv4Allocation'][1]
+    ),
+    'IPv6Network': ('count(*)', 'max(id)', 'sum(mask)'),
+    'IPv6Allocation': (
+        'count(*)',
+        'sum(object_id)',
+        'sum(%s)' % ROW_CHECKSUMS['IPv6Allocation'][1]
+    ),
+    'EntityLink': ('count(*)', 'max(id)', 'sum(parent_entity_id)'),
+    'TagTree': ('count(*)', 'max(id)', 'sum(parent_id)'),
+    'TagStorage': ('count(*)', 'sum(entity_id)', 'sum(tag_id)'),
+    'location': ('count(*)', 'max(id)', 'sum(parent_id)'),
+    'row': ('count(*)', 'max(id)', 'sum(location_id)'),
+    'rack': ('count(*)', 'max(id)', 'sum(row_id)', 'sum(height)'),
+    'RackSpace': ('count(*)', 'sum(rack_id * 64 + unit_no)', 'sum(object_id)'),
+    'Attribute': ('count(*)', 'max(id)'),
+    'Chapter': ('count(*)', 'max(id)'),
+    'Dictionary': ('count(*)', 'max(dict_key)'),
+    'PortOuterInterface': ('count(*)', 'max(id)'),
+}
+
+# Racktables caches and the tables they are built from. Indexes are
+# given the ChangeSet with update(), the metadata is reloaded.
+CACHE_TABLES = (
+    ('_metadata', ('Attribute', 'Chapter', 'Dictionary', 'PortOuterInterface')),
+    ('_ip_index', ('IPv4Network', 'IPv4Allocation', 'IPv6Network', 'IPv6Allocation')),
+    ('_cabling', ('Object', 'Port', 'Link')),
+    ('_location_tree', ('location', 'row', 'rack')),
+    ('_rack_space', ('rack', 'RackSpace')),
+    ('_tag_index', ('TagTree', 'TagStorage')),
+    ('_containers', ('EntityLink',)),
+)
+
+class ChangeTracker(object):
+    '''Watches the tables in signatures, a dict of table: tuple of
+    aggregate expressions which defaults to SIGNATURES. The current state
+    is read when the tracker is created, call poll() to pick up changes
+    since the last poll.
+
+    With refresh_caches the identity map entries of changed objects are
+    reloaded and the indexes of rt built from changed tables updated
+    before callbacks run. CablingGraph reads the names and ports of the
+    changed objects, IPIndex their allocations and TagIndex TagStorage.
+    Link changes reload all links, network changes the IPIndex and tag
+    tree changes the TagIndex. LocationTree, RackSpaceIndex,
+    ContainerGraph and the metadata are reloaded whole. Watched tables
+    which the database does not have, like ObjectLog in a snapshot, are
+    left out.
+
+    connect is a callable returning a new connection, like the one of
+    ConnectionPool. With it the signatures are read through a connection
+    owned by the tracker, which is rolled back after every poll, instead
+    of through rt.'''
+
+    def __init__(self, rt, signatures=None, refresh_caches=True, connect=None):
+        from . import Racktables, ConnectionPool
+        self.rt = rt
+        if connect is not None:
+            self._reader = Racktables(ConnectionPool(connect, size=1))
+        else:
+            self._reader = rt
+        if signatures is None:
+            signatures = SIGNATURES
+        self.signatures = dict(signatures)
+        self.refresh_caches = refresh_caches
+        self.last_error = None
+        self._callbacks = []
+        self._stop = None
+        self._watch(sorted(self.signatures))
+        try:
+            self._marks = self._read()
+        except Exception:
+            self._watch([
+                table for table in self._tables if self._exists(table)
+            ])
+            self._marks = self._read()
+        self._checksums = dict(
+            (table, self._row_checksums(table))
+            for table in ROW_CHECKSUMS if table in self._tables
+        )
+
+    def _watch(self, tables):
+        self._tables = tables
+        self._sql = 'select %s' % ', '.join(
+            '(select %s from `%s`)' % (expression, table)
+            for table in tables
+            for expression in self.signatures[table]
+        )
+
+    def _exists(self, table):
+        try:
+            self._reader.db_query_one('select 1 from `%s` limit 1' % table)
+        except Exception:
+            return False
+        return True
+
+    def _read(self):
+        row = list(self._reader.db_query_one(self._sql))
+        marks = {}
+        for table in self._tables:
+            size = len(self.signatures[table])
+            marks[table] = tuple(row[:size])
+            row = row[size:]
+        return marks
+
+    def subscribe(self, callback, tables=None):
+        '''Call callback(ChangeSet) after every poll which found changes.
+        With tables only when one of those tables changed.'''
+        if tables is not None:
+            tables = frozenset(tables)
+        self._callbacks.append((callback, tables))
+
+    def unsubscribe(self, callback):
+        self._callbacks = [
+            (subscribed, tables) for subscribed, tables in self._callbacks
+            if subscribed is not callback
+        ]
+
+    def _row_checksums(self, table):
+        '''Return dict of key: sum of the ROW_CHECKSUMS of the rows of
+        table with that key'''
+        key, checksum = ROW_CHECKSUMS[table]
+        return dict(self._reader.db_query_all(
+            'select %s, sum(%s) from `%s` group by %s' % (
+                key, checksum, table, key
+            )
+        ))
+
+    def _new_ids(self, table, column, old, new):
+        '''Return set of column of rows in table above the old max(id) 
+        high water mark'''
+        if 'max(id)' not in self.signatures[table]:
+            return set()
+        index = self.signatures[table].index('max(id)')
+        old_id = old[table][index]
+        new_id = new[table][index]
+        if new_id is None or old_id == new_id:
+            return set()
+        sql = 'select %s from `%s` where id > %%s' % (column, table)
+        return set(
+            row[0] for row in self._reader.db_query_all(sql, (old_id or 0,))
+        )
+
+    def poll(self):
+        '''Check for changes since the last poll, refresh caches and run
+        callbacks. Returns ChangeSet, or None if nothing changed.'''
+        old = self._marks
+        new = self._read()
+        tables = set(table for table in self._tables if old[table] != new[table])
+        if not tables:
+            return None
+
+        objects = set()
+        if 'ObjectLog' in tables:
+            objects |= self._new_ids('ObjectLog', 'object_id', old, new)
+        checksums = dict(self._checksums)
+        for table in tables.intersection(checksums):
+            # Objects with added, removed and edited rows
+            old_sums = self._checksums[table]
+            new_sums = checksums[table] = self._row_checksums(table)
+            objects |= set(old_sums) ^ set(new_sums)
+            objects |= set(
+                object_id for object_id, checksum in new_sums.items()
+                if old_sums.get(object_id, checksum) != checksum
+            )
+        objects.discard(None)
+        changes = ChangeSet(frozenset(objects), frozenset(tables))
+
+        if self.refresh_caches:
+            self._refresh(changes)
+        # Only move the marks once caches match them
+        self._marks = new
+        self._checksums = checksums
+
+        for callback, callback_tables in list(self._callbacks):
+            if callback_tables is None or callback_tables & changes.tables:
+                callback(changes)
+        return changes
+
+    def _refresh(self, changes):
+        from . import RTObject
+        from .index import Index
+        rt = self.rt
+        identity_map = rt.identity_map
+        if identity_map is not None and changes.objects:
+            cached = [
+                object_id for object_id in changes.objects
+                if ('RTObject', object_id) in identity_map
+            ]
+            for object_id in changes.objects:
+                identity_map.invalidate(RTObject, object_id)
+            # Reload the changed objects which were cached in one query
+            list(rt._EntitiesById(RTObject, 'Object', cached))
+
+        for attribute, tables in CACHE_TABLES:
+            cache = getattr(rt, attribute, None)
+            if cache is None or not changes.tables.intersection(tables):
+                continue
+            if isinstance(cache, Index):
+                cache.update(changes)
+            else:
+                cache.refresh()
+
+    def start(self, interval=60):
+        '''Poll every interval seconds in a daemon thread until stop().
+        Errors are kept in last_error and polling goes on. A plain
+        connection is not safe to share with another thread, so rt must be
+        on a ConnectionPool, or the tracker created with connect and
+        without refresh_caches.'''
+        from . import ConnectionPool
+        pooled = isinstance(self.rt.db, ConnectionPool)
+        if not (pooled or self._reader is not self.rt and not self.refresh_caches):
+            raise ValueError('ChangeTracker.start() needs rt on a ConnectionPool')
+        self._stop = threading.Event()
+        stop = self._stop
+        def run():
+            while not stop.wait(interval):
+                try:
+                    self.poll()
+                except Exception as e:
+                    self.last_error = e
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def stop(self):
+        if self._stop is not None:
+            self._stop.set()
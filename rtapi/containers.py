@@ -0,0 +1,123 @@
+#
+#   RTAPI
+#   In memory graph of object containers.
+#
+#   This utility is released under GPL v2
+#
+
+'''In memory graph of the object to object links in EntityLink.
+
+Loads EntityLink, the slot numbers and the server chassis in three
+queries and answers container traversal, like the VMs of a cluster per
+hypervisor or the blades of every chassis with their slots, without
+touching the database.
+
+    containers = rt.containers
+    for hypervisor_id, vm_ids in containers.grouped_children(cluster_id).items():
+        print hypervisor_id, len(vm_ids)
+'''
+
+from .index import Index
+
+def _slot_key(slot):
+    if slot is not None and slot.isdigit():
+        return (0, int(slot), slot)
+    return (1, 0, slot or '')
+
+class ContainerGraph(Index):
+    '''Parent and child object ids of every object linked in EntityLink.
+    Call refresh() to reload it.'''
+
+    def _load(self):
+        '''Load links, slot numbers and chassis from the database'''
+        children = {}
+        parents = {}
+        for parent_id, child_id in self.rt.db_query_all('''
+            select parent_entity_id, child_entity_id from EntityLink
+            where parent_entity_type = 'object' and child_entity_type = 'object'
+            '''):
+            children.setdefault(parent_id, []).append(child_id)
+            parents.setdefault(child_id, []).append(parent_id)
+        for ids in children.values():
+            ids.sort()
+        for ids in parents.values():
+            ids.sort()
+
+        slots = {}
+        slot_attribute_id = self.rt.GetAttributeId('Slot number')
+        if slot_attribute_id is not None:
+            sql = 'select object_id, string_value from AttributeValue where attr_id = %s'
+            slots = dict(self.rt.db_query_all(sql, (slot_attribute_id,)))
+
+        chassis = [row[0] for row in self.rt.GetAllServerChassisId()]
+
+        return {
+            '_children': children,
+            '_parents': parents,
+            '_slots': slots,
+            '_chassis': sorted(chassis),
+        }
+
+    def children(self, object_id):
+        '''Return list of object ids directly in object_id'''
+        return list(self._children.get(object_id, ()))
+
+    def parents(self, object_id):
+        '''Return list of object ids object_id is directly in'''
+        return list(self._parents.get(object_id, ()))
+
+    def _walk(self, links, object_id):
+        ret = []
+        seen = set([object_id])
+        queue = list(links.get(object_id, ()))
+        while queue:
+            next_queue = []
+            for linked_id in queue:
+                if linked_id in seen:
+                    continue
+                seen.add(linked_id)
+                ret.append(linked_id)
+                next_queue.extend(links.get(linked_id, ()))
+            queue = next_queue
+        return ret
+
+    def descendants(self, object_id):
+        '''Return list of every object id in object_id, recursively,
+        nearest first'''
+        return self._walk(self._children, object_id)
+
+    def containers(self, object_id):
+        '''Return list of every object id object_id is in, recursively,
+        nearest first, like the hypervisor and then the cluster of a VM'''
+        return self._walk(self._parents, object_id)
+
+    def grouped_children(self, object_id):
+        '''Return dict of child id: list of its children for every child
+        of object_id, like the VMs of a cluster per hypervisor'''
+        return dict(
+            (child_id, list(self._children.get(child_id, ())))
+            for child_id in self._children.get(object_id, ())
+        )
+
+    def slot(self, object_id):
+        '''Return slot number of object_id, or None'''
+        return self._slots.get(object_id)
+
+    def chassis_slots(self, chassis_id):
+        '''Return list of (slot number, object id) of every object in
+        chassis_id, ordered by slot'''
+        return sorted(
+            (
+                (self._slots.get(child_id), child_id)
+                for child_id in self._children.get(chassis_id, ())
+            ),
+            key=lambda slot: (_slot_key(slot[0]), slot[1])
+        )
+
+    def chassis(self):
+        '''Return dict of chassis id: chassis_slots() of every server
+        chassis'''
+        return dict(
+            (chassis_id, self.chassis_slots(chassis_id))
+            for chassis_id in self._chassis
+        )
@@ -0,0 +1,153 @@
+#
+#   RTAPI
+#   In memory tree of locations, rows and racks.
+#
+#   This utility is released under GPL v2
+#
+
+'''In memory tree of locations, rows and racks.
+
+Loads location, row and rack in three queries. Ancestor paths and the
+racks under every location are computed once, so parent, children and
+subtree lookups do not touch the database.
+
+    tree = rt.location_tree
+    for location in tree.roots():
+        print location.name, len(tree.racks(location.id))
+'''
+
+from collections import namedtuple
+from .index import Index, tree_paths
+
+RowEntry = namedtuple('RowEntry', 'id name location_id')
+
+class LocationTree(Index):
+    '''Location, row and rack hierarchy of a Racktables database.
+    Locations and racks are LocationRecord and RackRecord tuples. Call
+    refresh() to reload it.'''
+
+    def _load(self):
+        '''Load locations, rows and racks from the database'''
+        locations = dict(
+            (location.id, location)
+            for location in self.rt.GetAllLocations(records=True)
+        )
+        rows = dict(
+            (row_id, RowEntry(row_id, name, location_id))
+            for row_id, name, location_id in self.rt.db_query_all(
+                'select id, name, location_id from `row`'
+            )
+        )
+        racks = dict((rack.id, rack) for rack in self.rt.Racks(records=True))
+
+        children = {}
+        roots = []
+        for location in locations.values():
+            if location.parent_id in locations:
+                children.setdefault(location.parent_id, []).append(location)
+            else:
+                roots.append(location)
+        for siblings in children.values():
+            siblings.sort(key=lambda location: location.name)
+        roots.sort(key=lambda location: location.name)
+
+        # Locations in a parent_id loop get no path
+        paths = tree_paths(
+            [location.id for location in roots],
+            dict(
+                (parent_id, [location.id for location in siblings])
+                for parent_id, siblings in children.items()
+            )
+        )
+
+        location_rows = {}
+        for row in sorted(rows.values(), key=lambda row: row.name or ''):
+            location_rows.setdefault(row.location_id, []).append(row)
+
+        row_racks = {}
+        racks_under = {}
+        for rack in sorted(
+            racks.values(),
+            key=lambda rack: (rack.row_name or '', rack.sort_order or 0, rack.name)
+        ):
+            row_racks.setdefault(rack.row_id, []).append(rack)
+            for location_id in paths.get(rack.location_id, ()):
+                racks_under.setdefault(location_id, []).append(rack)
+
+        return {
+            '_locations': locations,
+            '_rows': rows,
+            '_racks': racks,
+            '_children': children,
+            '_roots': roots,
+            '_paths': paths,
+            '_location_rows': location_rows,
+            '_row_racks': row_racks,
+            '_racks_under': racks_under,
+        }
+
+    def location(self, location_id):
+        '''Return LocationRecord by id, or None'''
+        return self._locations.get(location_id)
+
+    def row(self, row_id):
+        '''Return RowEntry by id, or None'''
+        return self._rows.get(row_id)
+
+    def rack(self, rack_id):
+        '''Return RackRecord by id, or None'''
+        return self._racks.get(rack_id)
+
+    def roots(self):
+        '''Return list of locations without parent'''
+        return list(self._roots)
+
+    def parent(self, location_id):
+        '''Return parent LocationRecord of location_id, or None'''
+        location = self._locations.get(location_id)
+        if location is None:
+            return None
+        return self._locations.get(location.parent_id)
+
+    def children(self, location_id):
+        '''Return list of locations directly under location_id'''
+        return list(self._children.get(location_id, ()))
+
+    def path(self, location_id):
+        '''Return list of locations from the root down to location_id'''
+        return [
+            self._locations[path_id]
+            for path_id in self._paths.get(location_id, ())
+        ]
+
+    def descendants(self, location_id):
+        '''Return list of every location under location_id, depth first'''
+        ret = []
+        seen = set([location_id])
+        stack = list(reversed(self._children.get(location_id, ())))
+        while stack:
+            location = stack.pop()
+            if location.id in seen:
+                continue
+            seen.add(location.id)
+            ret.append(location)
+            stack.extend(reversed(self._children.get(location.id, ())))
+        return ret
+
+    def rows(self, location_id):
+        '''Return list of RowEntry directly in location_id'''
+        return list(self._location_rows.get(location_id, ()))
+
+    def row_racks(self, row_id):
+        '''Return list of racks in row_id in rack order'''
+        return list(self._row_racks.get(row_id, ()))
+
+    def racks(self, location_id):
+        '''Return list of every rack under location_id, including racks
+        in child locations'''
+        return list(self._racks_under.get(location_id, ()))
+
+    def rack_path(self, rack_id):
+        '''Return (list of locations from the root, RowEntry) of rack_id'''
+        rack = self._racks[rack_id]
+        return self.path(rack.location_id), self._rows.get(rack.row_id)
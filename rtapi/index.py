@@ -0,0 +1,52 @@
+#
+#   RTAPI
+#   Base class of the in memory indexes.
+#
+#   This utility is released under GPL v2
+#
+
+'''Plumbing shared by IPIndex, CablingGraph, LocationTree, RackSpaceIndex,
+TagIndex and ContainerGraph.'''
+
+class Index(object):
+    '''In memory index over tables of a Racktables database, loaded when
+    it is created. Subclasses implement _load(), which reads the tables
+    and returns a dict of the attributes making up the index.
+
+    refresh() reloads it and update() applies a ChangeSet of
+    ChangeTracker. The new attributes are only set once all of them are
+    built, with one dict update, so readers in other threads never see
+    half an index.'''
+
+    def __init__(self, rt):
+        self.rt = rt
+        self.refresh()
+
+    def _load(self):
+        raise NotImplementedError
+
+    def refresh(self):
+        '''Reload the index from the database'''
+        self.__dict__.update(self._load())
+
+    def update(self, changes):
+        '''Bring the index up to date with changes, a ChangeSet. Reloads
+        it, subclasses which can apply only the changed rows override
+        this.'''
+        self.refresh()
+
+def tree_paths(roots, children):
+    '''Return dict of node id: tuple of the ids from its root down to the
+    node. roots is a list of root ids, children a dict of id: list of
+    child ids. Each path is built from the path of its parent, nodes in a
+    parent loop are never reached and get no path.'''
+    paths = {}
+    stack = [(root, ()) for root in roots]
+    while stack:
+        node, parent_path = stack.pop()
+        if node in paths:
+            continue
+        paths[node] = parent_path + (node,)
+        for child in children.get(node, ()):
+            stack.append((child, paths[node]))
+    return paths
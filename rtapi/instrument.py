@@ -0,0 +1,365 @@
+#
+#   RTAPI
+#   Query instrumentation and N+1 detection.
+#
+#   This utility is released under GPL v2
+#
+
+'''Per statement statistics of everything a Racktables instance runs.
+
+Statements are grouped by template, the SQL with whitespace collapsed
+and IN lists and literals folded, and counted with latency histogram,
+rows and the API method which issued them. Inside an operation() block a
+template repeated threshold times is reported as an N+1 pattern.
+
+    stats = rtapi.QueryStats()
+    rt.instrumentation = stats
+    with stats.operation('audit'):
+        for obj in rt.Objects():
+            obj.GetAttributes()
+    print stats.report()
+
+Set rt.instrumentation back to None to turn it off, the only cost left is
+one attribute check per cursor.
+'''
+
+import os
+import re
+import sys
+import time
+import threading
+from collections import namedtuple
+
+# Upper bounds of the latency histogram buckets in milliseconds, the last
+# bucket counts everything slower
+BUCKETS = (0.5, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+TemplateStats = namedtuple(
+    'TemplateStats',
+    'template count total max rows histogram callers'
+)
+QueryEvent = namedtuple(
+    'QueryEvent',
+    'template sql seconds rows caller operation'
+)
+NPlusOne = namedtuple('NPlusOne', 'operation template count callers')
+
+_package_dir = os.path.dirname(os.path.abspath(__file__))
+# co_filename: path relative to the package, or None outside of it. Code 
+# imported from a relative sys.path entry has relative filenames.
+_package_files = {}
+_space_re = re.compile(r'\s+')
+_in_list_re = re.compile(
+    r'\(\s*(?:UNHEX\(%s\)|%s|\?)(?:\s*,\s*(?:UNHEX\(%s\)|%s|\?))*\s*\)'
+)
+_literal_re = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+
+def normalize(sql):
+    '''Return the template of sql'''
+    sql = _space_re.sub(' ', sql).strip()
+    sql = _in_list_re.sub('(...)', sql)
+    return _literal_re.sub('?', sql)
+
+class _Template(object):
+    __slots__ = ('count', 'total', 'max', 'rows', 'histogram', 'callers')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.histogram = [0] * (len(BUCKETS) + 1)
+        self.callers = {}
+
+class QueryStats(object):
+    '''Collects statistics of the statements of every Racktables it is
+    set on as instrumentation. threshold is how often one template may run
+    inside an operation before it is reported as N+1.'''
+
+    def __init__(self, threshold=10, stack_depth=30):
+        self.threshold = threshold
+        self.stack_depth = stack_depth
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._templates = {}
+        self._normalized = {}
+        self._n_plus_one = []
+        self._hooks = []
+
+    def add_hook(self, hook):
+        '''Call hook(QueryEvent) after every statement, for example to
+        export metrics'''
+        self._hooks.append(hook)
+
+    def remove_hook(self, hook):
+        self._hooks = [added for added in self._hooks if added is not hook]
+
+    def cursor(self, cursor):
+        '''Return cursor wrapped so its statements are recorded'''
+        return InstrumentedCursor(cursor, self)
+
+    def template(self, sql):
+        template = self._normalized.get(sql)
+        if template is None:
+            template = normalize(sql)
+            if len(self._normalized) > 10000:
+                self._normalized.clear()
+            self._normalized[sql] = template
+        return template
+
+    def caller(self, frame):
+        '''Return name of the API method which runs the statement, the
+        first public method up the stack from frame which is not a db_
+        method, like RTObject.GetAttributes'''
+        fallback = None
+        depth = 0
+        while frame is not None and depth < self.stack_depth:
+            code = frame.f_code
+            filename = code.co_filename
+            try:
+                package_file = _package_files[filename]
+            except KeyError:
+                package_file = os.path.abspath(filename)
+                if package_file.startswith(_package_dir + os.sep):
+                    package_file = package_file[len(_package_dir) + 1:]
+                else:
+                    package_file = None
+                _package_files[filename] = package_file
+            if package_file is not None:
+                name = code.co_name
+                if not name.startswith(('_', '<')) and package_file != 'instrument.py':
+                    if not name.startswith('db_'):
+                        owner = frame.f_locals.get('self')
+                        if owner is not None:
+                            return '%s.%s' % (owner.__class__.__name__, name)
+                        return name
+                    if fallback is None:
+                        fallback = name
+            elif not filename.endswith('contextlib.py'):
+                break
+            frame = frame.f_back
+            depth += 1
+        return fallback
+
+    def listing(self, entities, caller):
+        '''Yield from the entities generator, crediting the statements it
+        runs in this thread to caller instead of the frames iterating it'''
+        local = self._local
+        while True:
+            outer = getattr(local, 'listing', None)
+            local.listing = caller
+            try:
+                entity = next(entities)
+            except StopIteration:
+                return
+            finally:
+                local.listing = outer
+            yield entity
+
+    def record(self, sql, seconds, rows, caller):
+        '''Add one statement'''
+        template = self.template(sql)
+        milliseconds = seconds * 1000
+        bucket = len(BUCKETS)
+        for index, bound in enumerate(BUCKETS):
+            if milliseconds <= bound:
+                bucket = index
+                break
+        with self._lock:
+            stats = self._templates.get(template)
+            if stats is None:
+                stats = self._templates[template] = _Template()
+            stats.count += 1
+            stats.total += seconds
+            if seconds > stats.max:
+                stats.max = seconds
+            stats.rows += rows
+            stats.histogram[bucket] += 1
+            stats.callers[caller] = stats.callers.get(caller, 0) + 1
+
+        operation = getattr(self._local, 'operation', None)
+        if operation is not None:
+            counts = operation['counts']
+            counts[template] = counts.get(template, 0) + 1
+            operation['callers'].setdefault(template, set()).add(caller)
+
+        if self._hooks:
+            event = QueryEvent(
+                template,
+                sql,
+                seconds,
+                rows,
+                caller,
+                operation and operation['name']
+            )
+            for hook in self._hooks:
+                hook(event)
+
+    def operation(self, name):
+        '''Context manager marking one logical operation in this thread.
+        Templates run threshold times or more inside it are reported by
+        n_plus_one(). Nested operations join the outer one.'''
+        return _Operation(self, name)
+
+    def _finish(self, operation):
+        found = [
+            NPlusOne(
+                operation['name'],
+                template,
+                count,
+                sorted(operation['callers'][template], key=str)
+            )
+            for template, count in operation['counts'].items()
+            if count >= self.threshold
+        ]
+        if found:
+            found.sort(key=lambda entry: -entry.count)
+            with self._lock:
+                self._n_plus_one.extend(found)
+
+    def n_plus_one(self):
+        '''Return list of NPlusOne found in finished operations'''
+        with self._lock:
+            return list(self._n_plus_one)
+
+    def snapshot(self):
+        '''Return dict of template: TemplateStats'''
+        with self._lock:
+            return dict(
+                (template, TemplateStats(
+                    template,
+                    stats.count,
+                    stats.total,
+                    stats.max,
+                    stats.rows,
+                    list(stats.histogram),
+                    dict(stats.callers)
+                ))
+                for template, stats in self._templates.items()
+            )
+
+    def reset(self):
+        with self._lock:
+            self._templates = {}
+            self._n_plus_one = []
+
+    def report(self, limit=20):
+        '''Return text report of the templates taking most time and the
+        N+1 patterns found'''
+        lines = ['%8s %10s %9s %9s %9s  %s' % (
+            'count', 'total ms', 'avg ms', 'max ms', 'rows', 'template'
+        )]
+        templates = sorted(
+            self.snapshot().values(),
+            key=lambda stats: -stats.total
+        )
+        for stats in templates[:limit]:
+            caller = max(stats.callers.items(), key=lambda item: item[1])[0]
+            lines.append('%8d %10.1f %9.3f %9.3f %9d  %s [%s]' % (
+                stats.count,
+                stats.total * 1000,
+                stats.total * 1000 / stats.count,
+                stats.max * 1000,
+                stats.rows,
+                stats.template[:100],
+                caller,
+            ))
+        for entry in self.n_plus_one():
+            lines.append('N+1 in %s: %d x %s [%s]' % (
+                entry.operation,
+                entry.count,
+                entry.template[:100],
+                ', '.join(str(caller) for caller in entry.callers),
+            ))
+        return '\n'.join(lines)
+
+class _Operation(object):
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+        self.outer = False
+
+    def __enter__(self):
+        local = self.stats._local
+        if getattr(local, 'operation', None) is None:
+            local.operation = {'name': self.name, 'counts': {}, 'callers': {}}
+            self.outer = True
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.outer:
+            local = self.stats._local
+            operation, local.operation = local.operation, None
+            self.stats._finish(operation)
+
+class InstrumentedCursor(object):
+    '''DB-API cursor wrapper recording each statement when the next one
+    starts or the cursor is closed, so fetch time and rows are included'''
+
+    def __init__(self, cursor, stats):
+        self._cursor = cursor
+        self._stats = stats
+        self._pending = None
+
+    def _start(self, sql, rows=0):
+        self._done()
+        self._pending = [
+            sql,
+            time.time(),
+            rows,
+            getattr(self._stats._local, 'listing', None)
+            or self._stats.caller(sys._getframe(2)),
+        ]
+
+    def _done(self):
+        pending = self._pending
+        if pending is None:
+            return
+        self._pending = None
+        sql, start, rows, caller = pending
+        self._stats.record(sql, time.time() - start, rows, caller)
+
+    def _fetched(self, count):
+        if self._pending is not None:
+            self._pending[2] += count
+
+    def execute(self, sql, values=()):
+        self._start(sql)
+        ret = self._cursor.execute(sql, values)
+        rowcount = getattr(self._cursor, 'rowcount', -1)
+        if self._cursor.description is None and rowcount and rowcount > 0:
+            self._pending[2] = rowcount
+        return ret
+
+    def executemany(self, sql, seq_of_values):
+        seq_of_values = list(seq_of_values)
+        self._start(sql, len(seq_of_values))
+        return self._cursor.executemany(sql, seq_of_values)
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            self._fetched(1)
+        return row
+
+    def fetchmany(self, *args):
+        rows = self._cursor.fetchmany(*args)
+        self._fetched(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._fetched(len(rows))
+        return rows
+
+    def __iter__(self):
+        for row in self._cursor:
+            self._fetched(1)
+            yield row
+
+    def close(self):
+        self._done()
+        self._cursor.close()
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
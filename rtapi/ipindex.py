@@ -0,0 +1,246 @@
+#
+#   RTAPI
+#   In memory index of IPv4/IPv6 networks and allocations.
+#
+#   This utility is released under GPL v2
+#
+
+'''In memory index of IPv4 and IPv6 networks and allocations.
+
+Loads IPv4Network, IPv6Network, IPv4Allocation and IPv6Allocation as
+integers in four queries and answers longest prefix match, ip to owning
+object and range lookups without touching the database.
+
+    index = rt.ip_index
+    network = index.network('10.1.2.3')
+    for allocation in index.owners('10.1.2.3'):
+        print allocation.object_id, allocation.name
+'''
+
+import socket
+import struct
+import binascii
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from .index import Index
+
+IPNetworkEntry = namedtuple(
+    'IPNetworkEntry',
+    'id version first last mask name'
+)
+IPAllocationEntry = namedtuple(
+    'IPAllocationEntry',
+    'ip version object_id name type'
+)
+
+_bits = {4: 32, 6: 128}
+
+def ipv4_to_int(address):
+    return struct.unpack('!I', socket.inet_aton(address))[0]
+
+def ipv6_to_int(address):
+    return int(binascii.hexlify(socket.inet_pton(socket.AF_INET6, address)), 16)
+
+def binary_to_int(value):
+    '''Convert a binary(16) column value to int'''
+    return int(binascii.hexlify(value), 16)
+
+def int_to_ipv4(value):
+    return socket.inet_ntoa(struct.pack('!I', value))
+
+def int_to_ipv6(value):
+    return socket.inet_ntop(
+        socket.AF_INET6,
+        binascii.unhexlify('%032x' % value)
+    )
+
+def parse_address(address, version=None):
+    '''Return (version, int) for an address string, or for an int when
+    version is given'''
+    if version is not None:
+        return version, int(address)
+    if ':' in address:
+        return 6, ipv6_to_int(address)
+    return 4, ipv4_to_int(address)
+
+def format_address(version, value):
+    if version == 4:
+        return int_to_ipv4(value)
+    return int_to_ipv6(value)
+
+class IPIndex(Index):
+    '''Prefix index over all networks and allocations of a Racktables
+    database. Call refresh() to reload it or update() to apply a
+    ChangeSet.'''
+
+    def _load(self):
+        '''Load networks and allocations from the database'''
+        networks = {4: {}, 6: {}}
+        prefixes = {4: {}, 6: {}}
+        for net_id, ip, mask, name in self.rt.db_query_all(
+            'select id, ip, mask, name from IPv4Network'
+        ):
+            self._add_network(networks, prefixes, 4, net_id, int(ip), mask, name)
+        for net_id, ip, mask, name in self.rt.db_query_all(
+            'select id, ip, mask, name from IPv6Network'
+        ):
+            self._add_network(
+                networks,
+                prefixes,
+                6,
+                net_id,
+                binary_to_int(ip),
+                mask,
+                name
+            )
+
+        owners = {4: {}, 6: {}}
+        by_object = {}
+        for entry in self._read_allocations():
+            owners[entry.version].setdefault(entry.ip, []).append(entry)
+            by_object.setdefault(entry.object_id, []).append(entry)
+
+        ret = {
+            '_networks': networks,
+            '_prefixes': prefixes,
+            '_masks': dict(
+                (version, sorted(prefixes[version], reverse=True))
+                for version in prefixes
+            ),
+        }
+        ret.update(self._allocations(owners, by_object))
+        return ret
+
+    def _read_allocations(self, object_ids=None):
+        '''Yield IPAllocationEntry of every allocation, or of the objects
+        in object_ids'''
+        for version, table, to_int in (
+            (4, 'IPv4Allocation', int),
+            (6, 'IPv6Allocation', binary_to_int),
+        ):
+            sql = 'select object_id, ip, name, type from %s' % table
+            if object_ids is None:
+                rows = self.rt.db_query_all(sql)
+            else:
+                rows = self.rt.db_query_chunked(
+                    sql + ' where object_id in (%s)',
+                    object_ids
+                )
+            for object_id, ip, name, alloc_type in rows:
+                yield IPAllocationEntry(
+                    to_int(ip),
+                    version,
+                    object_id,
+                    name,
+                    alloc_type
+                )
+
+    def _allocations(self, owners, by_object):
+        return {
+            '_owners': owners,
+            '_by_object': by_object,
+            '_sorted_ips': dict(
+                (version, sorted(owners[version])) for version in owners
+            ),
+        }
+
+    def update(self, changes):
+        '''Apply a ChangeSet. A change of the networks reloads the index,
+        a change of the allocations only reads those of the changed
+        objects.'''
+        tables = changes.tables
+        if tables.intersection(('IPv4Network', 'IPv6Network')):
+            self.refresh()
+            return
+        if not tables.intersection(('IPv4Allocation', 'IPv6Allocation')):
+            return
+        # Copy what is changed, readers keep the lists they got
+        owners = dict(
+            (version, dict(self._owners[version])) for version in self._owners
+        )
+        by_object = dict(self._by_object)
+        for object_id in changes.objects:
+            for entry in by_object.pop(object_id, ()):
+                remaining = [
+                    other for other in owners[entry.version][entry.ip]
+                    if other.object_id != object_id
+                ]
+                if remaining:
+                    owners[entry.version][entry.ip] = remaining
+                else:
+                    del owners[entry.version][entry.ip]
+        for entry in self._read_allocations(changes.objects):
+            owners[entry.version][entry.ip] = \
+                owners[entry.version].get(entry.ip, []) + [entry]
+            by_object.setdefault(entry.object_id, []).append(entry)
+        self.__dict__.update(self._allocations(owners, by_object))
+
+    def _add_network(self, networks, prefixes, version, net_id, ip, mask, name):
+        host_bits = _bits[version] - mask
+        first = (ip >> host_bits) << host_bits
+        last = first | ((1 << host_bits) - 1)
+        entry = IPNetworkEntry(net_id, version, first, last, mask, name)
+        networks[version][net_id] = entry
+        prefixes[version].setdefault(mask, {})[first >> host_bits] = entry
+
+    def network(self, address, version=None):
+        '''Return the most specific IPNetworkEntry containing address, or
+        None'''
+        for entry in self._containing(address, version):
+            return entry
+        return None
+
+    def networks(self, address, version=None):
+        '''Return every network containing address, most specific first'''
+        return list(self._containing(address, version))
+
+    def _containing(self, address, version):
+        version, ip = parse_address(address, version)
+        bits = _bits[version]
+        prefixes = self._prefixes[version]
+        for mask in self._masks[version]:
+            entry = prefixes[mask].get(ip >> (bits - mask))
+            if entry is not None:
+                yield entry
+
+    def get_network(self, net_id, version=4):
+        '''Return IPNetworkEntry by network id'''
+        return self._networks[version].get(net_id)
+
+    def owners(self, address, version=None):
+        '''Return list of IPAllocationEntry for address'''
+        version, ip = parse_address(address, version)
+        return list(self._owners[version].get(ip, ()))
+
+    def allocations(self, first, last, version=None):
+        '''Return every IPAllocationEntry from first to last address,
+        inclusive, ordered by ip'''
+        last_version, last = parse_address(last, version)
+        version, first = parse_address(first, version)
+        if version != last_version:
+            raise ValueError('first and last must be the same IP version')
+        sorted_ips = self._sorted_ips[version]
+        owners = self._owners[version]
+        ret = []
+        start = bisect_left(sorted_ips, first)
+        end = bisect_right(sorted_ips, last)
+        for ip in sorted_ips[start:end]:
+            ret.extend(owners[ip])
+        return ret
+
+    def network_allocations(self, net_id, version=4):
+        '''Return every IPAllocationEntry inside a network'''
+        entry = self._networks[version][net_id]
+        return self.allocations(entry.first, entry.last, version)
+
+    def object_allocations(self, object_id):
+        '''Return list of IPAllocationEntry allocated to object_id'''
+        return list(self._by_object.get(object_id, ()))
+
+    def object_networks(self, object_id):
+        '''Return the most specific network of every address allocated to
+        object_id as a list of (IPAllocationEntry, IPNetworkEntry)'''
+        return [
+            (allocation, self.network(allocation.ip, allocation.version))
+            for allocation in self._by_object.get(object_id, ())
+        ]
@@ -0,0 +1,198 @@
+#
+#   RTAPI
+#   In memory occupancy bitmaps of all racks.
+#
+#   This utility is released under GPL v2
+#
+
+'''In memory occupancy of every rack.
+
+Loads rack and RackSpace in two queries into one byte per unit and rack,
+with a bit for each of the front, interior and rear atom. Free space
+searches, utilization and object positions are then answered without
+touching the database.
+
+    space = rt.rack_space
+    for rack_id, units in space.find_free(4, ('front', 'interior'),
+                                          location_id=location_id):
+        print rack_id, units
+'''
+
+import re
+from collections import namedtuple
+from .index import Index
+
+ATOMS = ('front', 'interior', 'rear')
+_atom_bits = {'front': 1, 'interior': 2, 'rear': 4}
+
+RackUsage = namedtuple('RackUsage', 'taken unusable total fill')
+ObjectPosition = namedtuple('ObjectPosition', 'rack_id unit_no atoms')
+
+def _atom_mask(atoms):
+    mask = 0
+    for atom in atoms:
+        mask |= _atom_bits[atom]
+    return mask
+
+def _usage(taken, unusable, total):
+    usable = total - unusable
+    if usable > 0:
+        fill = taken * 100.0 / usable
+    else:
+        fill = 0.0
+    return RackUsage(taken, unusable, total, fill)
+
+class RackSpaceIndex(Index):
+    '''Occupancy of all racks as one bytearray per rack, indexed by
+    unit_no - 1. An atom with any RackSpace row counts as occupied, only
+    state T counts as taken for utilization and U and A as unusable. Call
+    refresh() to reload it.'''
+
+    def __init__(self, rt):
+        self._tables = {}
+        self._patterns = {}
+        Index.__init__(self, rt)
+
+    def _load(self):
+        '''Load racks and rack space from the database'''
+        racks = dict((rack.id, rack) for rack in self.rt.Racks(records=True))
+        occupied = dict(
+            (rack.id, bytearray(rack.height or 0)) for rack in racks.values()
+        )
+        taken = dict.fromkeys(racks, 0)
+        unusable = dict.fromkeys(racks, 0)
+        objects = {}
+        for rack_id, unit_no, atom, state, object_id in self.rt.db_query_all(
+            'select rack_id, unit_no, atom, state, object_id from RackSpace'
+        ):
+            units = occupied.get(rack_id)
+            if units is None or not 0 < unit_no <= len(units):
+                # Rack space outside of any known rack
+                continue
+            units[unit_no - 1] |= _atom_bits[atom]
+            if state == 'T':
+                taken[rack_id] += 1
+            elif state in ('U', 'A'):
+                unusable[rack_id] += 1
+            if object_id is not None:
+                positions = objects.setdefault(object_id, {})
+                key = (rack_id, unit_no)
+                positions[key] = positions.get(key, 0) | _atom_bits[atom]
+
+        return {
+            '_racks': racks,
+            '_occupied': occupied,
+            '_taken': taken,
+            '_unusable': unusable,
+            '_objects': objects,
+        }
+
+    def _table(self, mask):
+        '''Translation table of a byte to 0 if all atoms in mask are free
+        and 1 otherwise'''
+        table = self._tables.get(mask)
+        if table is None:
+            table = bytes(bytearray(
+                0 if not value & mask else 1 for value in range(256)
+            ))
+            self._tables[mask] = table
+        return table
+
+    def _pattern(self, units):
+        pattern = self._patterns.get(units)
+        if pattern is None:
+            pattern = re.compile(b'(?=\x00{' + str(units).encode('ascii') + b'})')
+            self._patterns[units] = pattern
+        return pattern
+
+    def units(self, rack_id):
+        '''Return list of occupied atoms per unit of rack_id, unit 1
+        first'''
+        return [
+            tuple(atom for atom in ATOMS if value & _atom_bits[atom])
+            for value in self._occupied[rack_id]
+        ]
+
+    def free_space(self, rack_id, units, atoms=ATOMS):
+        '''Return list of every unit_no where units contiguous units are
+        free in all of atoms, lowest first'''
+        free = self._occupied[rack_id].translate(self._table(_atom_mask(atoms)))
+        return [
+            match.start() + 1 for match in self._pattern(units).finditer(free)
+        ]
+
+    def find_free(self, units, atoms=ATOMS, location_id=None, row_id=None,
+                  rack_ids=None):
+        '''Return list of (rack_id, list of unit_no) of racks with units
+        contiguous free units in all of atoms. Searches racks under
+        location_id, racks in row_id, rack_ids or all racks.'''
+        if location_id is not None:
+            rack_ids = [rack.id for rack in self.rt.location_tree.racks(location_id)]
+        elif row_id is not None:
+            rack_ids = [rack.id for rack in self.rt.location_tree.row_racks(row_id)]
+        elif rack_ids is None:
+            rack_ids = sorted(self._racks)
+        table = self._table(_atom_mask(atoms))
+        pattern = self._pattern(units)
+        ret = []
+        for rack_id in rack_ids:
+            occupied = self._occupied.get(rack_id)
+            if occupied is None:
+                continue
+            starts = [
+                match.start() + 1
+                for match in pattern.finditer(occupied.translate(table))
+            ]
+            if starts:
+                ret.append((rack_id, starts))
+        return ret
+
+    def usage(self, rack_id):
+        '''Return RackUsage of rack_id counted in atoms'''
+        return _usage(
+            self._taken[rack_id],
+            self._unusable[rack_id],
+            len(self._occupied[rack_id]) * len(ATOMS)
+        )
+
+    def _sum_usage(self, rack_ids):
+        taken = unusable = total = 0
+        for rack_id in rack_ids:
+            if rack_id not in self._occupied:
+                continue
+            taken += self._taken[rack_id]
+            unusable += self._unusable[rack_id]
+            total += len(self._occupied[rack_id]) * len(ATOMS)
+        return _usage(taken, unusable, total)
+
+    def row_usage(self, row_id):
+        '''Return RackUsage summed over the racks of row_id'''
+        return self._sum_usage(
+            rack.id for rack in self.rt.location_tree.row_racks(row_id)
+        )
+
+    def location_usage(self, location_id):
+        '''Return RackUsage summed over every rack under location_id'''
+        return self._sum_usage(
+            rack.id for rack in self.rt.location_tree.racks(location_id)
+        )
+
+    def object_positions(self, object_id):
+        '''Return list of ObjectPosition of object_id ordered by rack and
+        unit'''
+        return [
+            ObjectPosition(
+                rack_id,
+                unit_no,
+                tuple(atom for atom in ATOMS if mask & _atom_bits[atom])
+            )
+            for (rack_id, unit_no), mask in sorted(
+                self._objects.get(object_id, {}).items()
+            )
+        ]
+
+    def object_racks(self, object_id):
+        '''Return sorted list of rack ids object_id is mounted in'''
+        return sorted(set(
+            rack_id for rack_id, unit_no in self._objects.get(object_id, ())
+        ))
@@ -0,0 +1,161 @@
+#
+#   RTAPI
+#   Reports computed over whole tables.
+#
+#   This utility is released under GPL v2
+#
+
+'''Reports computed over whole tables at once. Needs numpy.
+
+    report = rt.IPv4Utilization()
+    for row in report.rows():
+        print row.id, row.used, row.free, row.fill
+'''
+
+from collections import namedtuple
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+UtilizationRow = namedtuple(
+    'UtilizationRow',
+    'id first last mask size used free fill direct_size direct_used'
+)
+
+def _require_numpy():
+    if numpy is None:
+        raise ImportError('numpy is required for utilization reports')
+
+class UtilizationReport(object):
+    '''Used and free address counts of every network, held as numpy arrays
+    indexed in the same order as ids.
+
+    size, used, free and fill cover the whole network including nested
+    networks. direct_size and direct_used leave out addresses that belong
+    to a more specific network, so nested networks are not counted twice
+    when summing.'''
+
+    def __init__(self, ids, first, last, mask, size, used, direct_size,
+                 direct_used, parent):
+        self.ids = ids
+        self.first = first
+        self.last = last
+        self.mask = mask
+        self.size = size
+        self.used = used
+        self.free = size - used
+        self.fill = used * 100.0 / size
+        self.direct_size = direct_size
+        self.direct_used = direct_used
+        self.parent = parent
+        self._index = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def row(self, net_id):
+        '''Return UtilizationRow of one network id'''
+        if self._index is None:
+            self._index = dict(
+                (int(net_id), index) for index, net_id in enumerate(self.ids)
+            )
+        return self._row(self._index[net_id])
+
+    def _row(self, index):
+        return UtilizationRow(
+            int(self.ids[index]),
+            int(self.first[index]),
+            int(self.last[index]),
+            int(self.mask[index]),
+            int(self.size[index]),
+            int(self.used[index]),
+            int(self.free[index]),
+            float(self.fill[index]),
+            int(self.direct_size[index]),
+            int(self.direct_used[index]),
+        )
+
+    def rows(self):
+        '''Yield UtilizationRow for every network'''
+        for index in range(len(self.ids)):
+            yield self._row(index)
+
+def compute_utilization(ids, ips, masks, used_ips):
+    '''Compute an UtilizationReport from network ids, network addresses and
+    mask lengths and the used addresses, all as integer sequences'''
+    _require_numpy()
+    ids = numpy.asarray(ids, dtype=numpy.int64)
+    masks = numpy.asarray(masks, dtype=numpy.int64)
+    host_bits = 32 - masks
+    first = (numpy.asarray(ips, dtype=numpy.int64) >> host_bits) << host_bits
+    size = numpy.left_shift(numpy.int64(1), host_bits)
+    last = first + size - 1
+    used_ips = numpy.sort(numpy.asarray(used_ips, dtype=numpy.int64))
+    if len(used_ips):
+        # Shared addresses are listed once per object, count them once
+        used_ips = used_ips[numpy.concatenate(
+            ([True], used_ips[1:] != used_ips[:-1])
+        )]
+
+    used = (
+        numpy.searchsorted(used_ips, last, side='right') -
+        numpy.searchsorted(used_ips, first, side='left')
+    )
+
+    # Networks never overlap partially, so ordered by address and then by
+    # mask every network comes right after its enclosing networks and a
+    # stack of open networks gives the direct parent.
+    order = numpy.lexsort((masks, first))
+    parent = numpy.full(len(ids), -1, dtype=numpy.int64)
+    stack = []
+    order_first = first[order].tolist()
+    order_last = last[order].tolist()
+    for position, index in enumerate(order.tolist()):
+        while stack and order_last[stack[-1][0]] < order_first[position]:
+            stack.pop()
+        if stack:
+            parent[index] = stack[-1][1]
+        stack.append((position, index))
+
+    nested = parent >= 0
+    direct_size = size - numpy.bincount(
+        parent[nested],
+        weights=size[nested],
+        minlength=len(ids)
+    ).astype(numpy.int64)
+    direct_used = used - numpy.bincount(
+        parent[nested],
+        weights=used[nested],
+        minlength=len(ids)
+    ).astype(numpy.int64)
+
+    return UtilizationReport(
+        ids,
+        first,
+        last,
+        masks,
+        size,
+        used,
+        direct_size,
+        direct_used,
+        parent
+    )
+
+def ipv4_utilization(rt, include_reserved=True):
+    '''Return UtilizationReport of every IPv4Network. Allocated addresses
+    count as used, and so do reserved ones unless include_reserved is
+    False.'''
+    _require_numpy()
+    networks = rt.db_query_all('select id, ip, mask from IPv4Network')
+    ids = numpy.fromiter((row[0] for row in networks), numpy.int64, len(networks))
+    ips = numpy.fromiter((row[1] for row in networks), numpy.int64, len(networks))
+    masks = numpy.fromiter((row[2] for row in networks), numpy.int64, len(networks))
+
+    sql = 'select distinct ip from IPv4Allocation'
+    if include_reserved:
+        sql += " union select ip from IPv4Address where reserved = 'yes'"
+    rows = rt.db_query_all(sql)
+    used_ips = numpy.fromiter((row[0] for row in rows), numpy.int64, len(rows))
+    return compute_utilization(ids, ips, masks, used_ips)
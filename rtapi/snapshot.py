@@ -0,0 +1,249 @@
+#
+#   RTAPI
+#   Read only snapshots of a Racktables database in a local SQLite file.
+#
+#   This utility is released under GPL v2
+#
+
+'''Export the tables read by the API into a local SQLite file and serve
+the read API from it.
+
+Consumers which only read, like dashboards and inventory scripts, can
+work from a snapshot instead of the live database. The file is written
+next to its final path and renamed into place when complete, so readers
+never see half a snapshot.
+
+    rt.Snapshot('/var/cache/racktables.db')
+
+    snap = rtapi.snapshot.open_snapshot('/var/cache/racktables.db')
+    for obj in snap.Objects():
+        print obj.name
+'''
+
+import os
+import decimal
+import sqlite3
+import datetime
+import functools
+from . import sqlitedb
+
+# Tables and views the API reads, exported as plain tables
+SNAPSHOT_TABLES = (
+    'Object',
+    'Attribute',
+    'AttributeValue',
+    'Chapter',
+    'Dictionary',
+    'Port',
+    'PortOuterInterface',
+    'Link',
+    'IPv4Network',
+    'IPv4Allocation',
+    'IPv4Address',
+    'IPv6Network',
+    'IPv6Allocation',
+    'EntityLink',
+    'TagTree',
+    'TagStorage',
+    'location',
+    'row',
+    'rack',
+    'rackobject',
+    'RackSpace',
+    'VLANIPv4',
+    'VLANDescription',
+)
+
+# Columns indexed in the snapshot, created after the rows are written
+SNAPSHOT_INDEXES = {
+    'Object': ('id', 'name'),
+    'Attribute': ('id',),
+    'AttributeValue': ('object_id', 'attr_id'),
+    'Dictionary': ('dict_key', 'chapter_id'),
+    'Port': ('id', 'object_id'),
+    'Link': ('porta', 'portb'),
+    'IPv4Network': ('id', 'ip'),
+    'IPv4Allocation': ('object_id', 'ip'),
+    'IPv4Address': ('ip',),
+    'IPv6Network': ('id',),
+    'IPv6Allocation': ('object_id', 'ip'),
+    'EntityLink': ('parent_entity_id', 'child_entity_id'),
+    'TagTree': ('id',),
+    'TagStorage': ('entity_id', 'tag_id'),
+    'location': ('id', 'parent_id'),
+    'row': ('id',),
+    'rack': ('id',),
+    'rackobject': ('id',),
+    'RackSpace': ('rack_id', 'object_id'),
+    'VLANIPv4': ('ipv4net_id', 'vlan_id'),
+    'VLANDescription': ('vlan_id',),
+}
+
+# Unique key of each table, rows are read in pages ordered by it so memory 
+# use stays flat whatever the driver buffers. Tables not listed use id. A 
+# key which is not unique loses rows at page boundaries, export_snapshot 
+# fails when the row count does not match.
+SNAPSHOT_KEYS = {
+    'AttributeValue': ('object_id', 'attr_id'),
+    'Dictionary': ('dict_key',),
+    'Link': ('porta', 'portb'),
+    'IPv4Allocation': ('object_id', 'ip'),
+    'IPv4Address': ('ip',),
+    'IPv6Allocation': ('object_id', 'ip'),
+    'TagStorage': ('entity_realm', 'entity_id', 'tag_id'),
+    'RackSpace': ('rack_id', 'unit_no', 'atom'),
+    'VLANIPv4': ('ipv4net_id', 'domain_id', 'vlan_id'),
+    'VLANDescription': ('domain_id', 'vlan_id'),
+}
+
+# binary(16) columns, stored as blobs so UNHEX() comparisons still match
+_binary_columns = set([
+    ('IPv6Network', 'ip'),
+    ('IPv6Network', 'last_ip'),
+    ('IPv6Allocation', 'ip'),
+])
+
+def _value(value):
+    if isinstance(value, datetime.datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, datetime.date):
+        return value.strftime('%Y-%m-%d')
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    return value
+
+def _binary(value):
+    if value is None:
+        return None
+    return sqlite3.Binary(bytes(value))
+
+def export_snapshot(rt, path, tables=SNAPSHOT_TABLES):
+    '''Copy tables from the database of rt into a new SQLite file at path,
+    replacing any earlier snapshot there. Rows are read in keyset pages 
+    of rt.page_size or rt.chunk_size rows, all in one transaction so on 
+    InnoDB the tables are read as of the same moment. Returns dict of 
+    table: row count. Raises ValueError if the rows exported from a table 
+    do not match its count(*), which happens when its SNAPSHOT_KEYS entry 
+    is not unique.'''
+    tmp_path = '%s.tmp' % path
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    counts = {}
+    try:
+        conn.execute('PRAGMA journal_mode = OFF')
+        conn.execute('PRAGMA synchronous = OFF')
+        conn.execute('create table _snapshot (key text primary key, value text)')
+        with rt.transaction():
+            for table in tables:
+                counts[table] = _export_table(rt, conn, table)
+        for table in tables:
+            for column in SNAPSHOT_INDEXES.get(table, ()):
+                conn.execute('create index "%s_%s" on "%s" ("%s")' % (
+                    table,
+                    column,
+                    table,
+                    column
+                ))
+        conn.executemany('insert into _snapshot values (?, ?)', [
+            ('created', datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')),
+            ('tables', ','.join(tables)),
+        ])
+        conn.commit()
+    except:
+        conn.close()
+        os.remove(tmp_path)
+        raise
+    conn.close()
+    os.rename(tmp_path, path)
+    return counts
+
+def _export_table(rt, conn, table):
+    key = SNAPSHOT_KEYS.get(table, ('id',))
+    order = ', '.join('`%s`' % column for column in key)
+    first_sql = 'select * from `%s` order by %s limit %%s' % (table, order)
+    next_sql = 'select * from `%s` where (%s) > (%s) order by %s limit %%s' % (
+        table,
+        order,
+        ', '.join(['%s'] * len(key)),
+        order
+    )
+    page_size = rt.page_size or rt.chunk_size
+    count = 0
+    last = None
+    insert_sql = None
+    with rt.db_cursor() as cursor:
+        while True:
+            if last is None:
+                cursor.execute(first_sql, (page_size,))
+            else:
+                cursor.execute(next_sql, tuple(last) + (page_size,))
+            rows = cursor.fetchall()
+            if insert_sql is None:
+                columns = [column[0] for column in cursor.description]
+                conn.execute('create table "%s" (%s)' % (
+                    table,
+                    ', '.join('"%s"' % column for column in columns)
+                ))
+                insert_sql = 'insert into "%s" values (%s)' % (
+                    table,
+                    ', '.join(['?'] * len(columns))
+                )
+                convert = [
+                    _binary if (table, column) in _binary_columns else _value
+                    for column in columns
+                ]
+                key_positions = [columns.index(column) for column in key]
+            conn.executemany(insert_sql, [
+                [convert[i](value) for i, value in enumerate(row)]
+                for row in rows
+            ])
+            count += len(rows)
+            if len(rows) < page_size:
+                break
+            last = [rows[-1][position] for position in key_positions]
+    total = rt.db_query_one('select count(*) from `%s`' % table)[0]
+    if count != total:
+        raise ValueError('Exported %d of %d rows of %s, key %s is not unique' % (
+            count,
+            total,
+            table,
+            ', '.join(key)
+        ))
+    return count
+
+def snapshot_info(path):
+    '''Return dict of the creation time and tables of a snapshot'''
+    conn = sqlite3.connect(path)
+    try:
+        info = dict(conn.execute('select key, value from _snapshot'))
+    finally:
+        conn.close()
+    info['tables'] = info.get('tables', '').split(',')
+    return info
+
+def connect_snapshot(path):
+    '''Return a read only sqlitedb Connection to a snapshot'''
+    if not os.path.exists(path):
+        raise IOError('No snapshot at %s' % path)
+    conn = sqlitedb.connect(path)
+    conn.executescript('''
+        PRAGMA query_only = ON;
+        PRAGMA mmap_size = 268435456;
+    ''')
+    return conn
+
+def open_snapshot(path, pool_size=None, identity_map=None):
+    '''Return a Racktables serving the read API from the snapshot at
+    path. With pool_size threads share a ConnectionPool of that many
+    connections. Writes fail since the connections are read only.'''
+    from . import Racktables, ConnectionPool
+    if pool_size:
+        connect_snapshot(path).close()
+        db = ConnectionPool(
+            functools.partial(connect_snapshot, path),
+            size=pool_size
+        )
+    else:
+        db = connect_snapshot(path)
+    return Racktables(db, identity_map)
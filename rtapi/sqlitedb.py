@@ -0,0 +1,176 @@
+#
+#   RTAPI
+#   SQLite adapter for the Racktables API.
+#
+#   This utility is released under GPL v2
+#
+
+'''Minimal DB-API driver which lets rtapi run against an SQLite database.
+
+It accepts the MySQLdb style %s parameters used throughout rtapi and
+provides the MySQL functions the API relies on (INET_NTOA, INET_ATON,
+UNHEX, NOW, CRC32, CONCAT_WS). Useful for running the API locally without a MySQL server.
+
+    import functools
+    import rtapi
+    from rtapi import sqlitedb
+
+    pool = rtapi.ConnectionPool(
+        functools.partial(sqlitedb.connect, '/tmp/racktables.db')
+    )
+    rt = rtapi.Racktables(pool)
+'''
+
+import re
+import socket
+import sqlite3
+import struct
+import datetime
+import binascii
+
+paramstyle = 'format'
+Error = sqlite3.Error
+
+_param_re = re.compile(r"'(?:[^']|'')*'|%%|%s")
+_for_update_re = re.compile(r'\s+for\s+update\s*$', re.IGNORECASE)
+
+def _translate(sql):
+    '''Convert format style parameters to qmark style, leaving string
+    literals alone'''
+    def replace(match):
+        token = match.group(0)
+        if token == '%s':
+            return '?'
+        if token == '%%':
+            return '%'
+        return token.replace('%%', '%')
+    return _param_re.sub(replace, sql)
+
+def _inet_ntoa(ip):
+    if ip is None:
+        return None
+    return socket.inet_ntoa(struct.pack('!I', int(ip)))
+
+def _inet_aton(ip):
+    if ip is None:
+        return None
+    try:
+        return struct.unpack('!I', socket.inet_aton(ip))[0]
+    except socket.error:
+        return None
+
+def _unhex(value):
+    if value is None:
+        return None
+    return sqlite3.Binary(binascii.unhexlify(value))
+
+def _crc32(value):
+    if value is None:
+        return None
+    if not isinstance(value, bytes):
+        value = ('%s' % value).encode('utf-8')
+    return binascii.crc32(value) & 0xffffffff
+
+def _concat_ws(separator, *values):
+    '''Join values which are not NULL with separator'''
+    if separator is None:
+        return None
+    return separator.join('%s' % value for value in values if value is not None)
+
+def _now():
+    return datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+def _adapt(values):
+    '''Format datetimes the way MySQL stores them'''
+    if not isinstance(values, (tuple, list)):
+        values = (values,)
+    return tuple(
+        value.strftime('%Y-%m-%d %H:%M:%S')
+        if isinstance(value, datetime.datetime) else value
+        for value in values
+    )
+
+class Cursor(object):
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, sql, values=()):
+        if _for_update_re.search(sql):
+            # SQLite has no row locks, take the database write lock instead 
+            # so the select is serialized like on MySQL
+            sql = _for_update_re.sub('', sql)
+            if not getattr(self._cursor.connection, 'in_transaction', False):
+                try:
+                    self._cursor.execute('BEGIN IMMEDIATE')
+                except sqlite3.OperationalError as e:
+                    if 'within a transaction' not in str(e):
+                        raise
+        self._cursor.execute(_translate(sql), _adapt(values))
+        return self._cursor.rowcount
+
+    def executemany(self, sql, seq_of_values):
+        self._cursor.executemany(
+            _translate(sql),
+            [_adapt(values) for values in seq_of_values]
+        )
+        return self._cursor.rowcount
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchmany(self, size=None):
+        if size is None:
+            return self._cursor.fetchmany()
+        return self._cursor.fetchmany(size)
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def close(self):
+        self._cursor.close()
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+class Connection(object):
+    def __init__(self, database=':memory:', **kwargs):
+        kwargs.setdefault('check_same_thread', False)
+        self._conn = sqlite3.connect(database, **kwargs)
+        self._conn.create_function('INET_NTOA', 1, _inet_ntoa)
+        self._conn.create_function('INET_ATON', 1, _inet_aton)
+        self._conn.create_function('UNHEX', 1, _unhex)
+        self._conn.create_function('NOW', 0, _now)
+        self._conn.create_function('CRC32', 1, _crc32)
+        self._conn.create_function('CONCAT_WS', -1, _concat_ws)
+
+    def cursor(self):
+        return Cursor(self._conn.cursor())
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        self._conn.close()
+
+    def executescript(self, sql):
+        '''Run several ; separated statements, sqlite3 extension'''
+        self._conn.executescript(sql)
+
+def connect(database=':memory:', **kwargs):
+    '''Return a new Connection to an SQLite database file'''
+    return Connection(database, **kwargs)
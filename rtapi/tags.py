@@ -0,0 +1,163 @@
+#
+#   RTAPI
+#   In memory closure of the tag tree and tag to entity index.
+#
+#   This utility is released under GPL v2
+#
+
+'''In memory closure of TagTree and inverted index of TagStorage.
+
+Loads both tables in two queries. Every tag knows its ancestors and
+descendants and every tag the entities carrying it, so implicit tags and
+tag filters are answered with set operations.
+
+    tags = rt.tag_index
+    for object_id in tags.select(match_all=['prod', 'web']):
+        print object_id
+'''
+
+from .index import Index, tree_paths
+
+try:
+    string_types = (str, unicode)
+except NameError:
+    string_types = (str,)
+
+class TagIndex(Index):
+    '''Tag tree and tagged entities of a Racktables database. Tags are
+    given by id or by name and returned as TagRecord tuples. Entities are
+    looked up in one realm, like 'object' or 'rack'. Call refresh() to
+    reload it or update() to apply a ChangeSet.'''
+
+    def _load(self):
+        '''Load the tag tree and tag storage from the database'''
+        from . import TagRecord
+        tags = dict(
+            (row[0], TagRecord._make(row)) for row in self.rt.db_query_all(
+                'select id, parent_id, tag from TagTree'
+            )
+        )
+        names = dict((tag.tag, tag.id) for tag in tags.values())
+        children = {}
+        for tag in tags.values():
+            if tag.parent_id in tags:
+                children.setdefault(tag.parent_id, []).append(tag.id)
+
+        # Tags in a parent_id loop get no ancestors
+        paths = tree_paths(
+            [tag.id for tag in tags.values() if tag.parent_id not in tags],
+            children
+        )
+
+        descendants = dict((tag_id, set()) for tag_id in tags)
+        for tag_id, path in paths.items():
+            for ancestor_id in path:
+                descendants[ancestor_id].add(tag_id)
+
+        ret = {
+            '_tags': tags,
+            '_names': names,
+            '_paths': paths,
+            '_descendants': descendants,
+        }
+        ret.update(self._load_storage())
+        return ret
+
+    def _load_storage(self):
+        '''Load the tags of every entity from the database'''
+        entities = {}
+        entity_tags = {}
+        for realm, entity_id, tag_id in self.rt.db_query_all(
+            'select entity_realm, entity_id, tag_id from TagStorage'
+        ):
+            entities.setdefault((realm, tag_id), set()).add(entity_id)
+            entity_tags.setdefault((realm, entity_id), set()).add(tag_id)
+        return {
+            '_entities': entities,
+            '_entity_tags': entity_tags,
+            '_expanded': {},
+        }
+
+    def update(self, changes):
+        '''Apply a ChangeSet. Only TagStorage is read again when the tag
+        tree did not change.'''
+        if 'TagTree' in changes.tables:
+            self.refresh()
+        elif 'TagStorage' in changes.tables:
+            self.__dict__.update(self._load_storage())
+
+    def _tag_id(self, tag):
+        if isinstance(tag, string_types):
+            return self._names.get(tag)
+        return tag
+
+    def tag(self, tag):
+        '''Return TagRecord by id or name, or None'''
+        return self._tags.get(self._tag_id(tag))
+
+    def ancestors(self, tag):
+        '''Return list of the ancestors of tag, root first'''
+        path = self._paths.get(self._tag_id(tag), ())
+        return [self._tags[tag_id] for tag_id in path[:-1]]
+
+    def descendants(self, tag):
+        '''Return list of every tag under tag'''
+        tag_id = self._tag_id(tag)
+        return [
+            self._tags[descendant_id]
+            for descendant_id in sorted(self._descendants.get(tag_id, ()))
+            if descendant_id != tag_id
+        ]
+
+    def entity_tags(self, entity_id, realm='object', implicit=False):
+        '''Return list of tags of an entity. With implicit the ancestors
+        of its tags are included, like RackTables shows them.'''
+        tag_ids = set(self._entity_tags.get((realm, entity_id), ()))
+        if implicit:
+            for tag_id in list(tag_ids):
+                tag_ids.update(self._paths.get(tag_id, ()))
+        return [self._tags[tag_id] for tag_id in sorted(tag_ids)]
+
+    def entities(self, tag, realm='object', descendants=True):
+        '''Return set of ids of entities in realm carrying tag, or with
+        descendants any tag under it'''
+        tag_id = self._tag_id(tag)
+        if not descendants:
+            return set(self._entities.get((realm, tag_id), ()))
+        key = (realm, tag_id)
+        ret = self._expanded.get(key)
+        if ret is None:
+            ret = set()
+            for descendant_id in self._descendants.get(tag_id, (tag_id,)):
+                ret.update(self._entities.get((realm, descendant_id), ()))
+            self._expanded[key] = ret
+        return set(ret)
+
+    def select(self, match_all=(), match_any=(), exclude=(), realm='object',
+               descendants=True):
+        '''Return set of ids of entities in realm carrying every tag in
+        match_all, at least one tag in match_any and none of exclude.
+        With descendants a tag also matches every tag under it.'''
+        ret = None
+        for tag in match_all:
+            matched = self.entities(tag, realm, descendants)
+            if ret is None:
+                ret = matched
+            else:
+                ret &= matched
+        if match_any:
+            matched = set()
+            for tag in match_any:
+                matched |= self.entities(tag, realm, descendants)
+            if ret is None:
+                ret = matched
+            else:
+                ret &= matched
+        if ret is None:
+            ret = set(
+                entity_id for entity_realm, entity_id in self._entity_tags
+                if entity_realm == realm
+            )
+        for tag in exclude:
+            ret -= self.entities(tag, realm, descendants)
+        return ret
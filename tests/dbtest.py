@@ -0,0 +1,166 @@
+#
+#   RTAPI
+#   Test database for running the API on rtapi.sqlitedb.
+#
+#   This utility is released under GPL v2
+#
+
+'''Small Racktables schema in an SQLite file, shared by the tests.
+
+    python -m unittest discover tests
+'''
+
+import os
+import shutil
+import socket
+import struct
+import sqlite3
+import tempfile
+import functools
+import unittest
+
+import rtapi
+from rtapi import sqlitedb
+
+SCHEMA = '''
+create table Object (id integer primary key, name text, label text, objtype_id int, asset_no text, has_problems text default 'no', comment text);
+create table ObjectLog (id integer primary key, object_id int, user text, date text, content text);
+create table Chapter (id integer primary key, sticky text, name text);
+create table Dictionary (dict_key integer primary key, chapter_id int, dict_sticky text, dict_value text);
+create table Attribute (id integer primary key, type text, name text);
+create table AttributeMap (objtype_id int, attr_id int, chapter_id int);
+create table AttributeValue (object_id int, object_tid int, attr_id int, string_value text, uint_value int, float_value real, primary key (object_id, attr_id));
+create table PortOuterInterface (id integer primary key, oif_name text);
+create table Port (id integer primary key, object_id int, name text, iif_id int, type int, l2address text, reservation_comment text, label text, unique (object_id, name, type));
+create table Link (porta int, portb int, cable text, primary key (porta, portb));
+create table IPv4Network (id integer primary key, ip int, mask int, name text, comment text);
+create table IPv4Allocation (object_id int, ip int, name text, type text default 'regular', primary key (object_id, ip));
+create table IPv4Address (ip integer primary key, name text, comment text, reserved text default 'no');
+create table IPv6Network (id integer primary key, ip blob, mask int, last_ip blob, name text, comment text);
+create table IPv6Allocation (object_id int, ip blob, name text, type text default 'regular', primary key (object_id, ip));
+create table EntityLink (id integer primary key, parent_entity_type text, parent_entity_id int, child_entity_type text, child_entity_id int);
+create table TagTree (id integer primary key, parent_id int, is_assignable text default 'yes', tag text);
+create table TagStorage (entity_realm text default 'object', entity_id int, tag_id int, user text, date text);
+create table RackSpace (rack_id int, unit_no int, atom text, state text, object_id int);
+create table VLANIPv4 (domain_id int, vlan_id int, ipv4net_id int);
+create table VLANDescription (domain_id int, vlan_id int, vlan_type text, vlan_descr text);
+create table location (id integer primary key, name text, has_problems text, comment text, parent_id int, parent_name text);
+create table row (id integer primary key, name text, location_id int, location_name text);
+create table rack (id integer primary key, name text, asset_no text, has_problems text, comment text, height int, sort_order int, row_id int, row_name text, location_id int, location_name text);
+create view rackobject as select id, name, label, objtype_id, asset_no, has_problems, comment from Object where objtype_id not in (1560, 1561, 1562);
+
+insert into Chapter values (1, 'yes', 'ObjectType');
+insert into Dictionary values (4, 1, 'yes', 'Server');
+insert into Dictionary values (8, 1, 'yes', 'Network switch');
+insert into Dictionary values (1504, 1, 'yes', 'VM');
+insert into Dictionary values (1505, 1, 'yes', 'VM Cluster');
+insert into Attribute values (3, 'string', 'FQDN');
+insert into Attribute values (17, 'uint', 'RAM');
+insert into Attribute values (28, 'string', 'Slot number');
+insert into PortOuterInterface values (24, '1000Base-T');
+insert into TagTree values (1, null, 'yes', 'prod');
+insert into TagTree values (2, 1, 'yes', 'web');
+insert into location values (1, 'DC1', 'no', null, null, null);
+insert into location values (2, 'Hall A', 'no', null, 1, 'DC1');
+insert into row values (10, 'Row 1', 2, 'Hall A');
+insert into rack values (100, 'R1', null, 'no', null, 10, 1, 10, 'Row 1', 2, 'Hall A');
+insert into Object (id, name, objtype_id) values (100, 'switch1', 8);
+insert into Object (id, name, objtype_id) values (200, 'cluster1', 1505);
+'''
+
+def ipv4_to_int(ip):
+    return struct.unpack('!I', socket.inet_aton(ip))[0]
+
+def create_database(path, objects=10):
+    '''Create the schema at path with objects servers. Each has an FQDN
+    and RAM attribute, a port eth0 linked to a port of switch1, the
+    address 10.0.0.<id> in network 10.0.0.0/24 and the tag prod. Servers
+    1 to 3 are in cluster1 and server 1 fills units 1 and 2 of rack R1.'''
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    conn.execute(
+        "insert into IPv4Network values (1, ?, 24, 'net0', null)",
+        (ipv4_to_int('10.0.0.0'),)
+    )
+    for i in range(1, objects + 1):
+        conn.execute(
+            "insert into Object (id, name, label, objtype_id, asset_no) "
+            "values (?, ?, ?, 4, ?)",
+            (i, 'srv%02d' % i, 'label%d' % i, 'A%d' % i)
+        )
+        conn.execute(
+            'insert into AttributeValue values (?, 4, 3, ?, null, null)',
+            (i, 'srv%02d.example.com' % i)
+        )
+        conn.execute(
+            'insert into AttributeValue values (?, 4, 17, null, ?, null)',
+            (i, i * 1024)
+        )
+        conn.execute(
+            "insert into Port (id, object_id, name, iif_id, type) "
+            "values (?, ?, 'eth0', 1, 24)",
+            (i, i)
+        )
+        conn.execute(
+            "insert into Port (id, object_id, name, iif_id, type) "
+            "values (?, 100, ?, 1, 24)",
+            (100 + i, 'ge-0/0/%d' % i)
+        )
+        conn.execute('insert into Link values (?, ?, null)', (i, 100 + i))
+        conn.execute(
+            "insert into IPv4Allocation values (?, ?, 'eth0', 'regular')",
+            (i, ipv4_to_int('10.0.0.%d' % i))
+        )
+        conn.execute(
+            "insert into TagStorage values ('object', ?, 1, 'admin', null)",
+            (i,)
+        )
+    for i in range(1, 4):
+        conn.execute(
+            "insert into EntityLink (parent_entity_type, parent_entity_id, "
+            "child_entity_type, child_entity_id) values ('object', 200, 'object', ?)",
+            (i,)
+        )
+    for unit_no in (1, 2):
+        for atom in ('front', 'interior', 'rear'):
+            conn.execute(
+                "insert into RackSpace values (100, ?, ?, 'T', 1)",
+                (unit_no, atom)
+            )
+    conn.commit()
+    conn.close()
+
+class DatabaseTestCase(unittest.TestCase):
+    '''Test case with a new test database at self.path and a Racktables
+    on one plain connection to it as self.rt'''
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'racktables.db')
+        create_database(self.path)
+        self.conn = sqlitedb.connect(self.path)
+        self.rt = rtapi.Racktables(self.conn)
+
+    def tearDown(self):
+        self.conn.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def connect(self):
+        '''Return a new connection to the test database'''
+        return sqlitedb.connect(self.path)
+
+    def pooled(self, size=2, timeout=None):
+        '''Return a Racktables on a ConnectionPool to the test database'''
+        return rtapi.Racktables(rtapi.ConnectionPool(
+            functools.partial(sqlitedb.connect, self.path),
+            size=size,
+            timeout=timeout
+        ))
+
+    def query(self, sql, values=()):
+        '''Read with a connection of its own, so only committed rows show'''
+        conn = sqlite3.connect(self.path)
+        try:
+            return conn.execute(sql, values).fetchall()
+        finally:
+            conn.close()
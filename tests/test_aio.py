@@ -0,0 +1,76 @@
+#
+#   RTAPI
+#   Tests of the asyncio read API on rtapi.sqlitedb.
+#
+#   This utility is released under GPL v2
+#
+
+import unittest
+
+try:
+    import asyncio
+    from rtapi import aio
+except (ImportError, SyntaxError):
+    # Python 2
+    aio = None
+
+from dbtest import DatabaseTestCase
+
+@unittest.skipIf(aio is None, 'rtapi.aio needs Python 3.7')
+class AsyncRacktablesTest(DatabaseTestCase):
+    def setUp(self):
+        DatabaseTestCase.setUp(self)
+        self.loop = asyncio.new_event_loop()
+        self.art = aio.AsyncRacktables(
+            aio.AsyncConnectionPool(self.connect, size=3)
+        )
+
+    def tearDown(self):
+        self.wait(self.art.close())
+        self.loop.close()
+        DatabaseTestCase.tearDown(self)
+
+    def wait(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    def collect(self, generator):
+        '''Return list of everything an async generator yields'''
+        ret = []
+        while True:
+            try:
+                ret.append(self.wait(generator.__anext__()))
+            except StopAsyncIteration:
+                return ret
+
+    def test_objects_pages(self):
+        objects = self.collect(self.art.Objects(page_size=4))
+        self.assertEqual(len(objects), 12)
+        self.assertEqual(objects[0].name, 'srv01')
+        self.assertEqual([obj.id for obj in objects[-2:]], [100, 200])
+        objects = self.collect(self.art.Objects(page_size=4, after_id=8))
+        self.assertEqual([obj.id for obj in objects], [9, 10, 100, 200])
+
+    def test_object_details(self):
+        details = self.wait(self.art.ObjectDetails(3))
+        self.assertEqual(details['object'].name, 'srv03')
+        self.assertEqual(
+            details['attributes'],
+            {'FQDN': 'srv03.example.com', 'RAM': 3072}
+        )
+        self.assertEqual([port.name for port in details['interfaces']], ['eth0'])
+        self.assertEqual([tag.tag for tag in details['tags']], ['prod'])
+        self.assertEqual(len(details['ipv4']), 1)
+        self.assertEqual(self.wait(self.art.ObjectDetails(999))['object'], None)
+
+    def test_attributes_bulk(self):
+        self.art.chunk_size = 3
+        attributes = self.wait(self.art.GetAttributesBulk(range(1, 11)))
+        self.assertEqual(sorted(attributes), list(range(1, 11)))
+        self.assertEqual(attributes[7]['RAM'], 7 * 1024)
+        self.assertEqual(
+            attributes,
+            self.rt.GetAttributesBulk(list(range(1, 11)))
+        )
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+#
+#   RTAPI
+#   Tests of the bulk port and IP allocation upserts.
+#
+#   This utility is released under GPL v2
+#
+
+import unittest
+
+from dbtest import DatabaseTestCase, ipv4_to_int
+
+class UpdateNetworkInterfacesTest(DatabaseTestCase):
+    def test_upsert(self):
+        ports = self.rt.UpdateNetworkInterfaces([
+            (1, 'eth0'),
+            (1, 'eth1'),
+            (2, 'eth1'),
+            (2, 'eth1'),
+        ])
+        self.assertEqual(ports[1]['eth0'], 1)
+        new_ids = dict(
+            ((object_id, name), port_id) for port_id, object_id, name in self.query(
+                "select id, object_id, name from Port where name = 'eth1'"
+            )
+        )
+        self.assertEqual(ports, {
+            1: {'eth0': 1, 'eth1': new_ids[(1, 'eth1')]},
+            2: {'eth1': new_ids[(2, 'eth1')]},
+        })
+        self.assertEqual(self.query('select count(*) from Port'), [(22,)])
+        self.assertEqual(self.rt.UpdateNetworkInterface(2, 'eth1'), new_ids[(2, 'eth1')])
+        self.assertEqual(self.query('select count(*) from Port'), [(22,)])
+
+class InterfaceAddIPsTest(DatabaseTestCase):
+    def test_ipv4(self):
+        added = self.rt.InterfaceAddIpv4IPs([
+            (1, 'eth0', '10.0.0.1'),
+            (1, 'eth1', '10.0.0.101'),
+            (2, 'eth1', '10.0.0.102'),
+            (2, 'eth1', '10.0.0.102'),
+        ])
+        self.assertEqual(added, [
+            (1, 'eth1', '10.0.0.101'),
+            (2, 'eth1', '10.0.0.102'),
+        ])
+        self.assertEqual(
+            self.query("select object_id, ip from IPv4Allocation where name = 'eth1' order by ip"),
+            [(1, ipv4_to_int('10.0.0.101')), (2, ipv4_to_int('10.0.0.102'))]
+        )
+        self.assertEqual(
+            self.query('select object_id, content from ObjectLog order by id'),
+            [(1, 'Added IP 10.0.0.101 on eth1'), (2, 'Added IP 10.0.0.102 on eth1')]
+        )
+        self.assertFalse(self.rt.InterfaceAddIpv4IP(1, 'eth1', '10.0.0.101'))
+
+    def test_ipv6(self):
+        added = self.rt.InterfaceAddIpv6IPs([
+            (1, 'eth0', '2001:db8::1'),
+            (1, 'eth0', '2001:DB8:0::1'),
+            (2, 'eth0', '2001:db8::2'),
+        ])
+        self.assertEqual(len(added), 2)
+        self.assertEqual(
+            self.query('select object_id, hex(ip) from IPv6Allocation order by object_id'),
+            [
+                (1, '20010DB8000000000000000000000001'),
+                (2, '20010DB8000000000000000000000002'),
+            ]
+        )
+        self.assertFalse(self.rt.InterfaceAddIpv6IP(2, 'eth0', '2001:db8::2'))
+        self.assertTrue(self.rt.InterfaceAddIpv6IP(2, 'eth0', '2001:db8::3'))
+        self.assertEqual(
+            self.query('select content from ObjectLog order by id')[-1],
+            ('Added IPv6 IP 2001:db8::3 on eth0',)
+        )
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,189 @@
+#
+#   RTAPI
+#   Tests of ChangeTracker.
+#
+#   This utility is released under GPL v2
+#
+
+import os
+import sqlite3
+import threading
+import time
+import unittest
+
+import rtapi
+from rtapi import snapshot
+from dbtest import DatabaseTestCase
+
+class ChangeTrackerTest(DatabaseTestCase):
+    def label(self, object_id):
+        return self.query(
+            'select label from Object where id = ?', (object_id,)
+        )[0][0]
+
+    def test_object_edits(self):
+        tracker = rtapi.ChangeTracker(self.rt)
+        self.assertEqual(tracker.poll(), None)
+        self.rt.UpdateObjectLabel(3, 'edited')
+        changes = tracker.poll()
+        self.assertEqual(changes.objects, frozenset([3]))
+        self.assertTrue('Object' in changes.tables)
+        self.assertEqual(tracker.poll(), None)
+
+    def test_snapshot(self):
+        path = os.path.join(self.tmp_dir, 'snapshot.db')
+        self.rt.Snapshot(path)
+        tracker = rtapi.ChangeTracker(snapshot.open_snapshot(path))
+        self.assertEqual(tracker.poll(), None)
+
+    def test_poll_inside_transaction(self):
+        # A poll from another thread must not end the open transaction
+        tracker = rtapi.ChangeTracker(self.rt, refresh_caches=False)
+        with self.rt.transaction():
+            self.rt.UpdateObjectLabel(1, 'in transaction')
+            thread = threading.Thread(target=tracker.poll)
+            thread.start()
+            thread.join()
+            self.rt.UpdateObjectLabel(2, 'in transaction')
+        self.assertEqual(self.label(1), 'in transaction')
+        self.assertEqual(self.label(2), 'in transaction')
+
+    def test_connect(self):
+        tracker = rtapi.ChangeTracker(self.rt, connect=self.connect)
+        other = rtapi.Racktables(self.connect())
+        other.UpdateObjectLabel(4, 'elsewhere')
+        changes = tracker.poll()
+        self.assertEqual(changes.objects, frozenset([4]))
+
+    def test_start_needs_pool(self):
+        tracker = rtapi.ChangeTracker(self.rt)
+        self.assertRaises(ValueError, tracker.start)
+        tracker = rtapi.ChangeTracker(self.rt, connect=self.connect)
+        self.assertRaises(ValueError, tracker.start)
+
+    def test_start(self):
+        rt = self.pooled()
+        tracker = rtapi.ChangeTracker(rt)
+        found = []
+        tracker.subscribe(found.append)
+        tracker.start(interval=0.01)
+        try:
+            with rt.transaction():
+                for object_id in range(1, 6):
+                    rt.UpdateObjectLabel(object_id, 'polled')
+                    time.sleep(0.02)
+            for i in range(100):
+                if found and 1 in found[-1].objects:
+                    break
+                time.sleep(0.02)
+        finally:
+            tracker.stop()
+        self.assertEqual(tracker.last_error, None)
+        self.assertEqual(
+            self.query("select count(*) from Object where label = 'polled'"),
+            [(5,)]
+        )
+        self.assertEqual(
+            set().union(*[changes.objects for changes in found]),
+            set(range(1, 6))
+        )
+
+class IncrementalUpdateTest(DatabaseTestCase):
+    '''Indexes apply the rows of the changed objects instead of reloading'''
+
+    def setUp(self):
+        DatabaseTestCase.setUp(self)
+        self.tracker = rtapi.ChangeTracker(self.rt)
+        self.stats = rtapi.QueryStats()
+
+    def poll(self):
+        self.rt.instrumentation = self.stats
+        try:
+            return self.tracker.poll()
+        finally:
+            self.rt.instrumentation = None
+
+    def templates(self):
+        return ' '.join(self.stats.snapshot()).lower()
+
+    def edit(self, sql, values=()):
+        '''Write like the web interface would, bypassing the API'''
+        conn = sqlite3.connect(self.path)
+        conn.execute(sql, values)
+        conn.commit()
+        conn.close()
+
+    def test_object_label(self):
+        cabling = self.rt.cabling
+        self.rt.UpdateObjectLabel(5, 'relabelled')
+        self.assertEqual(self.poll().objects, frozenset([5]))
+        self.assertFalse('from port' in self.templates())
+        self.assertFalse('from link' in self.templates())
+        self.assertEqual(cabling.peer(5).object_name, 'switch1')
+
+    def test_object_rename(self):
+        cabling = self.rt.cabling
+        self.edit("update Object set name = 'renamed' where id = 100")
+        self.assertEqual(self.poll().objects, frozenset([100]))
+        self.assertEqual(cabling.peer(5).object_name, 'renamed')
+        self.assertEqual(cabling.port(5).object_name, 'srv05')
+
+    def test_port_edits(self):
+        cabling = self.rt.cabling
+        self.edit("update Port set name = 'eth1' where id = 7")
+        self.edit('update Port set type = 1504 where id = 8')
+        changes = self.poll()
+        self.assertEqual(changes.objects, frozenset([7, 8]))
+        self.assertEqual(changes.tables, frozenset(['Port']))
+        self.assertFalse('from link' in self.templates())
+        self.assertEqual(cabling.port(7).name, 'eth1')
+        self.assertEqual(cabling.port(8).type, 1504)
+        self.assertEqual(cabling.peer(107).id, 7)
+        self.assertEqual(len(cabling), 20)
+
+    def test_port_move(self):
+        cabling = self.rt.cabling
+        self.edit("update Port set object_id = 3, name = 'eth1' where id = 2")
+        self.assertEqual(self.poll().objects, frozenset([2, 3]))
+        self.assertEqual(cabling.port(2).object_id, 3)
+        self.assertEqual(
+            sorted(port.id for port, peer in cabling.object_links(3)),
+            [2, 3]
+        )
+        self.assertEqual(cabling.object_links(2), [])
+
+    def test_allocations(self):
+        ip_index = self.rt.ip_index
+        self.rt.InterfaceAddIpv4IP(5, 'eth0', '10.0.0.200')
+        self.edit('delete from IPv4Allocation where object_id = 6')
+        changes = self.poll()
+        self.assertEqual(changes.objects, frozenset([5, 6]))
+        self.assertFalse('from ipv4network' in self.templates())
+        self.assertEqual(
+            [entry.object_id for entry in ip_index.owners('10.0.0.200')],
+            [5]
+        )
+        self.assertEqual(ip_index.owners('10.0.0.6'), [])
+        self.assertEqual(len(ip_index.object_allocations(5)), 2)
+        self.assertEqual(
+            [entry.object_id for entry in ip_index.owners('10.0.0.7')],
+            [7]
+        )
+
+    def test_allocation_rename(self):
+        ip_index = self.rt.ip_index
+        self.edit("update IPv4Allocation set name = 'bond0' where object_id = 4")
+        self.assertEqual(self.poll().objects, frozenset([4]))
+        self.assertEqual(ip_index.owners('10.0.0.4')[0].name, 'bond0')
+
+    def test_tag_storage(self):
+        tag_index = self.rt.tag_index
+        self.assertEqual(len(tag_index.entities('prod')), 10)
+        self.edit("insert into TagStorage values ('object', 100, 2, 'admin', null)")
+        self.poll()
+        self.assertFalse('from tagtree' in self.templates())
+        self.assertEqual(tag_index.select(match_all=['web']), set([100]))
+        self.assertEqual(len(tag_index.entities('prod')), 11)
+
+if __name__ == '__main__':
+    unittest.main()
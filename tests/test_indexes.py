@@ -0,0 +1,197 @@
+#
+#   RTAPI
+#   Tests of the in memory indexes.
+#
+#   This utility is released under GPL v2
+#
+
+import unittest
+
+from dbtest import DatabaseTestCase, ipv4_to_int
+
+class IPIndexTest(DatabaseTestCase):
+    def test_lookups(self):
+        self.conn.cursor().execute(
+            "insert into IPv4Network values (2, %s, 28, 'net0-sub', null)",
+            (ipv4_to_int('10.0.0.0'),)
+        )
+        self.conn.commit()
+        index = self.rt.ip_index
+        self.assertEqual(index.network('10.0.0.3').name, 'net0-sub')
+        self.assertEqual(
+            [entry.name for entry in index.networks('10.0.0.20')],
+            ['net0']
+        )
+        self.assertEqual(index.network('192.168.0.1'), None)
+        self.assertEqual(
+            [entry.object_id for entry in index.owners('10.0.0.4')],
+            [4]
+        )
+        self.assertEqual(
+            [entry.object_id for entry in index.allocations('10.0.0.2', '10.0.0.4')],
+            [2, 3, 4]
+        )
+        self.assertEqual(len(index.network_allocations(2)), 10)
+        self.assertEqual(
+            [(allocation.name, network.name)
+             for allocation, network in index.object_networks(5)],
+            [('eth0', 'net0-sub')]
+        )
+
+    def test_refresh(self):
+        index = self.rt.ip_index
+        self.assertEqual(index.owners('10.0.0.50'), [])
+        self.rt.db_insert(
+            "insert into IPv4Allocation values (1, %s, 'eth1', 'regular')",
+            (ipv4_to_int('10.0.0.50'),)
+        )
+        index.refresh()
+        self.assertEqual(
+            [entry.object_id for entry in index.owners('10.0.0.50')],
+            [1]
+        )
+        self.assertTrue(self.rt.ip_index is index)
+
+class CablingGraphTest(DatabaseTestCase):
+    def test_links(self):
+        cabling = self.rt.cabling
+        self.assertEqual(cabling.peer(1).name, 'ge-0/0/1')
+        self.assertEqual(cabling.peer(101).object_name, 'srv01')
+        self.assertEqual(cabling.find_port(100, 'ge-0/0/3').id, 103)
+        self.assertEqual(len(cabling.object_ports(100)), 10)
+        self.assertEqual(cabling.far_end(2).object_id, 100)
+        self.assertEqual(cabling.far_end(999), None)
+        self.assertEqual(
+            sorted(cabling.linked_objects(100)),
+            list(range(1, 11))
+        )
+        self.assertEqual(cabling.dangling_links(), [])
+
+    def test_passthrough(self):
+        # A patch panel passing port 1 through to port 2
+        self.rt.db_insert("insert into Object (id, name, objtype_id) values (300, 'panel', 9)")
+        self.rt.db_insert("insert into Port (id, object_id, name, iif_id, type) values (301, 300, 'front1', 1, 24)")
+        self.rt.db_insert("insert into Port (id, object_id, name, iif_id, type) values (302, 300, 'rear1', 1, 24)")
+        self.rt.db_insert('delete from Link where porta = 1')
+        self.rt.db_insert("insert into Link values (1, 301, 'C1')")
+        self.rt.db_insert("insert into Link values (302, 101, 'C2')")
+        cabling = self.rt.cabling
+        self.assertEqual(cabling.cable(1), 'C1')
+        passthrough = {301: 302, 302: 301}
+        path = cabling.trace(1, lambda graph, port_id: passthrough.get(port_id))
+        self.assertEqual([port.id for port in path], [1, 301, 302, 101])
+        self.assertEqual([port.id for port in cabling.trace(1, None)], [1, 301])
+
+class LocationTreeTest(DatabaseTestCase):
+    def test_tree(self):
+        self.rt.db_insert("insert into location values (3, 'Cage 1', 'no', null, 2, 'Hall A')")
+        tree = self.rt.location_tree
+        self.assertEqual([location.name for location in tree.roots()], ['DC1'])
+        self.assertEqual(tree.parent(2).name, 'DC1')
+        self.assertEqual([location.id for location in tree.children(1)], [2])
+        self.assertEqual(
+            [location.name for location in tree.path(3)],
+            ['DC1', 'Hall A', 'Cage 1']
+        )
+        self.assertEqual([location.id for location in tree.descendants(1)], [2, 3])
+        self.assertEqual([row.name for row in tree.rows(2)], ['Row 1'])
+        self.assertEqual([rack.id for rack in tree.racks(1)], [100])
+        self.assertEqual([rack.id for rack in tree.row_racks(10)], [100])
+        locations, row = tree.rack_path(100)
+        self.assertEqual([location.id for location in locations], [1, 2])
+        self.assertEqual(row.id, 10)
+
+    def test_parent_loop(self):
+        self.rt.db_insert("insert into location values (3, 'A', 'no', null, 4, 'B')")
+        self.rt.db_insert("insert into location values (4, 'B', 'no', null, 3, 'A')")
+        tree = self.rt.location_tree
+        self.assertEqual(tree.path(3), [])
+        self.assertEqual([location.id for location in tree.roots()], [1])
+
+class RackSpaceIndexTest(DatabaseTestCase):
+    def test_occupancy(self):
+        self.rt.db_insert("insert into RackSpace values (100, 5, 'front', 'T', 2)")
+        self.rt.db_insert("insert into RackSpace values (100, 10, 'rear', 'U', null)")
+        space = self.rt.rack_space
+        units = space.units(100)
+        self.assertEqual(units[0], ('front', 'interior', 'rear'))
+        self.assertEqual(units[4], ('front',))
+        self.assertEqual(units[2], ())
+        self.assertEqual(space.free_space(100, 2), [3, 6, 7, 8])
+        self.assertEqual(space.free_space(100, 3, ('interior', 'rear')), [3, 4, 5, 6, 7])
+        self.assertEqual(space.find_free(5, location_id=1), [])
+        self.assertEqual(space.find_free(4, row_id=10), [(100, [6])])
+        usage = space.usage(100)
+        self.assertEqual((usage.taken, usage.unusable, usage.total), (7, 1, 30))
+        self.assertEqual(space.location_usage(1).taken, 7)
+        self.assertEqual(space.object_racks(1), [100])
+        self.assertEqual(
+            space.object_positions(2),
+            [(100, 5, ('front',))]
+        )
+
+class TagIndexTest(DatabaseTestCase):
+    def setUp(self):
+        DatabaseTestCase.setUp(self)
+        self.rt.db_insert("insert into TagTree values (3, null, 'yes', 'dev')")
+        self.rt.db_insert("insert into TagStorage values ('object', 1, 2, 'admin', null)")
+        self.rt.db_insert("insert into TagStorage values ('object', 2, 3, 'admin', null)")
+        self.rt.db_insert("insert into TagStorage values ('rack', 100, 2, 'admin', null)")
+
+    def test_tree(self):
+        tags = self.rt.tag_index
+        self.assertEqual(tags.tag('web').id, 2)
+        self.assertEqual([tag.tag for tag in tags.ancestors('web')], ['prod'])
+        self.assertEqual([tag.tag for tag in tags.descendants(1)], ['web'])
+        self.assertEqual(
+            [tag.tag for tag in tags.entity_tags(1, implicit=True)],
+            ['prod', 'web']
+        )
+        self.assertEqual([tag.tag for tag in tags.entity_tags(100, 'rack')], ['web'])
+
+    def test_select(self):
+        tags = self.rt.tag_index
+        self.assertEqual(tags.entities('web'), set([1]))
+        self.assertEqual(tags.entities('prod', 'rack'), set([100]))
+        self.assertEqual(tags.entities('prod', 'rack', descendants=False), set())
+        self.assertEqual(tags.select(match_all=['prod', 'dev']), set([2]))
+        self.assertEqual(tags.select(match_any=['web', 'dev']), set([1, 2]))
+        self.assertEqual(
+            tags.select(match_all=['prod'], exclude=['web', 'dev']),
+            set(range(3, 11))
+        )
+
+class ContainerGraphTest(DatabaseTestCase):
+    def setUp(self):
+        DatabaseTestCase.setUp(self)
+        # srv04 is a chassis holding srv05 in slot 10 and srv06 in slot 2,
+        # srv01 and srv02 run VM 300
+        self.rt.db_insert("insert into AttributeValue values (4, 4, 2, null, 994, null)")
+        self.rt.db_insert("insert into AttributeValue values (5, 4, 28, '10', null, null)")
+        self.rt.db_insert("insert into AttributeValue values (6, 4, 28, '2', null, null)")
+        for parent_id, child_id in ((4, 5), (4, 6), (1, 300), (2, 300)):
+            self.rt.db_insert(
+                "insert into EntityLink (parent_entity_type, parent_entity_id, "
+                "child_entity_type, child_entity_id) values ('object', %s, 'object', %s)",
+                (parent_id, child_id)
+            )
+
+    def test_graph(self):
+        containers = self.rt.containers
+        self.assertEqual(containers.children(200), [1, 2, 3])
+        self.assertEqual(containers.parents(300), [1, 2])
+        self.assertEqual(containers.containers(300), [1, 2, 200])
+        self.assertEqual(containers.descendants(200), [1, 2, 3, 300])
+        self.assertEqual(
+            containers.grouped_children(200),
+            {1: [300], 2: [300], 3: []}
+        )
+
+    def test_chassis(self):
+        containers = self.rt.containers
+        self.assertEqual(containers.slot(5), '10')
+        self.assertEqual(containers.chassis_slots(4), [('2', 6), ('10', 5)])
+        self.assertEqual(containers.chassis(), {4: [('2', 6), ('10', 5)]})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+#
+#   RTAPI
+#   Tests of QueryStats instrumentation.
+#
+#   This utility is released under GPL v2
+#
+
+import unittest
+
+import rtapi
+from dbtest import DatabaseTestCase
+
+class QueryStatsTest(DatabaseTestCase):
+    def callers(self, stats):
+        callers = set()
+        for template in stats.snapshot().values():
+            callers.update(template.callers)
+        return callers
+
+    def test_listing_caller(self):
+        # Pages read while the caller iterates still count for the listing
+        stats = rtapi.QueryStats()
+        self.rt.instrumentation = stats
+        objects = list(self.rt.Objects())
+        list(self.rt.Objects(page_size=4))
+        list(objects[0].Interfaces())
+        self.assertEqual(
+            self.callers(stats),
+            set(['Racktables.Objects', 'RTObject.Interfaces'])
+        )
+
+    def test_n_plus_one(self):
+        stats = rtapi.QueryStats(threshold=5)
+        self.rt.instrumentation = stats
+        with stats.operation('names'):
+            for object_id in range(1, 11):
+                self.rt.GetObjectName(object_id)
+        found = stats.n_plus_one()
+        self.assertEqual(len(found), 1)
+        self.assertEqual(found[0].count, 10)
+        self.assertEqual(found[0].callers, ['Racktables.GetObjectName'])
+
+if __name__ == '__main__':
+    unittest.main()
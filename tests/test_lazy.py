@@ -0,0 +1,64 @@
+#
+#   RTAPI
+#   Tests of lazy entities.
+#
+#   This utility is released under GPL v2
+#
+
+import gc
+import unittest
+
+import rtapi
+from dbtest import DatabaseTestCase
+
+LOAD_SQL = 'select id, name, label, objtype_id, asset_no, has_problems, comment from Object where id in (...)'
+
+class LazyEntityTest(DatabaseTestCase):
+    def setUp(self):
+        DatabaseTestCase.setUp(self)
+        self.stats = rtapi.QueryStats()
+        self.rt.instrumentation = self.stats
+
+    def loads(self):
+        template = self.stats.snapshot().get(LOAD_SQL)
+        if template is None:
+            return (0, 0)
+        return (template.count, template.rows)
+
+    def test_batch(self):
+        objects = [
+            self.rt.LazyEntity(rtapi.RTObject, object_id)
+            for object_id in range(1, 6)
+        ]
+        self.assertEqual(self.loads(), (0, 0))
+        self.assertEqual(objects[2].name, 'srv03')
+        self.assertEqual([obj.name for obj in objects], [
+            'srv01', 'srv02', 'srv03', 'srv04', 'srv05'
+        ])
+        self.assertEqual(self.loads(), (1, 5))
+
+    def test_missing(self):
+        obj = self.rt.LazyEntity(rtapi.RTObject, 999)
+        self.assertRaises(ValueError, getattr, obj, 'name')
+
+    def test_dropped_entities(self):
+        for object_id in range(1, 10):
+            self.rt.LazyEntity(rtapi.RTObject, object_id)
+        gc.collect()
+        obj = self.rt.LazyEntity(rtapi.RTObject, 10)
+        self.assertEqual(obj.name, 'srv10')
+        self.assertEqual(self.loads(), (1, 1))
+
+    def test_lazy_lookups(self):
+        self.rt.lazy = True
+        cluster = rtapi.RTObject(self.rt, 200)
+        linked = list(cluster.LinkedObjects())
+        self.assertEqual(self.loads(), (0, 0))
+        self.assertEqual(
+            sorted(obj.name for obj in linked),
+            ['srv01', 'srv02', 'srv03']
+        )
+        self.assertEqual(self.loads(), (1, 3))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+#
+#   RTAPI
+#   Tests of the streamed table listings.
+#
+#   This utility is released under GPL v2
+#
+
+import unittest
+
+import rtapi
+from dbtest import DatabaseTestCase
+
+class ListingTest(DatabaseTestCase):
+    def test_pages(self):
+        ids = [obj._id for obj in self.rt.Objects(page_size=3)]
+        self.assertEqual(ids, list(range(1, 11)) + [100, 200])
+        self.assertEqual([obj._id for obj in self.rt.Objects()], ids)
+
+    def test_resume_after_id(self):
+        seen = []
+        for obj in self.rt.Objects(page_size=4):
+            seen.append(obj._id)
+            if len(seen) == 5:
+                break
+        resumed = [obj._id for obj in self.rt.Objects(after_id=seen[-1])]
+        self.assertEqual(seen + resumed, list(range(1, 11)) + [100, 200])
+        self.assertEqual(list(self.rt.Objects(after_id=200)), [])
+
+    def test_default_page_size(self):
+        self.rt.page_size = 2
+        self.assertEqual(len(list(self.rt.Objects())), 12)
+        self.assertEqual([rack._id for rack in self.rt.Racks()], [100])
+
+    def test_records(self):
+        records = list(self.rt.Objects(page_size=5, after_id=8, records=True))
+        self.assertEqual([record.name for record in records], [
+            'srv09', 'srv10', 'switch1', 'cluster1'
+        ])
+
+if __name__ == '__main__':
+    unittest.main()
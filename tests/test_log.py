@@ -0,0 +1,63 @@
+#
+#   RTAPI
+#   Tests of LogBuffer and Racktables.BufferedLog().
+#
+#   This utility is released under GPL v2
+#
+
+import threading
+import unittest
+
+import rtapi
+from dbtest import DatabaseTestCase
+
+class BufferedLogTest(DatabaseTestCase):
+    def test_bulk_write(self):
+        with self.rt.BufferedLog(size=3) as log_buffer:
+            for object_id in (1, 2, 3, 4):
+                self.rt.InsertLog(object_id, 'bulk')
+            self.assertEqual(len(log_buffer), 1)
+            self.assertEqual(self.query('select count(*) from ObjectLog'), [(3,)])
+        self.assertEqual(
+            self.query("select object_id, user from ObjectLog order by object_id"),
+            [(1, 'script'), (2, 'script'), (3, 'script'), (4, 'script')]
+        )
+
+    def test_entity_log(self):
+        obj = rtapi.RTObject(self.rt, 1)
+        with self.rt.BufferedLog():
+            obj.InsertLog('buffered')
+            self.assertEqual(self.query('select count(*) from ObjectLog'), [(0,)])
+        self.assertEqual(
+            self.query('select content from ObjectLog'),
+            [('buffered',)]
+        )
+
+    def test_buffer_per_thread(self):
+        rt = self.pooled(size=2)
+        logged = threading.Event()
+        done = threading.Event()
+        def rolled_back():
+            try:
+                with rt.transaction():
+                    with rt.BufferedLog():
+                        rt.InsertLog(1, 'rolled back')
+                        logged.set()
+                        done.wait(5)
+                        raise RuntimeError('roll back')
+            except RuntimeError:
+                pass
+        thread = threading.Thread(target=rolled_back)
+        thread.start()
+        logged.wait(5)
+        with rt.BufferedLog():
+            rt.InsertLog(2, 'kept')
+        done.set()
+        thread.join()
+        self.assertEqual(
+            self.query('select object_id, content from ObjectLog'),
+            [(2, 'kept')]
+        )
+
+if __name__ == '__main__':
+    unittest.main()
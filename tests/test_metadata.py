@@ -0,0 +1,57 @@
+#
+#   RTAPI
+#   Tests of MetadataCache.
+#
+#   This utility is released under GPL v2
+#
+
+import unittest
+
+import rtapi
+from dbtest import DatabaseTestCase
+
+ATTRIBUTE_SQL = 'select id, type, name from Attribute'
+
+class MetadataCacheTest(DatabaseTestCase):
+    def loads(self, stats):
+        template = stats.snapshot().get(ATTRIBUTE_SQL)
+        return template and template.count or 0
+
+    def test_lookups(self):
+        self.assertEqual(self.rt.GetAttributeId('RAM'), 17)
+        self.assertEqual(self.rt.GetAttributeId('fqd'), 3)
+        self.assertEqual(self.rt.GetDictionaryId('switch'), 8)
+        obj = rtapi.RTObject(self.rt, 1)
+        self.assertEqual(obj.ObjectTypeName(), 'Server')
+
+    def test_shared_per_connection(self):
+        stats = rtapi.QueryStats()
+        first = rtapi.Racktables(self.conn)
+        second = rtapi.Racktables(self.conn)
+        first.instrumentation = second.instrumentation = stats
+        self.assertEqual(first.GetAttributeId('RAM'), 17)
+        self.assertEqual(second.GetAttributeId('FQDN'), 3)
+        rtapi.RTObject(self.conn, 1).ObjectTypeName()
+        self.assertEqual(self.loads(stats), 1)
+
+    def test_refresh(self):
+        self.assertEqual(self.rt.GetAttributeId('Weight'), None)
+        self.conn.cursor().execute(
+            "insert into Attribute values (30, 'float', 'Weight')"
+        )
+        self.conn.commit()
+        self.rt.metadata.refresh()
+        self.assertEqual(self.rt.GetAttributeId('Weight'), 30)
+
+    def test_load_in_transaction(self):
+        rt = self.pooled(size=1, timeout=1)
+        with rt.transaction():
+            rt.UpdateObjectLabel(1, 'pooled')
+            self.assertEqual(rt.GetAttributeId('RAM'), 17)
+        self.assertEqual(
+            self.query('select label from Object where id = 1'),
+            [('pooled',)]
+        )
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+#
+#   RTAPI
+#   Tests of free address search and reservation in IPv4 networks.
+#
+#   This utility is released under GPL v2
+#
+
+import unittest
+
+import rtapi
+from dbtest import DatabaseTestCase, ipv4_to_int
+
+class FreeAddressesTest(DatabaseTestCase):
+    def setUp(self):
+        DatabaseTestCase.setUp(self)
+        self.network = rtapi.IPv4Network(self.rt, 1)
+
+    def test_free(self):
+        self.rt.db_insert(
+            "insert into IPv4Address values (%s, null, null, 'yes')",
+            (ipv4_to_int('10.0.0.12'),)
+        )
+        self.assertEqual(
+            self.network.FreeAddresses(3, refresh=True),
+            ['10.0.0.11', '10.0.0.13', '10.0.0.14']
+        )
+        self.assertEqual(
+            self.network.FreeAddresses(3, contiguous=True),
+            ['10.0.0.13', '10.0.0.14', '10.0.0.15']
+        )
+        self.assertEqual(self.network.NextFree(), '10.0.0.11')
+
+    def test_full_network(self):
+        self.rt.db_insert(
+            "insert into IPv4Network values (2, %s, 30, 'p2p', null)",
+            (ipv4_to_int('10.0.1.0'),)
+        )
+        network = rtapi.IPv4Network(self.rt, 2)
+        self.assertEqual(network.FreeAddresses(5), ['10.0.1.1', '10.0.1.2'])
+        self.assertEqual(network.FreeAddresses(3, contiguous=True), [])
+        network.FreeAddresses(2, reserve=True, name='p2p')
+        self.assertEqual(network.NextFree(), None)
+
+    def test_reserve_allocation(self):
+        self.assertEqual(
+            self.network.FreeAddresses(2, reserve=True, name='eth1', object_id=1),
+            ['10.0.0.11', '10.0.0.12']
+        )
+        self.assertEqual(
+            self.query(
+                'select object_id, ip, name from IPv4Allocation '
+                'where object_id = 1 order by ip'
+            ),
+            [
+                (1, ipv4_to_int('10.0.0.1'), 'eth0'),
+                (1, ipv4_to_int('10.0.0.11'), 'eth1'),
+                (1, ipv4_to_int('10.0.0.12'), 'eth1'),
+            ]
+        )
+        self.assertEqual(
+            self.query('select content from ObjectLog order by id'),
+            [('Added IP 10.0.0.11 on eth1',), ('Added IP 10.0.0.12 on eth1',)]
+        )
+        self.assertEqual(self.network.FreeAddresses(1), ['10.0.0.13'])
+
+    def test_reserve_address(self):
+        self.assertEqual(
+            self.network.NextFree(reserve=True, name='vip'),
+            '10.0.0.11'
+        )
+        self.assertEqual(
+            self.query('select ip, name, reserved from IPv4Address'),
+            [(ipv4_to_int('10.0.0.11'), 'vip', 'yes')]
+        )
+        other = rtapi.IPv4Network(self.rt, 1)
+        self.assertEqual(other.NextFree(reserve=True, name='vip2'), '10.0.0.12')
+
+if __name__ == '__main__':
+    unittest.main()
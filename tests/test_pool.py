@@ -0,0 +1,64 @@
+#
+#   RTAPI
+#   Tests of ConnectionPool and per-operation cursors.
+#
+#   This utility is released under GPL v2
+#
+
+import threading
+import unittest
+
+import rtapi
+from rtapi import sqlitedb
+from dbtest import DatabaseTestCase
+
+class RecordingConnection(sqlitedb.Connection):
+    '''sqlitedb Connection counting its rollbacks'''
+    rollbacks = 0
+
+    def rollback(self):
+        self.rollbacks += 1
+        sqlitedb.Connection.rollback(self)
+
+class ConnectionPoolTest(DatabaseTestCase):
+    def test_rollback_after_use(self):
+        conns = []
+        def connect():
+            conns.append(RecordingConnection(self.path))
+            return conns[-1]
+        rt = rtapi.Racktables(rtapi.ConnectionPool(connect, size=1))
+        self.assertEqual(rt.GetObjectName(1), 'srv01')
+        self.assertEqual(conns[0].rollbacks, 1)
+        with rt.transaction():
+            rt.UpdateObjectLabel(1, 'pooled')
+        self.assertEqual(len(conns), 1)
+        self.assertEqual(
+            self.query('select label from Object where id = 1'),
+            [('pooled',)]
+        )
+
+    def test_threads(self):
+        rt = self.pooled(size=3)
+        names = {}
+        def read(object_id):
+            names[object_id] = rt.GetObjectName(object_id)
+        threads = [
+            threading.Thread(target=read, args=(object_id,))
+            for object_id in range(1, 11)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(names), 10)
+        self.assertEqual(names[7], 'srv07')
+
+    def test_timeout(self):
+        pool = rtapi.ConnectionPool(self.connect, size=1, timeout=0.1)
+        conn = pool.get()
+        self.assertRaises(RuntimeError, pool.get)
+        pool.put(conn)
+        self.assertTrue(pool.get() is conn)
+
+if __name__ == '__main__':
+    unittest.main()
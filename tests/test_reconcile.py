@@ -0,0 +1,105 @@
+#
+#   RTAPI
+#   Tests of Racktables.Reconcile().
+#
+#   This utility is released under GPL v2
+#
+
+import unittest
+
+from dbtest import DatabaseTestCase, ipv4_to_int
+
+class ReconcileTest(DatabaseTestCase):
+    def setUp(self):
+        DatabaseTestCase.setUp(self)
+        for object_id in (301, 302):
+            self.rt.db_insert(
+                "insert into Object (id, name, objtype_id) values (%s, %s, 1504)",
+                (object_id, 'vm%d' % object_id)
+            )
+        self.rt.db_insert(
+            "insert into EntityLink (parent_entity_type, parent_entity_id, "
+            "child_entity_type, child_entity_id) values ('object', 1, 'object', 301)"
+        )
+
+    def logs(self):
+        return [row[0] for row in self.query('select content from ObjectLog order by id')]
+
+    def test_addresses_require_device(self):
+        self.assertRaises(ValueError, self.rt.Reconcile, 1, ipv4=['10.0.0.1'])
+        self.assertRaises(ValueError, self.rt.Reconcile, 1, ipv6=[])
+
+    def test_add(self):
+        summary = self.rt.Reconcile(
+            1,
+            device='eth0',
+            virtuals=['vm302'],
+            ipv4=['10.0.0.1', '10.0.0.100'],
+            ipv6=['2001:db8::1']
+        )
+        self.assertEqual(summary, {
+            'virtuals': {'added': ['vm302'], 'removed': ['vm301'], 'missing': []},
+            'ipv4': {'added': ['10.0.0.100'], 'removed': [], 'missing': []},
+            'ipv6': {'added': ['2001:db8::1'], 'removed': [], 'missing': []},
+        })
+        self.assertEqual(
+            self.query('select child_entity_id from EntityLink where parent_entity_id = 1'),
+            [(302,)]
+        )
+        self.assertEqual(
+            self.query('select ip from IPv4Allocation where object_id = 1 order by ip'),
+            [(ipv4_to_int('10.0.0.1'),), (ipv4_to_int('10.0.0.100'),)]
+        )
+        self.assertEqual(
+            self.query('select hex(ip), name from IPv6Allocation where object_id = 1'),
+            [('20010DB8000000000000000000000001', 'eth0')]
+        )
+        self.assertEqual(self.logs(), [
+            'Removed virtual vm301',
+            'Linked virtual vm302 with hypervisor',
+            'Added IP 10.0.0.100 on eth0',
+            'Added IPv6 IP 2001:db8::1 on eth0',
+        ])
+        self.assertEqual(
+            self.rt.Reconcile(1, device='eth0', ipv4=['10.0.0.1', '10.0.0.100']),
+            {'ipv4': {'added': [], 'removed': [], 'missing': []}}
+        )
+
+    def test_remove_only(self):
+        summary = self.rt.Reconcile(
+            1,
+            device='eth0',
+            virtuals=['vm302'],
+            ipv4=['10.0.0.100'],
+            add=False
+        )
+        self.assertEqual(summary['ipv4'], {
+            'added': [], 'removed': ['10.0.0.1'], 'missing': ['10.0.0.100']
+        })
+        self.assertEqual(summary['virtuals']['missing'], ['vm302'])
+        self.assertEqual(
+            self.query('select count(*) from IPv4Allocation where object_id = 1'),
+            [(0,)]
+        )
+        self.assertEqual(
+            self.query('select count(*) from EntityLink where parent_entity_id = 1'),
+            [(0,)]
+        )
+
+    def test_rollback(self):
+        self.assertRaises(
+            Exception,
+            self.rt.Reconcile,
+            1,
+            device='eth0',
+            virtuals=[],
+            ipv4=['not an address']
+        )
+        self.assertEqual(
+            self.query('select count(*) from EntityLink where parent_entity_id = 1'),
+            [(1,)]
+        )
+        self.assertEqual(self.logs(), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+#
+#   RTAPI
+#   Tests of read only SQLite snapshots.
+#
+#   This utility is released under GPL v2
+#
+
+import os
+import sqlite3
+import unittest
+
+from rtapi import snapshot
+from dbtest import DatabaseTestCase, ipv4_to_int
+
+class SnapshotTest(DatabaseTestCase):
+    def setUp(self):
+        DatabaseTestCase.setUp(self)
+        self.snapshot_path = os.path.join(self.tmp_dir, 'snapshot.db')
+
+    def snapshot_query(self, sql):
+        conn = sqlite3.connect(self.snapshot_path)
+        try:
+            return conn.execute(sql).fetchall()
+        finally:
+            conn.close()
+
+    def test_keyset_pages(self):
+        self.rt.chunk_size = 3
+        counts = self.rt.Snapshot(self.snapshot_path)
+        self.assertEqual(counts['Object'], 12)
+        self.assertEqual(counts['AttributeValue'], 20)
+        for table, order in (
+            ('Object', 'id'),
+            ('AttributeValue', 'object_id, attr_id'),
+            ('Link', 'porta'),
+            ('RackSpace', 'unit_no, atom'),
+        ):
+            sql = 'select * from %s order by %s' % (table, order)
+            self.assertEqual(self.snapshot_query(sql), self.query(sql))
+
+    def test_repeated_leading_key(self):
+        # Every network is in a VLAN of two domains, so ipv4net_id repeats
+        # across page boundaries
+        for net_id in range(2, 7):
+            self.rt.db_insert(
+                "insert into IPv4Network values (%s, %s, 24, 'net', null)",
+                (net_id, ipv4_to_int('10.0.%d.0' % net_id))
+            )
+        for net_id in range(2, 7):
+            for domain_id in (1, 2):
+                self.rt.db_insert(
+                    'insert into VLANIPv4 values (%s, %s, %s)',
+                    (domain_id, 100 + net_id, net_id)
+                )
+        self.rt.chunk_size = 3
+        counts = self.rt.Snapshot(self.snapshot_path)
+        self.assertEqual(counts['VLANIPv4'], 10)
+        sql = 'select * from VLANIPv4 order by ipv4net_id, domain_id'
+        self.assertEqual(self.snapshot_query(sql), self.query(sql))
+
+    def test_key_not_unique(self):
+        keys = snapshot.SNAPSHOT_KEYS
+        snapshot.SNAPSHOT_KEYS = dict(keys, Port=('object_id',))
+        try:
+            self.rt.chunk_size = 3
+            self.assertRaises(ValueError, self.rt.Snapshot, self.snapshot_path)
+        finally:
+            snapshot.SNAPSHOT_KEYS = keys
+        self.assertFalse(os.path.exists(self.snapshot_path))
+        self.assertFalse(os.path.exists(self.snapshot_path + '.tmp'))
+
+    def test_read_api(self):
+        self.rt.Snapshot(self.snapshot_path)
+        self.assertEqual(
+            snapshot.snapshot_info(self.snapshot_path)['tables'],
+            list(snapshot.SNAPSHOT_TABLES)
+        )
+        snap = snapshot.open_snapshot(self.snapshot_path, pool_size=2)
+        self.assertEqual(snap.GetObjectName(3), 'srv03')
+        self.assertEqual(len(list(snap.Objects())), 12)
+        self.assertEqual(snap.ip_index.network('10.0.0.5').name, 'net0')
+        self.assertRaises(Exception, snap.UpdateObjectLabel, 1, 'read only')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+#
+#   RTAPI
+#   Tests of Racktables.transaction() and of entities writing through it.
+#
+#   This utility is released under GPL v2
+#
+
+import unittest
+
+import rtapi
+from dbtest import DatabaseTestCase
+
+class TransactionTest(DatabaseTestCase):
+    def test_commit(self):
+        with self.rt.transaction():
+            self.rt.UpdateObjectLabel(1, 'in transaction')
+            self.assertEqual(
+                self.query('select label from Object where id = 1'),
+                [('label1',)]
+            )
+        self.assertEqual(
+            self.query('select label from Object where id = 1'),
+            [('in transaction',)]
+        )
+
+    def test_rollback(self):
+        try:
+            with self.rt.transaction():
+                self.rt.UpdateObjectLabel(1, 'rolled back')
+                raise RuntimeError('roll back')
+        except RuntimeError:
+            pass
+        self.assertEqual(
+            self.query('select label from Object where id = 1'),
+            [('label1',)]
+        )
+
+    def test_nested(self):
+        with self.rt.transaction():
+            self.rt.UpdateObjectLabel(1, 'outer')
+            with self.rt.transaction():
+                self.rt.UpdateObjectLabel(2, 'inner')
+            self.assertEqual(
+                self.query('select label from Object where id = 2'),
+                [('label2',)]
+            )
+        self.assertEqual(
+            self.query('select label from Object where id in (1, 2) order by id'),
+            [('outer',), ('inner',)]
+        )
+
+    def test_commit_every(self):
+        with self.rt.transaction(commit_every=2):
+            for object_id in (1, 2, 3):
+                self.rt.UpdateObjectLabel(object_id, 'batch')
+            self.assertEqual(
+                self.query("select count(*) from Object where label = 'batch'"),
+                [(2,)]
+            )
+        self.assertEqual(
+            self.query("select count(*) from Object where label = 'batch'"),
+            [(3,)]
+        )
+
+class EntityTest(DatabaseTestCase):
+    def test_inherited_methods(self):
+        obj = rtapi.RTObject(self.conn, 1)
+        self.assertEqual(obj.GetObjectName(2), 'srv02')
+        obj.UpdateObjectLabel(2, 'edited')
+        self.assertEqual(
+            self.query('select label from Object where id = 2'),
+            [('edited',)]
+        )
+        obj.InsertAttribute(100, 8, 3, 'switch1.example.com', None, 'FQDN')
+        self.assertEqual(
+            self.query('select string_value from AttributeValue where object_id = 100'),
+            [('switch1.example.com',)]
+        )
+
+    def test_state_of_racktables(self):
+        rt = rtapi.Racktables(self.conn, rtapi.IdentityMap())
+        obj = rtapi.RTObject(rt, 1)
+        self.assertTrue(obj.identity_map is rt.identity_map)
+        self.assertTrue(obj.tag_index is rt.tag_index)
+        with obj.transaction():
+            obj.UpdateObjectLabel(1, 'entity')
+            self.assertEqual(
+                self.query('select label from Object where id = 1'),
+                [('label1',)]
+            )
+        self.assertEqual(
+            self.query('select label from Object where id = 1'),
+            [('entity',)]
+        )
+
+if __name__ == '__main__':
+    unittest.main()
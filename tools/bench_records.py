@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# Compare construction time and memory of entity classes and records
+#
+# Builds entities from synthetic rows, so no database is needed.
+#
+#   python bench_records.py [count]
+
+from __future__ import print_function
+import gc
+import sys
+import time
+import rtapi
+from rtapi import sqlitedb
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+def interface_rows(count):
+    for port_id in range(1, count + 1):
+        yield (
+            port_id,
+            port_id // 4,
+            'eth%d' % (port_id % 4),
+            1,
+            24,
+            '00163e%06x' % port_id,
+            None,
+            None,
+        )
+
+def measure(label, build, count):
+    rows = list(interface_rows(count))
+    gc.collect()
+    if tracemalloc:
+        tracemalloc.start()
+    start = time.time()
+    items = [build(row) for row in rows]
+    elapsed = time.time() - start
+    if tracemalloc:
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        memory = '%.1f MiB' % (size / 1048576.0)
+    else:
+        memory = 'n/a'
+    print('%-16s %8d items %8.3f s %12s' % (label, len(items), elapsed, memory))
+    del items
+
+def main():
+    count = 200000
+    if len(sys.argv) > 1:
+        count = int(sys.argv[1])
+
+    rt = rtapi.Racktables(sqlitedb.connect())
+    measure(
+        'Interface',
+        lambda row: rtapi.Interface(rt, row[0], row),
+        count
+    )
+    measure(
+        'InterfaceRecord',
+        rtapi.InterfaceRecord._make,
+        count
+    )
+
+if __name__ == '__main__':
+    main()
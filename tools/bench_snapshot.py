@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# Compare cold start and per object read latency of the live database
+# against a snapshot of it
+#
+# Builds a synthetic database in SQLite and serves it through a connection
+# which waits latency milliseconds per statement, like a round trip to a
+# MySQL server, then times the same reads against a snapshot file.
+#
+#   python bench_snapshot.py [objects] [latency ms]
+
+from __future__ import print_function
+import os
+import sys
+import time
+import tempfile
+import rtapi
+from rtapi import sqlitedb, snapshot
+
+SCHEMA = '''
+create table Object (id integer primary key, name text, label text, objtype_id int, asset_no text, has_problems text, comment text);
+create index Object_name on Object (name);
+create table Attribute (id integer primary key, type text, name text);
+create table AttributeValue (object_id int, object_tid int, attr_id int, string_value text, uint_value int, float_value real);
+create index AttributeValue_object_id on AttributeValue (object_id);
+create table Chapter (id integer primary key, sticky text, name text);
+create table Dictionary (dict_key integer primary key, chapter_id int, dict_sticky text, dict_value text);
+create table PortOuterInterface (id integer primary key, oif_name text);
+create table Port (id integer primary key, object_id int, name text, iif_id int, type int, l2address text, reservation_comment text, label text);
+create index Port_object_id on Port (object_id);
+create table IPv4Allocation (object_id int, ip int, name text, type text);
+create index IPv4Allocation_object_id on IPv4Allocation (object_id);
+'''
+
+TABLES = (
+    'Object',
+    'Attribute',
+    'AttributeValue',
+    'Chapter',
+    'Dictionary',
+    'PortOuterInterface',
+    'Port',
+    'IPv4Allocation',
+)
+
+class SlowConnection(sqlitedb.Connection):
+    '''sqlitedb connection which waits latency seconds per statement'''
+
+    latency = 0.0
+
+    def cursor(self):
+        cursor = sqlitedb.Connection.cursor(self)
+        execute = cursor.execute
+        def slow_execute(sql, values=()):
+            time.sleep(self.latency)
+            return execute(sql, values)
+        cursor.execute = slow_execute
+        return cursor
+
+def build(path, count):
+    conn = sqlitedb.connect(path)
+    conn.executescript(SCHEMA)
+    cursor = conn.cursor()
+    cursor.execute("insert into Chapter values (1, 'yes', 'ObjectType')")
+    cursor.execute("insert into Dictionary values (4, 1, 'yes', 'Server')")
+    cursor.execute("insert into Attribute values (3, 'string', 'FQDN')")
+    cursor.execute("insert into Attribute values (17, 'uint', 'RAM')")
+    cursor.execute("insert into PortOuterInterface values (24, '1000Base-T')")
+    cursor.executemany(
+        "insert into Object (id, name, objtype_id) values (%s, %s, 4)",
+        [(i, 'srv%06d' % i) for i in range(1, count + 1)]
+    )
+    cursor.executemany(
+        "insert into AttributeValue values (%s, 4, 3, %s, null, null)",
+        [(i, 'srv%06d.example.com' % i) for i in range(1, count + 1)]
+    )
+    cursor.executemany(
+        "insert into AttributeValue values (%s, 4, 17, null, %s, null)",
+        [(i, 4096) for i in range(1, count + 1)]
+    )
+    cursor.executemany(
+        "insert into Port (object_id, name, iif_id, type) values (%s, %s, 1, 24)",
+        [(i, 'eth%d' % n) for i in range(1, count + 1) for n in range(2)]
+    )
+    cursor.executemany(
+        "insert into IPv4Allocation values (%s, %s, 'eth0', 'regular')",
+        [(i, 167772160 + i) for i in range(1, count + 1)]
+    )
+    conn.commit()
+    conn.close()
+
+def reads(rt, names):
+    for name in names:
+        obj = rtapi.RTObject(rt, rt.GetObjectId(name))
+        obj.GetAttributes()
+        list(obj.Interfaces())
+        list(obj.IPv4Allocations())
+
+def measure(label, open_rt, names):
+    start = time.time()
+    rt = open_rt()
+    rt.GetObjectId(names[0])
+    cold = time.time() - start
+    start = time.time()
+    reads(rt, names)
+    elapsed = time.time() - start
+    print('%-10s cold start %8.2f ms %10.3f ms per object' % (
+        label,
+        cold * 1000,
+        elapsed * 1000 / len(names),
+    ))
+
+def main():
+    count = 20000
+    latency = 0.3
+    if len(sys.argv) > 1:
+        count = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        latency = float(sys.argv[2])
+
+    directory = tempfile.mkdtemp()
+    live_path = os.path.join(directory, 'live.db')
+    snapshot_path = os.path.join(directory, 'snapshot.db')
+    build(live_path, count)
+    SlowConnection.latency = latency / 1000.0
+
+    live = rtapi.Racktables(SlowConnection(live_path))
+    start = time.time()
+    live.Snapshot(snapshot_path, TABLES)
+    print('export     %8.2f s, %.1f MiB' % (
+        time.time() - start,
+        os.path.getsize(snapshot_path) / 1048576.0,
+    ))
+
+    names = ['srv%06d' % i for i in range(1, count + 1, max(count // 1000, 1))]
+    measure(
+        'live',
+        lambda: rtapi.Racktables(SlowConnection(live_path)),
+        names
+    )
+    measure(
+        'snapshot',
+        lambda: snapshot.open_snapshot(snapshot_path),
+        names
+    )
+
+    os.remove(live_path)
+    os.remove(snapshot_path)
+    os.rmdir(directory)
+
+if __name__ == '__main__':
+    main()
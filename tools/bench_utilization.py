@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# Time the IPv4 utilization report on synthetic data
+#
+# Generates nested networks and random allocations, so no database is
+# needed. Needs numpy.
+#
+#   python bench_utilization.py [networks] [allocations]
+
+from __future__ import print_function
+import sys
+import time
+import numpy
+from rtapi.report import compute_utilization
+
+def main():
+    network_count = 50000
+    allocation_count = 2000000
+    if len(sys.argv) > 1:
+        network_count = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        allocation_count = int(sys.argv[2])
+
+    # Every fifth network is a /22 holding the four /24 that follow it
+    base = 10 << 24
+    ids = numpy.arange(1, network_count + 1)
+    ips = numpy.empty(network_count, dtype=numpy.int64)
+    masks = numpy.empty(network_count, dtype=numpy.int64)
+    block = numpy.arange(network_count) // 5
+    slot = numpy.arange(network_count) % 5
+    ips[:] = base + block * 1024 + numpy.maximum(slot - 1, 0) * 256
+    masks[:] = numpy.where(slot == 0, 22, 24)
+
+    random = numpy.random.RandomState(1)
+    used_ips = base + random.randint(
+        0,
+        (network_count // 5 + 1) * 1024,
+        allocation_count
+    )
+
+    start = time.time()
+    report = compute_utilization(ids, ips, masks, used_ips)
+    elapsed = time.time() - start
+    print('%d networks, %d allocations: %.3f s' % (
+        len(report),
+        allocation_count,
+        elapsed
+    ))
+
+if __name__ == '__main__':
+    main()
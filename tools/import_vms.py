@@ -3,104 +3,317 @@
 # by Stefan Midjich <swehack@gmail.com>
 #
 # See README.md for details.
-# TODO: See if dialect='excel' can make use of the header in csv.reader() 
+#
+# Rows are read and validated as a stream and grouped in batches. For each
+# batch existing objects are resolved by name in one query, new objects,
+# interfaces and IP-addresses are written with bulk statements and the
+# whole batch is committed as one transaction. With --workers batches are
+# applied in parallel, each worker on its own database connection.
+#
+#   python import_vms.py [--batch-size 500] [--workers 4] [--dry-run]
+#
+# TODO: See if dialect='excel' can make use of the header in csv.reader()
 # See: (Sniffer.has_header())
 
 from __future__ import print_function
 from sys import stderr, exit
 from ConfigParser import ConfigParser
+from Queue import Queue
+import argparse
 import csv
 import datetime
+import threading
+import time
 import ipaddr
 import MySQLdb
 import rtapi
 
-config = ConfigParser()
-config.readfp(open('import_vms.cfg'))
-config.read(['import_vms.cfg.local'])
+class Stats(object):
+    '''Counters shared by the reader and the workers'''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start = time.time()
+        self.counters = dict.fromkeys((
+            'rows',
+            'skipped',
+            'batches',
+            'existing',
+            'objects',
+            'interfaces',
+            'ips',
+            'failed',
+        ), 0)
+
+    def add(self, **counts):
+        with self.lock:
+            for key, count in counts.items():
+                self.counters[key] += count
+
+    def report(self):
+        elapsed = max(time.time() - self.start, 0.001)
+        counters = self.counters
+        print('Read %d rows, skipped %d, in %d batches' % (
+            counters['rows'],
+            counters['skipped'],
+            counters['batches'],
+        ), file=stderr)
+        print('Added %d objects and %d IP-addresses, checked %d interfaces, %d objects already existed, %d batches failed' % (
+            counters['objects'],
+            counters['ips'],
+            counters['interfaces'],
+            counters['existing'],
+            counters['failed'],
+        ), file=stderr)
+        print('%.1f seconds, %.1f rows/s' % (
+            elapsed,
+            counters['rows'] / elapsed,
+        ), file=stderr)
 
-with open(config.get('DEFAULT', 'vm_file'), 'rb') as csvfile:
-    conn = MySQLdb.connect(
-        host = config.get('DEFAULT', 'db_host'), 
-        user = config.get('DEFAULT', 'db_user'), 
-        passwd = config.get('DEFAULT', 'db_pass'), 
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Import VMs from a vSphere CSV export into Racktables'
+    )
+    parser.add_argument(
+        '--config',
+        default='import_vms.cfg',
+        help='Configuration file, import_vms.cfg.local is read after it'
+    )
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=500,
+        help='VMs per batch, each batch is one transaction'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help='Number of batches applied in parallel, one connection each'
+    )
+    parser.add_argument(
+        '--dry-run',
+        action='store_true',
+        help='Print what would be done without writing anything'
+    )
+    return parser.parse_args()
+
+def connect(config):
+    return MySQLdb.connect(
+        host = config.get('DEFAULT', 'db_host'),
+        user = config.get('DEFAULT', 'db_user'),
+        passwd = config.get('DEFAULT', 'db_pass'),
         db = config.get('DEFAULT', 'db_name')
     )
-    rt = rtapi.Racktables(conn)
 
+def vm_object_type(rt):
+    '''Get the VM type ID'''
+    for (obj_id, obj_type) in rt.ObjectTypes():
+        if obj_type == 'VM':
+            return obj_id
+    print('Could not get VM object type ID', file=stderr)
+    exit(1)
+
+def read_vms(csvfile, stats):
+    '''Yield one dict per valid line of the CSV export. Names already seen
+    in the file are skipped so parallel batches never add the same
+    object twice.'''
     dialect = csv.Sniffer().sniff(csvfile.read(1024))
     csvfile.seek(0)
     lines = csv.DictReader(csvfile, dialect=dialect)
 
+    seen = set()
     for line in lines:
-        object_added = False
+        stats.add(rows=1)
         vm_name = line['Name']
-        vm_label = line['Name']
-        vm_interfaces = line['NIC'].split(',')
-        vm_ipaddresses = line['IP'].split(',')
-        vm_vlans = line['VLAN'].split(',')
-
-        # Get the VM type ID
-        for (obj_id, obj_type) in rt.ObjectTypes():
-            if obj_type == 'VM':
-                vm_objtype = obj_id
-                break
-        else:
-            print('Could not get VM object type ID', file=stderr)
-            exit(1)
-
-        rtobject = None
-        # Check if object already exists
-        rtobject = rt.ObjectExistName(vm_name)
-        if rtobject:
-            print('Object already exists, not adding: %s' % vm_name, file=stderr)
-            # This is temporary code to replace all names with new naming 
-            # standard.
-            new_name = '%s-%s' % (line['Folder'], line['Name'])
-            rtobject.UpdateName(new_name)
-        else:
-            try:
-                rtobject = rt.AddObject(vm_name, vm_objtype, None, vm_label)
-            except Exception as e:
-                print('Failed adding object %s: %s' % (
-                    vm_name, 
-                    str(e),
-                ), file=stderr)
-                exit(1)
-
-            print('Added object: %s' % vm_name)
-            object_id = rt.GetObjectId(vm_name)
-            rt.InsertLog(
-                object_id, 
-                'Object imported by script at %s' % datetime.datetime.now()
-            )
-
-        # Now proceed to update the object with network interfaces
-        for ifname in vm_interfaces:
-            port_id = None
-
-            # Add network interface name
-            if ifname:
-                port_id = rt.UpdateNetworkInterface(object_id, ifname)
-            if port_id:
-                print('Updated object %s with interface %s' % (vm_name, ifname))
-
-        for ipaddrs in vm_ipaddresses:
+        if not vm_name:
+            print('Skipping line without name: %s' % line, file=stderr)
+            stats.add(skipped=1)
+            continue
+        if vm_name in seen:
+            print('Skipping duplicate VM: %s' % vm_name, file=stderr)
+            stats.add(skipped=1)
+            continue
+        seen.add(vm_name)
+
+        vm_interfaces = [ifname for ifname in line['NIC'].split(',') if ifname]
+
+        vm_ipaddresses = []
+        for ipaddrs in line['IP'].split(','):
+            if not ipaddrs:
+                continue
             # See if ipaddrs is valid
             try:
                 _ip = ipaddr.IPv4Network('%s/24' % ipaddrs)
             except Exception as e:
                 print('Could not add IPv4 address %s to object %s: %s' % (
-                    ipaddrs, 
-                    vm_name, 
+                    ipaddrs,
+                    vm_name,
                     str(e),
                 ), file=stderr)
                 continue
+            vm_ipaddresses.append(ipaddrs)
+
+        if vm_ipaddresses and not vm_interfaces:
+            print('No interface for IP-addresses of object %s' % vm_name, file=stderr)
+            vm_ipaddresses = []
 
-            # Add IP-address
-            if rt.InterfaceAddIpv4IP(object_id, ifname, ipaddrs):
+        yield {
+            'name': vm_name,
+            'label': vm_name,
+            'interfaces': vm_interfaces,
+            # Addresses go on the last listed interface
+            'ipaddresses': vm_ipaddresses,
+        }
+
+def batches(vms, size):
+    batch = []
+    for vm in vms:
+        batch.append(vm)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def plan_batch(rt, batch, stats):
+    '''Print what apply_batch would do with batch'''
+    existing = rt.GetObjectIds(vm['name'] for vm in batch)
+    stats.add(batches=1, existing=len(existing))
+    for vm in batch:
+        if vm['name'] in existing:
+            print('Object already exists, not adding: %s' % vm['name'])
+        else:
+            print('Would add object: %s' % vm['name'])
+            stats.add(objects=1)
+        for ifname in vm['interfaces']:
+            print('Would ensure interface %s on object %s' % (
+                ifname,
+                vm['name'],
+            ))
+        for ipaddrs in vm['ipaddresses']:
+            print('Would ensure IP %s on device %s of object %s' % (
+                ipaddrs,
+                vm['interfaces'][-1],
+                vm['name'],
+            ))
+
+def apply_batch(rt, vm_objtype, batch, stats):
+    '''Add missing objects, interfaces and IP-addresses of batch in one
+    transaction'''
+    with rt.transaction():
+        with rt.BufferedLog():
+            object_ids = rt.GetObjectIds(vm['name'] for vm in batch)
+            existing = len(object_ids)
+            for vm in batch:
+                if vm['name'] in object_ids:
+                    print('Object already exists, not adding: %s' % vm['name'], file=stderr)
+
+            new_vms = [vm for vm in batch if vm['name'] not in object_ids]
+            if new_vms:
+                added = rt.AddObjects(
+                    (vm['name'], vm_objtype, None, vm['label'])
+                    for vm in new_vms
+                )
+                now = datetime.datetime.now()
+                for vm in new_vms:
+                    print('Added object: %s' % vm['name'])
+                    rt.InsertLog(
+                        added[vm['name']],
+                        'Object imported by script at %s' % now
+                    )
+                object_ids.update(added)
+
+            # Now proceed to update the objects with network interfaces
+            interfaces = [
+                (object_ids[vm['name']], ifname)
+                for vm in batch for ifname in vm['interfaces']
+            ]
+            ports = rt.UpdateNetworkInterfaces(interfaces) if interfaces else {}
+            for vm in batch:
+                for ifname in vm['interfaces']:
+                    if ports[object_ids[vm['name']]][ifname]:
+                        print('Updated object %s with interface %s' % (
+                            vm['name'],
+                            ifname,
+                        ))
+
+            allocations = [
+                (object_ids[vm['name']], vm['interfaces'][-1], ipaddrs)
+                for vm in batch for ipaddrs in vm['ipaddresses']
+            ]
+            added_ips = rt.InterfaceAddIpv4IPs(allocations) if allocations else []
+            names = dict((object_id, name) for name, object_id in object_ids.items())
+            for object_id, ifname, ipaddrs in added_ips:
                 print('Updated device %s on object %s with IP %s' % (
-                    ifname, 
-                    vm_name, 
+                    ifname,
+                    names[object_id],
                     ipaddrs,
                 ))
+
+    stats.add(
+        batches=1,
+        existing=existing,
+        objects=len(new_vms),
+        interfaces=len(interfaces),
+        ips=len(added_ips)
+    )
+
+def worker(config, vm_objtype, queue, stats):
+    rt = rtapi.Racktables(connect(config))
+    while True:
+        batch = queue.get()
+        if batch is None:
+            break
+        try:
+            apply_batch(rt, vm_objtype, batch, stats)
+        except Exception as e:
+            print('Failed importing batch starting with %s: %s' % (
+                batch[0]['name'],
+                str(e),
+            ), file=stderr)
+            stats.add(failed=1)
+    rt.db.close()
+
+def main():
+    args = parse_args()
+
+    config = ConfigParser()
+    config.readfp(open(args.config))
+    config.read(['%s.local' % args.config])
+
+    stats = Stats()
+    rt = rtapi.Racktables(connect(config))
+    vm_objtype = vm_object_type(rt)
+
+    with open(config.get('DEFAULT', 'vm_file'), 'rb') as csvfile:
+        vms = read_vms(csvfile, stats)
+        if args.dry_run:
+            for batch in batches(vms, args.batch_size):
+                plan_batch(rt, batch, stats)
+        else:
+            # Bounded so the reader never gets far ahead of the workers
+            queue = Queue(max(args.workers, 1) * 2)
+            threads = []
+            for i in range(max(args.workers, 1)):
+                thread = threading.Thread(
+                    target=worker,
+                    args=(config, vm_objtype, queue, stats)
+                )
+                thread.daemon = True
+                thread.start()
+                threads.append(thread)
+
+            for batch in batches(vms, args.batch_size):
+                queue.put(batch)
+            for thread in threads:
+                queue.put(None)
+            for thread in threads:
+                thread.join()
+
+    stats.report()
+    if stats.counters['failed']:
+        exit(1)
+
+if __name__ == '__main__':
+    main()
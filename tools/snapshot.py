@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+# Export a read only snapshot of a Racktables database to an SQLite file
+#
+# Read only consumers can then use rtapi.snapshot.open_snapshot(path)
+# instead of connecting to MySQL.
+#
+#   python snapshot.py --host localhost --user racktables --db racktables racktables.db
+
+from __future__ import print_function
+import argparse
+import time
+import MySQLdb
+import rtapi
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Export the tables read by rtapi to an SQLite file'
+    )
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--user', default='racktables')
+    parser.add_argument('--password', default='')
+    parser.add_argument('--db', default='racktables')
+    parser.add_argument('path', help='Snapshot file to write')
+    args = parser.parse_args()
+
+    conn = MySQLdb.connect(
+        host = args.host,
+        user = args.user,
+        passwd = args.password,
+        db = args.db
+    )
+    rt = rtapi.Racktables(conn)
+
+    start = time.time()
+    counts = rt.Snapshot(args.path)
+    for table in sorted(counts):
+        print('%-20s %10d rows' % (table, counts[table]))
+    print('Wrote %s in %.1f seconds' % (args.path, time.time() - start))
+
+if __name__ == '__main__':
+    main()